@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+ASGI entry point for the backend.
+
+/fetch-emails and /fetch-threads are served natively on the event loop with
+the async fetch pipeline, so a single process can hold hundreds of inbox
+loads open while they wait on Gmail. /events streams are served on the loop
+too, so open tabs hold no threads. Every other route is handed to the Flask
+app, which runs on its own pool of worker threads.
+
+    pip install -r requirements-async.txt
+    uvicorn asgi:app --port 5001
+"""
+
+import asyncio
+import io
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import jsonify, request, session
+from async_fetcher import (
+    AsyncGmailClient, close_loop_resources, fetch_emails_async, fetch_threads_page_async, run_blocking
+)
+from backend import (
+    app as flask_app, build_services, compact_email_data, compact_thread, get_credentials,
+    get_expanded_thread_ids, get_fetch_key, get_matching_etag, get_page_args, get_user_key,
+    is_truthy_arg, make_inbox_etag, with_etag
+)
+from mail_events import AsyncSubscription, get_event_hub
+from utils.gmail_watch import get_watch_manager
+from utils.single_flight import AsyncSingleFlight
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Routes served by the async pipeline instead of the Flask views
+ASYNC_ROUTES = {'/fetch-emails', '/fetch-threads'}
+
+# Coalesces identical inbox fetches running on the event loop
+single_flight = AsyncSingleFlight()
+
+# Threads running the Flask app for the remaining routes, apart from the
+# loop's default executor and the inbox path's pool
+WSGI_WORKERS = int(os.getenv('WSGI_WORKERS', '32'))
+_wsgi_executor = ThreadPoolExecutor(max_workers=WSGI_WORKERS, thread_name_prefix='wsgi')
+
+def build_environ(scope, body=b''):
+    """Translate an ASGI HTTP scope into a WSGI environ."""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+            continue
+        key = f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return body
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+async def send_response(send, response):
+    """Send a complete Flask response."""
+    await send({'type': 'http.response.start', 'status': response.status_code,
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                            for name, value in response.headers.items()]})
+    await send({'type': 'http.response.body', 'body': response.get_data()})
+
+def ensure_watch(creds, user_key):
+    """Keep the user's Gmail watch alive, like the synchronous fetches do."""
+    gmail_service, _ = build_services(creds)
+    get_watch_manager().ensure_watch(gmail_service, user_key)
+
+async def fetch_inbox():
+    """The /fetch-emails and /fetch-threads views, on the async pipeline."""
+    if not session.get('user'):
+        return flask_app.make_response((jsonify({'error': 'Unauthorized'}), 401))
+    try:
+        limit, page_token = get_page_args()
+    except ValueError as e:
+        return flask_app.make_response((jsonify({'error': str(e)}), 400))
+
+    try:
+        # A token refresh is a blocking HTTP call
+        creds = await run_blocking(get_credentials)
+        user_key = get_user_key()
+        client = AsyncGmailClient(creds, user_key=user_key)
+
+        # Pushed changes keep the live watch's historyId current, as in get_inbox_history_id()
+        history_id = await run_blocking(get_watch_manager().get_mailbox_history_id, user_key)
+        if not history_id:
+            profile = await client.get('profile')
+            history_id = profile.get('historyId')
+        etag = make_inbox_etag(history_id, limit, page_token)
+        matching_etag = get_matching_etag(etag)
+        if matching_etag:
+            return with_etag(flask_app.response_class(status=304), matching_etag)
+
+        metadata_only = is_truthy_arg('metadata_only')
+        # ?defer_photos=1 leaves sender photos to /sender-photos, as in the Flask views
+        enrich_photos = not is_truthy_arg('defer_photos')
+        # Identical fetches already running for the user (other tabs) are shared
+        fetch_key = get_fetch_key(history_id, limit, page_token)
+        if request.path == '/fetch-emails':
+            email_data = await single_flight.do(fetch_key, lambda: fetch_emails_async(
+                client, user_key, limit, page_token, metadata_only, enrich_photos))
+            if is_truthy_arg('compact'):
+                email_data = compact_email_data(email_data, get_expanded_thread_ids())
+            response = jsonify(email_data)
+        else:
+            threads, next_page_token = await single_flight.do(fetch_key, lambda: fetch_threads_page_async(
+                client, user_key, limit, page_token, metadata_only, enrich_photos))
+            if is_truthy_arg('compact'):
+                expanded_thread_ids = get_expanded_thread_ids()
+                threads = [compact_thread(thread, thread['threadId'] in expanded_thread_ids)
+                           for thread in threads]
+            response = jsonify(threads)
+            if next_page_token:
+                response.headers['X-Next-Page-Token'] = next_page_token
+
+        await run_blocking(ensure_watch, creds, user_key)
+        return with_etag(response, etag)
+    except Exception as e:
+        logger.error(f"Error fetching inbox: {str(e)}")
+        return flask_app.make_response((jsonify({'error': str(e)}), 500))
+
+async def handle_async_route(scope, receive, send):
+    body = await read_body(receive)
+    with flask_app.request_context(build_environ(scope, body)):
+        response = await fetch_inbox()
+        # Runs the after_request hooks (CORS, compression) and saves the session
+        response = flask_app.process_response(response)
+    await send_response(send, response)
+
+async def watch_disconnect(receive, on_disconnect):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+    on_disconnect()
+
+async def open_event_stream():
+    """The /events view: (AsyncSubscription, response headers) or an error response."""
+    if not session.get('user'):
+        return None, flask_app.make_response((jsonify({'error': 'Unauthorized'}), 401))
+    try:
+        creds = await run_blocking(get_credentials)
+    except Exception as e:
+        logger.error(f"Error opening event stream: {str(e)}")
+        return None, flask_app.make_response((jsonify({'error': str(e)}), 500))
+
+    user_key = get_user_key()
+    subscription = AsyncSubscription(user_key, asyncio.get_running_loop())
+    get_event_hub().subscribe(user_key, creds, session.get('last_history_id'), subscription)
+    return subscription, flask_app.response_class(mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+async def handle_events(scope, receive, send):
+    """
+    Serve /events on the event loop.
+
+    An open stream only waits on an asyncio queue, so it holds no thread
+    however long the client keeps it open.
+    """
+    body = await read_body(receive)
+    with flask_app.request_context(build_environ(scope, body)):
+        subscription, response = await open_event_stream()
+        response = flask_app.process_response(response)
+    if subscription is None:
+        await send_response(send, response)
+        return
+
+    # A disconnect closes the subscription, which ends the stream
+    watcher = asyncio.ensure_future(watch_disconnect(receive, subscription.close))
+    stream = get_event_hub().stream_async(subscription)
+    try:
+        await send({'type': 'http.response.start', 'status': response.status_code,
+                    'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                for name, value in response.headers.items()]})
+        async for chunk in stream:
+            await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        watcher.cancel()
+        await stream.aclose()
+
+async def handle_wsgi_route(scope, receive, send):
+    """Run the Flask app on the WSGI pool, streaming its response."""
+    body = await read_body(receive)
+    environ = build_environ(scope, body)
+    loop = asyncio.get_running_loop()
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                              for name, value in headers]
+
+    disconnected = asyncio.Event()
+    watcher = asyncio.ensure_future(watch_disconnect(receive, disconnected.set))
+    iterable = await loop.run_in_executor(_wsgi_executor, flask_app, environ, start_response)
+    try:
+        iterator = iter(iterable)
+        await send({'type': 'http.response.start', 'status': started['status'],
+                    'headers': started['headers']})
+        while not disconnected.is_set():
+            chunk = await loop.run_in_executor(_wsgi_executor, next, iterator, None)
+            if chunk is None:
+                break
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        watcher.cancel()
+        if hasattr(iterable, 'close'):
+            await loop.run_in_executor(_wsgi_executor, iterable.close)
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await close_loop_resources()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+    if scope['path'] in ASYNC_ROUTES and scope['method'] == 'GET':
+        await handle_async_route(scope, receive, send)
+    elif scope['path'] == '/events' and scope['method'] == 'GET':
+        await handle_events(scope, receive, send)
+    else:
+        await handle_wsgi_route(scope, receive, send)
+
+if __name__ == '__main__':
+    import uvicorn
+    os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
+    uvicorn.run('asgi:app', port=5001, host='0.0.0.0')
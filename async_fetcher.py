@@ -0,0 +1,271 @@
+import os
+import asyncio
+import logging
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from gmail_fetcher import (
+    DEFAULT_PAGE_SIZE, decode_page_cursor, encode_page_cursor, get_email_content,
+    get_request_params, get_sender_photos, get_stored_messages, get_stored_threads,
+    get_thread_content, save_threads, sort_threads_newest_first
+)
+from utils.message_store import get_message_store
+from utils.credential_manager import get_credential_manager
+from utils.api_scheduler import (
+    get_api_scheduler, get_error_reason, get_quota_key, get_quota_units, parse_retry_after
+)
+
+try:
+    import httpx
+except ImportError:  # the async pipeline needs httpx from requirements-async.txt
+    httpx = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+GMAIL_API_URL = 'https://gmail.googleapis.com/gmail/v1/users/me'
+
+# Gmail calls in flight at once across every request of the process
+GMAIL_ASYNC_CONCURRENCY = int(os.getenv('GMAIL_ASYNC_CONCURRENCY', '50'))
+# Seconds before a Gmail call times out
+GMAIL_ASYNC_TIMEOUT = float(os.getenv('GMAIL_ASYNC_TIMEOUT', '30'))
+# Threads for the blocking calls of async inbox loads (store reads and writes,
+# token refreshes), kept apart from the loop's default executor
+ASYNC_BLOCKING_WORKERS = int(os.getenv('ASYNC_BLOCKING_WORKERS', '16'))
+
+class GmailApiError(Exception):
+    """A Gmail REST call answered with an error status."""
+
+    def __init__(self, status, message):
+        super().__init__(f"Gmail API error {status}: {message}")
+        self.status = status
+
+def get_method_id(path):
+    """Name the Gmail method a REST path calls, e.g. threads/123 -> gmail.users.threads.get."""
+    resource, _, item_id = path.partition('/')
+    if resource == 'profile':
+        return 'gmail.users.getProfile'
+    return f"gmail.users.{resource}.{'get' if item_id else 'list'}"
+
+_blocking_executor = ThreadPoolExecutor(max_workers=ASYNC_BLOCKING_WORKERS,
+                                        thread_name_prefix='async-blocking')
+
+async def run_blocking(func, *args):
+    """Run a blocking call on the async pipeline's own pool, like asyncio.to_thread()."""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        _blocking_executor, functools.partial(context.run, func, *args))
+
+# One HTTP client and concurrency limit per event loop, shared by all requests
+_loop_resources = {}
+
+def get_loop_resources():
+    """Get the event loop's shared (HTTP client, semaphore), creating them on first use."""
+    loop = asyncio.get_running_loop()
+    resources = _loop_resources.get(loop)
+    if resources is None:
+        if httpx is None:
+            raise RuntimeError("The async fetch pipeline needs httpx: pip install httpx")
+        resources = (
+            httpx.AsyncClient(timeout=GMAIL_ASYNC_TIMEOUT,
+                              limits=httpx.Limits(max_connections=GMAIL_ASYNC_CONCURRENCY)),
+            asyncio.Semaphore(GMAIL_ASYNC_CONCURRENCY)
+        )
+        _loop_resources[loop] = resources
+    return resources
+
+async def close_loop_resources():
+    """Close the running loop's HTTP client, for ASGI shutdown."""
+    resources = _loop_resources.pop(asyncio.get_running_loop(), None)
+    if resources:
+        await resources[0].aclose()
+
+class AsyncGmailClient:
+    """
+    Gmail REST calls for one user over a shared async HTTP client.
+
+    Every call waits on the shared semaphore, so the number of Gmail calls in
+    flight stays bounded however many inbox loads run concurrently. A call
+    answered 401 is retried once after the credential manager refreshes the
+    user's token, like the 401 retry of the synchronous API client.
+    """
+
+    def __init__(self, creds, http_client=None, semaphore=None, user_key=None):
+        self.creds = creds
+        self.user_key = user_key or get_quota_key(creds)
+        if http_client is None or semaphore is None:
+            shared_client, shared_semaphore = get_loop_resources()
+            http_client = http_client or shared_client
+            semaphore = semaphore or shared_semaphore
+        self.http_client = http_client
+        self.semaphore = semaphore
+
+    async def get(self, path, params=None):
+        """GET a Gmail path, paced by the user's quota and retried on transient failures."""
+        scheduler = get_api_scheduler()
+        quota_key = get_quota_key(self.creds)
+        method_id = get_method_id(path)
+        attempt = 0
+        refreshed = False
+        while True:
+            delay = scheduler.reserve('gmail', quota_key, get_quota_units(method_id))
+            if delay > 0:
+                await asyncio.sleep(delay)
+            async with self.semaphore:
+                response = await self.http_client.get(
+                    f'{GMAIL_API_URL}/{path}', params=params or {},
+                    headers={'Authorization': f'Bearer {self.creds.token}'})
+            if response.status_code < 400:
+                return response.json()
+            if response.status_code == 401 and not refreshed and getattr(self.creds, 'refresh_token', None):
+                # The access token expired or was revoked since the request started
+                await run_blocking(functools.partial(
+                    get_credential_manager().ensure_fresh, self.user_key, self.creds,
+                    rejected_token=self.creds.token))
+                refreshed = True
+                continue
+            delay = scheduler.record_failure(
+                'gmail', quota_key, attempt, response.status_code, get_error_reason(response.text),
+                parse_retry_after(response.headers.get('retry-after')))
+            if delay is None:
+                raise GmailApiError(response.status_code, response.text)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def list_page(self, resource, items_key, max_results, page_token=None, query=None):
+        """List one page of threads or messages. Returns (items, next page token)."""
+        params = {'maxResults': max_results}
+        if page_token:
+            params['pageToken'] = page_token
+        if query:
+            params['q'] = query
+        results = await self.get(resource, params)
+        return results.get(items_key, []), results.get('nextPageToken')
+
+    async def get_many(self, resource, ids, params=None):
+        """Get every id concurrently; ids that fail are logged and skipped."""
+        async def get_one(item_id):
+            try:
+                return await self.get(f'{resource}/{item_id}', params)
+            except Exception as e:
+                logger.error(f"Error fetching {resource} {item_id}: {e}")
+                return None
+        results = await asyncio.gather(*(get_one(item_id) for item_id in ids))
+        return [result for result in results if result is not None]
+
+async def load_threads_async(client, thread_refs, user_key, metadata_only=False):
+    """Async counterpart of load_threads_from_store(), without sender photo enrichment."""
+    thread_ids = [thread['id'] for thread in thread_refs]
+    threads_by_id, stale_ids = await run_blocking(
+        get_stored_threads, thread_refs, user_key, metadata_only)
+
+    if stale_ids:
+        thread_details = await client.get_many(
+            'threads', stale_ids, get_request_params(metadata_only, thread=True))
+        fetched = [thread_content for thread_content in (
+            get_thread_content(thread_detail, None, enrich_photos=False, include_body=not metadata_only)
+            for thread_detail in thread_details) if thread_content]
+        await run_blocking(save_threads, user_key, fetched)
+        threads_by_id.update((thread_content['threadId'], thread_content) for thread_content in fetched)
+
+    return sort_threads_newest_first(
+        [threads_by_id[thread_id] for thread_id in thread_ids if thread_id in threads_by_id])
+
+async def load_messages_async(client, message_ids, user_key, metadata_only=False):
+    """Async counterpart of load_messages_from_store(), without sender photo enrichment."""
+    messages_by_id, missing_ids = await run_blocking(
+        get_stored_messages, message_ids, user_key, metadata_only)
+
+    if missing_ids:
+        messages = await client.get_many('messages', missing_ids, get_request_params(metadata_only))
+        fetched = [email_content for email_content in (
+            get_email_content(message, include_body=not metadata_only) for message in messages)
+            if email_content]
+        await run_blocking(get_message_store().put_messages, user_key, fetched)
+        messages_by_id.update((message['id'], message) for message in fetched)
+
+    return [messages_by_id[message_id] for message_id in message_ids if message_id in messages_by_id]
+
+async def add_sender_photos_async(threads, emails):
+    """
+    Set sender_photo on every message that has none, like fill_sender_photos().
+
+    Each sender is resolved once, through get_sender_photos() off the event loop.
+    """
+    messages = [message for thread in threads for message in thread['messages']] + list(emails)
+    missing = [message for message in messages
+               if 'sender_photo' not in message and message.get('sender_email')]
+    if missing:
+        photos = await run_blocking(get_sender_photos, [message['sender_email'] for message in missing])
+        for message in missing:
+            photo = photos.get(message['sender_email'].lower())
+            if photo:
+                message['sender_photo'] = photo
+    for thread in threads:
+        if not thread.get('latest_sender_photo'):
+            thread['latest_sender_photo'] = thread['messages'][0].get('sender_photo')
+
+async def fetch_emails_async(client, user_key, max_results=DEFAULT_PAGE_SIZE, page_token=None,
+                             metadata_only=False, enrich_photos=False):
+    """
+    Async counterpart of fetch_emails(), returning the same structure.
+
+    The thread and message lists are requested together, then every stale
+    thread and missing message is fetched concurrently. Sender photos are
+    resolved once the page is loaded when enrich_photos is set, and are
+    otherwise left for get_sender_photos(), like fetch_emails(enrich_photos=False).
+    """
+    thread_page_token, message_page_token = (
+        decode_page_cursor(page_token) if page_token else (None, None))
+
+    async def no_page():
+        return [], None
+
+    # Lists exhausted on an earlier page are skipped
+    (threads, next_thread_page_token), (messages, next_message_page_token) = await asyncio.gather(
+        client.list_page('threads', 'threads', max_results, thread_page_token)
+        if not page_token or thread_page_token else no_page(),
+        client.list_page('messages', 'messages', max_results, message_page_token)
+        if not page_token or message_page_token else no_page())
+    next_page_token = encode_page_cursor(next_thread_page_token, next_message_page_token)
+
+    # Messages listed in a thread are fetched with it, others on their own, at the same time
+    thread_ids = {thread['id'] for thread in threads}
+    thread_contents, individual_emails = await asyncio.gather(
+        load_threads_async(client, threads, user_key, metadata_only),
+        load_messages_async(client, [message['id'] for message in messages
+                                     if message.get('threadId') not in thread_ids],
+                            user_key, metadata_only))
+
+    thread_list = []
+    email_list = []
+    thread_message_ids = set()
+    for thread_content in thread_contents:
+        # Single-message threads are shown as individual emails
+        if thread_content['message_count'] == 1:
+            email_list.append(thread_content['messages'][0])
+        else:
+            thread_list.append(thread_content)
+        thread_message_ids.update(message['id'] for message in thread_content['messages'])
+    email_list.extend(email for email in individual_emails if email['id'] not in thread_message_ids)
+    if enrich_photos:
+        await add_sender_photos_async(thread_list, email_list)
+
+    logger.info(f'Loaded {len(thread_list)} threads and {len(email_list)} individual emails.')
+    return {
+        'threads': thread_list,
+        'individual_emails': email_list,
+        'total_count': len(thread_list) + len(email_list),
+        'next_page_token': next_page_token
+    }
+
+async def fetch_threads_page_async(client, user_key, max_results=DEFAULT_PAGE_SIZE, page_token=None,
+                                   metadata_only=False, enrich_photos=False):
+    """Async counterpart of fetch_threads_page(). Returns (threads, next page token or None)."""
+    thread_page_token = decode_page_cursor(page_token)[0] if page_token else None
+    threads, next_thread_page_token = await client.list_page(
+        'threads', 'threads', max_results, thread_page_token)
+    thread_list = await load_threads_async(client, threads, user_key, metadata_only)
+    if enrich_photos:
+        await add_sender_photos_async(thread_list, [])
+    return thread_list, encode_page_cursor(next_thread_page_token)
@@ -1,13 +1,24 @@
-from flask import Flask, jsonify, request, session, redirect, url_for
+from flask import Flask, jsonify, request, session, redirect, url_for, Response
 from flask_cors import CORS
-from gmail_fetcher import fetch_emails, fetch_threads, get_gmail_service, get_history_id, get_new_emails, get_new_thread_updates
+from gmail_fetcher import fetch_emails, fetch_threads_page, fetch_job_emails, decode_page_cursor, decode_query_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, get_gmail_service, get_credentials, build_services, get_user_key, get_history_id, get_sender_photos, MAX_SENDER_PHOTO_BATCH, get_message_body, compact_message, compact_thread, compact_email_data
+from gmail_sync import sync_mailbox
+from mail_events import get_event_hub
+from utils.thread_cache import get_thread_cache
+from utils.api_scheduler import get_api_scheduler
+from utils.single_flight import get_single_flight
+from utils.credential_manager import get_credential_manager, token_data_from_credentials
+from utils.gmail_watch import get_watch_manager, decode_push_envelope
+from utils.compression import COMPRESSION_MIN_SIZE, available_encodings, choose_encoding, compress
 from utils.email_filter import get_filter_configuration
+from utils.service_factory import service_factory
 import logging
 import os
+import hmac
+import json
+import hashlib
 from google_auth_oauthlib.flow import Flow
 import google.auth.transport.requests
 import requests as ext_requests
-import googleapiclient.discovery
 from flask_session import Session
 from flask_wtf import CSRFProtect
 from functools import wraps
@@ -37,7 +48,7 @@ CORS(app,
      resources={r"/*": {
          "origins": [os.getenv('FRONTEND_URL', 'http://localhost:5173')],
          "methods": ["GET", "POST", "OPTIONS"],
-         "allow_headers": ["Content-Type"]
+         "allow_headers": ["Content-Type", "If-None-Match"]
      }},
      supports_credentials=True)
 
@@ -46,9 +57,32 @@ def after_request(response):
     origin = request.headers.get('Origin')
     if origin == "http://localhost:5173":
         response.headers['Access-Control-Allow-Origin'] = origin
-    response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
+    response.headers['Access-Control-Allow-Headers'] = 'Content-Type, If-None-Match'
     response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
     response.headers['Access-Control-Allow-Credentials'] = 'true'
+    response.headers['Access-Control-Expose-Headers'] = 'X-Next-Page-Token, ETag'
+    return response
+
+@app.after_request
+def compress_response(response):
+    """Compress JSON responses with the best coding the client accepts (brotli or gzip)."""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < COMPRESSION_MIN_SIZE:
+        return response
+    encoding = choose_encoding(request.accept_encodings)
+    if not encoding:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # Each coding of a response is a different representation with its own strong validator
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{encoding}', weak)
     return response
 
 @app.route('/')
@@ -75,6 +109,7 @@ def login():
 
 @app.route('/logout', methods=['POST'])
 def logout():
+    get_credential_manager().forget(get_user_key())
     session.pop('user', None)
     return jsonify({'message': 'Logged out'})
 
@@ -85,6 +120,99 @@ def me():
         return jsonify({'user': user})
     return jsonify({'user': None}), 401
 
+def is_truthy_arg(name):
+    """Check if a query string flag such as ?defer_photos=1 is set."""
+    return request.args.get(name, '').lower() in ('1', 'true', 'yes')
+
+def get_page_args(decode_cursor=decode_page_cursor):
+    """
+    Read the ?limit= and ?pageToken= paging parameters.
+
+    Args:
+        decode_cursor: Function used to validate the page token
+
+    Returns:
+        Tuple of (limit, page_token)
+
+    Raises:
+        ValueError: If limit is not a number or the page token is malformed
+    """
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    page_token = request.args.get('pageToken') or None
+    if page_token:
+        decode_cursor(page_token)
+    return limit, page_token
+
+def get_inbox_history_id():
+    """
+    Read the mailbox historyId that versions inbox responses.
+
+    Inbox ETags and coalesced fetches are keyed by it. While the user has a
+    live Gmail watch, the historyId that push notifications and syncs keep
+    with the watch lease is used, so an unchanged inbox costs no Gmail call
+    at all; otherwise it is read with getProfile. The historyId is read before
+    the inbox is fetched, so a change made during the fetch gets a new
+    validator on the next request. Returns None when the historyId cannot be
+    read.
+    """
+    try:
+        history_id = get_watch_manager().get_mailbox_history_id(get_user_key())
+        if history_id:
+            return history_id
+        gmail_service, _ = get_gmail_service()
+        return get_history_id(gmail_service)
+    except Exception as e:
+        logger.error(f"Error reading history ID for ETag: {str(e)}")
+        return None
+
+def get_fetch_key(history_id, *page_params):
+    """
+    Key identical inbox fetches for coalescing.
+
+    Covers what changes the fetched data, but not ?compact= or ?expanded=,
+    which are applied to the shared result per request.
+    """
+    return (request.path, get_user_key(), history_id, *page_params,
+            is_truthy_arg('defer_photos'), is_truthy_arg('metadata_only'))
+
+def make_inbox_etag(history_id, *page_params):
+    """Hash the mailbox historyId with the request's user, path and parameters."""
+    if not history_id:
+        return None
+    validator = json.dumps([get_user_key(), history_id, request.path, *page_params,
+                            is_truthy_arg('defer_photos'), is_truthy_arg('metadata_only'),
+                            is_truthy_arg('compact'), sorted(get_expanded_thread_ids())])
+    return hashlib.sha1(validator.encode()).hexdigest()
+
+def get_matching_etag(etag):
+    """
+    Find the variant of etag named by the request's If-None-Match.
+
+    Compressed responses carry etag suffixed with their content coding, so
+    any coding of an unchanged response counts as a match.
+    """
+    if etag is None:
+        return None
+    for candidate in [etag] + [f'{etag}-{encoding}' for encoding in available_encodings()]:
+        if request.if_none_match.contains(candidate):
+            return candidate
+    return None
+
+def get_expanded_thread_ids():
+    """Read ?expanded=, the comma-separated ids of threads the client shows expanded."""
+    return {thread_id for thread_id in request.args.get('expanded', '').split(',') if thread_id}
+
+def with_etag(response, etag):
+    if etag:
+        response.set_etag(etag)
+        # Clients may keep the response but must revalidate it before reuse
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 @app.route('/fetch-emails')
 def get_emails():
     logger.debug("Received request to /fetch-emails")
@@ -92,9 +220,28 @@ def get_emails():
     if not user:
         return jsonify({'error': 'Unauthorized'}), 401
     try:
-        email_data = fetch_emails()
+        limit, page_token = get_page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        history_id = get_inbox_history_id()
+        etag = make_inbox_etag(history_id, limit, page_token)
+        matching_etag = get_matching_etag(etag)
+        if matching_etag:
+            return with_etag(app.response_class(status=304), matching_etag)
+
+        # ?defer_photos=1 skips sender photos; the client loads them from /sender-photos
+        # ?metadata_only=1 skips bodies; the client loads them from /message/<id>/body
+        # Identical fetches already running for the user (other tabs) are shared
+        email_data = get_single_flight().do(
+            get_fetch_key(history_id, limit, page_token),
+            lambda: fetch_emails(limit, not is_truthy_arg('defer_photos'), page_token,
+                                 metadata_only=is_truthy_arg('metadata_only')))
         logger.debug(f"Successfully fetched {email_data.get('total_count', 0)} total items")
-        return jsonify(email_data)
+        # ?compact=1 drops duplicated fields and keeps bodies only for ?expanded= threads
+        if is_truthy_arg('compact'):
+            email_data = compact_email_data(email_data, get_expanded_thread_ids())
+        return with_etag(jsonify(email_data), etag)
     except Exception as e:
         logger.error(f"Error fetching emails: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -106,13 +253,105 @@ def get_threads():
     if not user:
         return jsonify({'error': 'Unauthorized'}), 401
     try:
-        threads = fetch_threads()
+        limit, page_token = get_page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        history_id = get_inbox_history_id()
+        etag = make_inbox_etag(history_id, limit, page_token)
+        matching_etag = get_matching_etag(etag)
+        if matching_etag:
+            return with_etag(app.response_class(status=304), matching_etag)
+
+        threads, next_page_token = get_single_flight().do(
+            get_fetch_key(history_id, limit, page_token),
+            lambda: fetch_threads_page(limit, not is_truthy_arg('defer_photos'), page_token,
+                                       metadata_only=is_truthy_arg('metadata_only')))
         logger.debug(f"Successfully fetched {len(threads)} threads")
-        return jsonify(threads)
+        if is_truthy_arg('compact'):
+            expanded_thread_ids = get_expanded_thread_ids()
+            threads = [compact_thread(thread, thread['threadId'] in expanded_thread_ids) for thread in threads]
+        response = jsonify(threads)
+        # The body stays a plain list, so the next cursor travels in a header
+        if next_page_token:
+            response.headers['X-Next-Page-Token'] = next_page_token
+        return with_etag(response, etag)
     except Exception as e:
         logger.error(f"Error fetching threads: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/fetch-job-emails')
+def get_job_emails():
+    """Fetch job emails only, selected by Gmail search and confirmed by the job filter."""
+    logger.debug("Received request to /fetch-job-emails")
+    user = session.get('user')
+    if not user:
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        limit, page_token = get_page_args(decode_query_cursor)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        history_id = get_inbox_history_id()
+        etag = make_inbox_etag(history_id, limit, page_token)
+        matching_etag = get_matching_etag(etag)
+        if matching_etag:
+            return with_etag(app.response_class(status=304), matching_etag)
+
+        job_data = get_single_flight().do(
+            get_fetch_key(history_id, limit, page_token),
+            lambda: fetch_job_emails(limit, not is_truthy_arg('defer_photos'), page_token,
+                                     metadata_only=is_truthy_arg('metadata_only')))
+        logger.debug(f"Fetched {job_data['matched_count']} job emails "
+                     f"from {job_data['candidate_count']} candidates")
+        if is_truthy_arg('compact'):
+            job_data = dict(job_data, emails=[compact_message(email) for email in job_data['emails']])
+        return with_etag(jsonify(job_data), etag)
+    except ValueError as e:
+        # The cursor was made for a different filter configuration
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error fetching job emails: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/sender-photos', methods=['POST'])
+@csrf.exempt
+def sender_photos():
+    """Resolve sender photos in bulk for an inbox fetched with ?defer_photos=1."""
+    logger.debug("Received request to /sender-photos")
+    user = session.get('user')
+    if not user:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    data = request.get_json(silent=True) or {}
+    emails = data.get('emails')
+    if not isinstance(emails, list) or not all(isinstance(email, str) for email in emails):
+        return jsonify({'error': 'Expected a JSON body with an "emails" list'}), 400
+    if len(emails) > MAX_SENDER_PHOTO_BATCH:
+        return jsonify({'error': f'At most {MAX_SENDER_PHOTO_BATCH} emails per request'}), 400
+
+    try:
+        return jsonify({'photos': get_sender_photos(emails)})
+    except Exception as e:
+        logger.error(f"Error resolving sender photos: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/message/<message_id>/body')
+def message_body(message_id):
+    """Load the body of a message listed with ?metadata_only=1."""
+    logger.debug(f"Received request to /message/{message_id}/body")
+    user = session.get('user')
+    if not user:
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        content = get_message_body(message_id)
+        if content is None:
+            return jsonify({'error': 'Message not found'}), 404
+        return jsonify(content)
+    except Exception as e:
+        logger.error(f"Error loading message body: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/check-new-emails')
 def check_new_emails():
     """Check for new emails since last check."""
@@ -122,7 +361,8 @@ def check_new_emails():
         return jsonify({'error': 'Unauthorized'}), 401
     
     try:
-        gmail_service, _ = get_gmail_service()
+        creds = get_credentials()
+        gmail_service, _ = build_services(creds)
         
         # Get the last history ID from session or get current one
         last_history_id = session.get('last_history_id')
@@ -130,22 +370,102 @@ def check_new_emails():
             last_history_id = get_history_id(gmail_service)
             session['last_history_id'] = last_history_id
         
-        # Get new thread updates
-        updated_threads = get_new_thread_updates(gmail_service, last_history_id)
-        
-        # Update last history ID
-        if updated_threads:
-            current_history_id = get_history_id(gmail_service)
-            session['last_history_id'] = current_history_id
+        # Apply every change since the last check and advance the cursor from the history response
+        sync_result = sync_mailbox(gmail_service, creds, last_history_id, get_user_key())
+        session['last_history_id'] = sync_result['history_id']
         
         return jsonify({
-            'updated_threads': updated_threads,
-            'has_new': len(updated_threads) > 0
+            'updated_threads': sync_result['updated_threads'],
+            'deleted_thread_ids': sync_result['deleted_thread_ids'],
+            'full_resync': sync_result['full_resync'],
+            'has_new': bool(sync_result['updated_threads'] or sync_result['deleted_thread_ids'])
         })
     except Exception as e:
         logger.error(f"Error checking new emails: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/events')
+def mailbox_events():
+    """
+    Stream mailbox changes as Server-Sent Events.
+
+    Every connection of a user shares one server-side sync loop. 'delta'
+    events carry the updated threads and deleted thread ids, and 'resync'
+    events ask the client to reload its inbox.
+    """
+    logger.debug("Received request to /events")
+    user = session.get('user')
+    if not user:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    try:
+        creds = get_credentials()
+    except Exception as e:
+        logger.error(f"Error opening event stream: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+    hub = get_event_hub()
+    subscription = hub.subscribe(get_user_key(), creds, session.get('last_history_id'))
+    return Response(hub.stream(subscription), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # Stop proxies from buffering the stream
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/gmail/push', methods=['POST'])
+@csrf.exempt
+def gmail_push():
+    """
+    Receive Gmail change notifications from a Pub/Sub push subscription.
+
+    The notification is routed to the user whose watch lease matches its
+    emailAddress and wakes that user's sync loop, so open event streams get
+    the change right away. A user without open streams gets a one-off sync
+    into their message store instead, using the credentials the credential
+    manager keeps for them; once those have gone idle (or after a restart)
+    the change waits for the user's next inbox load. When GMAIL_PUSH_TOKEN is
+    set, the subscription's push endpoint must carry it as ?token=.
+    """
+    logger.debug("Received request to /gmail/push")
+    push_token = os.getenv('GMAIL_PUSH_TOKEN')
+    if push_token and not hmac.compare_digest(request.args.get('token', ''), push_token):
+        return jsonify({'error': 'Forbidden'}), 403
+
+    try:
+        notification = decode_push_envelope(request.get_json(silent=True))
+    except ValueError as e:
+        logger.warning(f"Rejected push notification: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        watch_manager = get_watch_manager()
+        user_key = watch_manager.find_user(notification['email_address'])
+        if not user_key:
+            # Acknowledge anyway so Pub/Sub does not redeliver it
+            logger.info(f"No watch lease for {notification['email_address']}, ignoring notification")
+            return jsonify({'user_found': False, 'synced': False})
+
+        # Inbox validators change right away, even before the change is synced
+        watch_manager.record_mailbox_history_id(user_key, notification['history_id'])
+        event_hub = get_event_hub()
+        if event_hub.notify(user_key):
+            return jsonify({'user_found': True, 'synced': True})
+
+        # Redelivered or out-of-order notifications are already covered by the stored cursor
+        lease = watch_manager.get_lease(user_key)
+        cursor = lease['history_id'] if lease else None
+        if cursor and int(notification['history_id']) <= int(cursor):
+            return jsonify({'user_found': True, 'synced': False})
+        creds = get_credential_manager().get_stored_credentials(user_key)
+        if creds is None:
+            logger.info(f"No stored credentials for {user_key}, leaving the change to their next inbox load")
+            return jsonify({'user_found': True, 'synced': False})
+        event_hub.sync_once(user_key, creds)
+        return jsonify({'user_found': True, 'synced': True})
+    except Exception as e:
+        logger.error(f"Error handling push notification: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/filter-config')
 def get_filter_config():
     """Get the current job email filter configuration."""
@@ -161,6 +481,20 @@ def get_filter_config():
         logger.error(f"Error getting filter config: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/debug/cache-stats')
+def cache_stats():
+    """Hit rate and memory use of the in-memory thread cache."""
+    if not session.get('user'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify(get_thread_cache().get_stats())
+
+@app.route('/debug/api-stats')
+def api_stats():
+    """Quota use, throttling and retries of Gmail and People API calls."""
+    if not session.get('user'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify(get_api_scheduler().get_stats())
+
 @app.route('/debug/clear-oauth-state')
 def clear_oauth_state():
     """Debug endpoint to clear OAuth state."""
@@ -244,14 +578,7 @@ def login_google_callback():
         
         flow.fetch_token(authorization_response=request.url)
         credentials = flow.credentials
-        session['google_token'] = {
-            'token': credentials.token,
-            'refresh_token': credentials.refresh_token,
-            'token_uri': credentials.token_uri,
-            'client_id': credentials.client_id,
-            'client_secret': credentials.client_secret,
-            'scopes': credentials.scopes
-        }
+        session['google_token'] = token_data_from_credentials(credentials)
         # Get user info
         userinfo_response = ext_requests.get(
             'https://www.googleapis.com/oauth2/v2/userinfo',
@@ -259,7 +586,7 @@ def login_google_callback():
         )
         userinfo = userinfo_response.json()
         # Fetch Google profile photo using People API
-        people_service = googleapiclient.discovery.build('people', 'v1', credentials=credentials)
+        people_service = service_factory.build('people', 'v1', credentials)
         profile = people_service.people().get(
             resourceName='people/me',
             personFields='photos'
@@ -290,4 +617,5 @@ if __name__ == '__main__':
     logger.info("Starting Flask server...")
     os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
     debug = os.getenv('FLASK_ENV', 'production') == 'development'
-    app.run(debug=debug, port=5001, host='0.0.0.0') 
\ No newline at end of file
+    # Event streams hold a worker thread each
+    app.run(debug=debug, port=5001, host='0.0.0.0', threaded=True) 
\ No newline at end of file
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Report /fetch-emails payload sizes on a synthetic 50-thread inbox.
+
+Builds the threads with get_thread_content() from Gmail-shaped messages with
+HTML bodies, then compares the JSON the endpoint serves in full and compact
+mode, uncompressed and with each content coding the server supports.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+from base64 import urlsafe_b64encode
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gmail_fetcher import compact_email_data, get_thread_content
+from utils.compression import available_encodings, compress
+
+PARAGRAPHS = [
+    'Thanks for applying to the Senior Engineer role. Our team will review your application.',
+    'We would like to schedule a 45 minute interview with the hiring manager next week.',
+    'Please find the job description and our benefits overview attached to this email.',
+    'Let me know which of the following times work for you, and we will send an invite.',
+]
+
+def make_message(rng, thread_id, index, timestamp):
+    sender = f'recruiter{rng.randint(1, 20)}@company{rng.randint(1, 10)}.com'
+    # Tracking links make each body unique, as they are in real mail
+    paragraphs = [f'{rng.choice(PARAGRAPHS)} https://t.example.com/c/{rng.getrandbits(128):032x}'
+                  for _ in range(rng.randint(8, 30))]
+    html = ''.join(f'<p style="font-family:Arial;color:#333">{paragraph}</p>' for paragraph in paragraphs)
+    text = ' '.join(paragraphs)
+    return {
+        'id': f'{thread_id}-m{index}',
+        'threadId': thread_id,
+        'labelIds': ['INBOX', 'UNREAD'],
+        'snippet': PARAGRAPHS[0][:100],
+        'historyId': str(1000 + index),
+        'internalDate': str(timestamp),
+        'sizeEstimate': len(html) + len(text),
+        'payload': {
+            'mimeType': 'multipart/alternative',
+            'headers': [
+                {'name': 'From', 'value': f'Recruiter <{sender}>'},
+                {'name': 'To', 'value': 'me@example.com'},
+                {'name': 'Cc', 'value': 'hiring-team@example.com'},
+                {'name': 'Subject', 'value': 'Re: Your application'},
+                {'name': 'Date', 'value': 'Tue, 14 Nov 2023 22:13:20 +0000'},
+                {'name': 'Message-ID', 'value': f'<{thread_id}.{index}@mail.example.com>'},
+                {'name': 'Received', 'value': 'from mail.example.com by mx.google.com with ESMTPS'},
+                {'name': 'DKIM-Signature', 'value': 'v=1; a=rsa-sha256; d=example.com; ' + 'b' * 300},
+                {'name': 'List-Unsubscribe', 'value': f'<https://example.com/unsubscribe/{thread_id}>'}
+            ],
+            'parts': [
+                {'mimeType': 'text/plain', 'body': {'data': urlsafe_b64encode(text.encode()).decode()}},
+                {'mimeType': 'text/html', 'body': {'data': urlsafe_b64encode(html.encode()).decode()}}
+            ]
+        }
+    }
+
+def make_inbox(thread_count, seed):
+    rng = random.Random(seed)
+    threads = []
+    for thread_index in range(thread_count):
+        thread_id = f't{thread_index}'
+        messages = [make_message(rng, thread_id, index, 1700000000000 + thread_index * 1000 + index)
+                    for index in range(rng.randint(2, 6))]
+        thread = {'id': thread_id, 'historyId': '1', 'messages': messages}
+        threads.append(get_thread_content(thread, None, enrich_photos=False))
+    return {'threads': threads, 'individual_emails': [], 'total_count': len(threads),
+            'next_page_token': None}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    inbox = make_inbox(args.threads, args.seed)
+    message_count = sum(len(thread['messages']) for thread in inbox['threads'])
+    variants = {
+        'full': inbox,
+        'compact': compact_email_data(inbox),
+        'compact, 5 expanded': compact_email_data(
+            inbox, [thread['threadId'] for thread in inbox['threads'][:5]])
+    }
+
+    print(f"📦 {args.threads} threads, {message_count} messages")
+    baseline = None
+    for label, data in variants.items():
+        payload = json.dumps(data).encode()
+        baseline = baseline or len(payload)
+        sizes = [('identity', len(payload))] + [
+            (encoding, len(compress(payload, encoding))) for encoding in available_encodings()]
+        for encoding, size in sizes:
+            print(f"{label:<20} {encoding:<9} {size / 1024:9.1f} KiB  {size / baseline:7.1%} of full")
+
+if __name__ == '__main__':
+    main()
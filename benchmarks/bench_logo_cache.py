@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Benchmark cold and warm company logo lookups through the persistent logo cache.
+
+By default Clearbit is simulated with a fixed delay so the numbers are
+repeatable offline. Pass --live to hit the real Logo API instead.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gmail_fetcher
+from utils import logo_cache
+
+DOMAINS = [
+    'google.com', 'linkedin.com', 'indeed.com', 'greenhouse.io', 'lever.co',
+    'stripe.com', 'github.com', 'no-logo-example.invalid', 'slack.com', 'dropbox.com'
+]
+
+def simulated_fetch(delay):
+    def fetch(domain):
+        time.sleep(delay)
+        return None if domain.endswith('.invalid') else f'https://logo.clearbit.com/{domain}'
+    return fetch
+
+def time_lookups(senders):
+    timings = []
+    for sender in senders:
+        started = time.perf_counter()
+        gmail_fetcher.get_company_logo(sender)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+def report(label, timings):
+    print(f"{label:<6} total {sum(timings):8.1f} ms | "
+          f"mean {statistics.mean(timings):7.2f} ms | max {max(timings):7.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--live', action='store_true', help='call the real Clearbit Logo API')
+    parser.add_argument('--delay', type=float, default=0.15, help='simulated lookup latency in seconds')
+    parser.add_argument('--messages', type=int, default=100, help='messages per pass')
+    args = parser.parse_args()
+
+    if not args.live:
+        gmail_fetcher.fetch_company_logo = simulated_fetch(args.delay)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        logo_cache._logo_cache = logo_cache.LogoCache(os.path.join(tmp, 'logos.db'))
+        senders = [f'sender{i}@{DOMAINS[i % len(DOMAINS)]}' for i in range(args.messages)]
+
+        print(f"🖼️  Logo lookups for {args.messages} messages across {len(DOMAINS)} domains")
+        report('cold', time_lookups(senders))
+        report('warm', time_lookups(senders))
+
+        # A fresh instance over the same file shows the cache survives restarts
+        logo_cache._logo_cache = logo_cache.LogoCache(os.path.join(tmp, 'logos.db'))
+        report('reload', time_lookups(senders))
+
+if __name__ == '__main__':
+    main()
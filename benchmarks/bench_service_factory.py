@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark the per-request cost of constructing Gmail and People services.
+
+Compares the old path (googleapiclient.discovery.build() for both APIs on
+every request) with the service factory across requests: a user's first
+request, which builds services from the parsed discovery documents, and a
+later request from the same user, which runs on a new thread and reuses the
+services built for those credentials.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+
+from utils.service_factory import ServiceFactory
+
+def make_credentials():
+    return Credentials(
+        token='access-token',
+        refresh_token='refresh-token',
+        token_uri='https://oauth2.googleapis.com/token',
+        client_id='client-id',
+        client_secret='client-secret'
+    )
+
+def discovery_build(factory):
+    creds = make_credentials()
+    return build('gmail', 'v1', credentials=creds), build('people', 'v1', credentials=creds)
+
+def in_new_thread(func):
+    # Every request runs on a thread of its own
+    result = []
+    worker = threading.Thread(target=lambda: result.append(func()))
+    worker.start()
+    worker.join()
+    return result[0]
+
+def factory_first_request(factory):
+    # A new login brings a new credentials object
+    return in_new_thread(lambda: factory.get_services(make_credentials()))
+
+def factory_later_request(factory):
+    return in_new_thread(lambda: factory.get_services(SHARED_CREDENTIALS))
+
+SHARED_CREDENTIALS = make_credentials()
+
+def measure(func, factory, iterations):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func(factory)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    factory = ServiceFactory()
+    # Parse the discovery documents and build the shared user's services once
+    factory.get_services(SHARED_CREDENTIALS)
+
+    print(f"⚙️  Service construction per request ({args.iterations} iterations)")
+    for label, func in [('discovery.build() x2', discovery_build),
+                        ('factory, first request', factory_first_request),
+                        ('factory, later request', factory_later_request)]:
+        timings = measure(func, factory, args.iterations)
+        print(f"{label:<24} median {statistics.median(timings):8.3f} ms | "
+              f"p95 {sorted(timings)[int(len(timings) * 0.95) - 1]:8.3f} ms")
+
+if __name__ == '__main__':
+    main()
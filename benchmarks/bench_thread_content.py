@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Benchmark get_thread_content() on synthetic threads with 100+ messages.
+
+Compares the previous assembly (latest message parsed twice, a photo lookup
+for every message, participants collected in a second pass) with the current
+single pass that looks up each sender once. Photo lookups go through an
+in-memory contacts index and a pre-seeded logo cache, so no network is used.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from base64 import urlsafe_b64encode
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gmail_fetcher
+from gmail_fetcher import (
+    add_sender_photo, extract_email_address, get_email_content, get_message_participants,
+    get_thread_content
+)
+from utils import logo_cache
+from utils.logo_cache import LogoCache
+
+class StaticContacts:
+    """Contacts index stand-in that knows a fixed set of photos."""
+
+    def __init__(self, photos):
+        self.photos = photos
+
+    def ensure_fresh(self, service):
+        return self
+
+    def get_photo(self, email):
+        return self.photos.get(email.lower())
+
+def make_thread(message_count, sender_count):
+    body = urlsafe_b64encode(('<p>Thanks for applying. ' * 40 + '</p>').encode()).decode()
+    messages = []
+    for index in range(message_count):
+        sender = f'sender{index % sender_count}@company{index % sender_count}.com'
+        messages.append({
+            'id': f'm{index}',
+            'threadId': 't1',
+            'labelIds': ['INBOX'],
+            'snippet': 'Thanks for applying',
+            'internalDate': str(1700000000000 + index),
+            'payload': {
+                'mimeType': 'multipart/alternative',
+                'headers': [
+                    {'name': 'From', 'value': f'Sender {index % sender_count} <{sender}>'},
+                    {'name': 'To', 'value': 'me@example.com'},
+                    {'name': 'Cc', 'value': f'team{index % 4}@example.com'},
+                    {'name': 'Subject', 'value': 'Re: Your application'},
+                    {'name': 'Date', 'value': 'Tue, 14 Nov 2023 22:13:20 +0000'}
+                ],
+                'parts': [
+                    {'mimeType': 'text/plain', 'body': {'data': body}},
+                    {'mimeType': 'text/html', 'body': {'data': body}}
+                ]
+            }
+        })
+    return {'id': 't1', 'historyId': '1', 'messages': messages}
+
+def previous_thread_participants(messages):
+    # The separate participants pass the single-pass assembly replaced
+    participants = {}
+    for message in messages:
+        participants.update(dict.fromkeys(get_message_participants(message)))
+    if not participants:
+        for message in messages:
+            email = extract_email_address(message['sender'])
+            if email:
+                participants[email] = None
+    return list(participants)
+
+def previous_thread_content(thread_detail, people_service, contacts):
+    messages = thread_detail['messages']
+    messages.sort(key=lambda x: int(x.get('internalDate', 0)), reverse=True)
+    latest_email_content = get_email_content(messages[0])
+    thread_messages = []
+    for message in messages:
+        email_content = get_email_content(message)
+        add_sender_photo(email_content, people_service, contacts)
+        thread_messages.append(email_content)
+    return {
+        'subject': latest_email_content['subject'],
+        'participants': previous_thread_participants(thread_messages),
+        'messages': thread_messages
+    }
+
+def current_thread_content(thread_detail, people_service, contacts):
+    return get_thread_content(thread_detail, people_service, contacts)
+
+def count_lookups(func, thread_detail, people_service, contacts):
+    calls = []
+    original = gmail_fetcher.get_profile_photo
+
+    def counting_get_profile_photo(*args, **kwargs):
+        calls.append(args[1])
+        return original(*args, **kwargs)
+
+    gmail_fetcher.get_profile_photo = counting_get_profile_photo
+    try:
+        func(thread_detail, people_service, contacts)
+    finally:
+        gmail_fetcher.get_profile_photo = original
+    return len(calls)
+
+def measure(func, thread_detail, people_service, contacts, iterations):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func(thread_detail, people_service, contacts)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 250, 500])
+    parser.add_argument('--senders', type=int, default=3)
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    # Half the senders are contacts, the rest resolve to a cached company logo
+    cache = LogoCache(':memory:')
+    for index in range(args.senders):
+        cache.set(f'company{index}.com', f'https://logo.clearbit.com/company{index}.com')
+    logo_cache._logo_cache = cache
+    contacts = StaticContacts({f'sender{index}@company{index}.com': f'https://photos.example/{index}'
+                               for index in range(0, args.senders, 2)})
+    people_service = object()
+
+    print(f"🧵 get_thread_content() per thread ({args.senders} senders, {args.iterations} iterations)")
+    for size in args.sizes:
+        for label, func in [('previous', previous_thread_content),
+                            ('single pass', current_thread_content)]:
+            thread_detail = make_thread(size, args.senders)
+            lookups = count_lookups(func, thread_detail, people_service, contacts)
+            timings = measure(func, thread_detail, people_service, contacts, args.iterations)
+            print(f"{size:>4} messages | {label:<12} median {statistics.median(timings):8.3f} ms | "
+                  f"p95 {sorted(timings)[int(len(timings) * 0.95) - 1]:8.3f} ms | "
+                  f"{lookups:>4} photo lookups")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Classify a historical mailbox with the job email filter.
+
+Splits a JSONL or mbox file into byte ranges that workers in a process pool
+read, parse and classify, and appends one JSON result per email to the
+output file. Progress is checkpointed after every chunk written, so an
+interrupted run resumes where it stopped. Prints throughput and per-rule hit
+counts at the end.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.email_filter import JobEmailFilter
+from utils.mail_sources import detect_format, iter_emails, iter_regions
+
+logger = logging.getLogger(__name__)
+
+# Bytes of the source read by a worker at a time
+DEFAULT_CHUNK_BYTES = 4 * 1024 * 1024
+
+_worker_filter = None
+
+def init_worker():
+    """Build one filter per worker process, without per-match logging or result caching."""
+    global _worker_filter
+    logging.getLogger('utils.email_filter').setLevel(logging.WARNING)
+    _worker_filter = JobEmailFilter()
+    _worker_filter.settings = dict(_worker_filter.settings, cache_results=False)
+
+def classify_chunk(source, source_format, start, end):
+    """
+    Read, parse and classify the emails in a byte range of the source.
+
+    Returns (start, end, result records). The records have no index yet,
+    since the number of emails before the range is only known in order.
+    """
+    if _worker_filter is None:
+        init_worker()
+    results = []
+    for email in iter_emails(source, source_format, start, end):
+        is_job_related, matched_rules = _worker_filter.filter_email(email)
+        results.append({
+            'id': email.get('id'),
+            'subject': email.get('subject'),
+            'sender_email': email.get('sender_email'),
+            'is_job_related': is_job_related,
+            'confidence': max((rule['confidence'] for rule in matched_rules), default=0),
+            'matched_rules': [rule['description'] for rule in matched_rules]
+        })
+    return start, end, results
+
+def new_checkpoint():
+    return {'processed': 0, 'source_offset': 0, 'output_offset': 0, 'matched': 0, 'rule_hits': {}}
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return new_checkpoint()
+    with open(path) as f:
+        return json.load(f)
+
+def save_checkpoint(path, checkpoint):
+    # Write then rename, so a crash never leaves a half-written checkpoint
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(temp_path, path)
+
+def classify_mailbox(source, output, checkpoint_path=None, source_format=None,
+                     workers=None, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    Classify every email in source and append the results to output.
+
+    Args:
+        source: JSONL or mbox file to read
+        output: JSONL file results are appended to
+        checkpoint_path: Progress file (defaults to output + '.checkpoint')
+        source_format: 'jsonl' or 'mbox' (guessed from the extension by default)
+        workers: Worker processes (defaults to the CPU count)
+        chunk_bytes: Bytes of the source read per worker task
+
+    Returns:
+        Dictionary with counts for this run, totals across resumed runs and throughput
+    """
+    checkpoint_path = checkpoint_path or f'{output}.checkpoint'
+    source_format = source_format or detect_format(source)
+    workers = workers or os.cpu_count() or 1
+    checkpoint = load_checkpoint(checkpoint_path)
+    output_size = os.path.getsize(output) if os.path.exists(output) else 0
+    if output_size < checkpoint['output_offset']:
+        # Truncating would zero-fill the missing results, so start over instead
+        logger.warning(f"{output} is shorter than its checkpoint says, classifying from the start")
+        checkpoint = new_checkpoint()
+    elif 'source_offset' not in checkpoint:
+        logger.warning(f"{checkpoint_path} does not record a source offset, classifying from the start")
+        checkpoint = new_checkpoint()
+    rule_hits = Counter(checkpoint['rule_hits'])
+    resumed_from = checkpoint['processed']
+
+    started = time.perf_counter()
+    processed_this_run = 0
+    with open(output, 'a+b') as out:
+        # Drop anything written after the last checkpoint
+        out.truncate(checkpoint['output_offset'])
+        out.seek(0, os.SEEK_END)
+
+        # Earlier runs already wrote everything before the source offset
+        chunks = iter_regions(source, source_format, chunk_bytes, checkpoint['source_offset'])
+        pending = {}
+        in_flight = set()
+        next_index = resumed_from
+        next_offset = checkpoint['source_offset']
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+            while True:
+                # Finished chunks wait in pending for any slower earlier one, so they
+                # count against the same bound as the chunks in flight
+                while len(in_flight) + len(pending) < workers * 2:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    in_flight.add(executor.submit(classify_chunk, source, source_format, *chunk))
+                if not in_flight:
+                    break
+
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    start, end, results = future.result()
+                    pending[start] = end, results
+
+                # Results are written in source order so the checkpoint is a single offset
+                while next_offset in pending:
+                    next_offset, results = pending.pop(next_offset)
+                    for offset, result in enumerate(results):
+                        result = {'index': next_index + offset, **result}
+                        out.write((json.dumps(result) + '\n').encode())
+                        if result['is_job_related']:
+                            checkpoint['matched'] += 1
+                        rule_hits.update(result['matched_rules'])
+                    out.flush()
+                    os.fsync(out.fileno())
+                    next_index += len(results)
+                    processed_this_run += len(results)
+                    checkpoint.update(processed=next_index, source_offset=next_offset,
+                                      output_offset=out.tell(), rule_hits=dict(rule_hits))
+                    save_checkpoint(checkpoint_path, checkpoint)
+
+    elapsed = time.perf_counter() - started
+    return {
+        'processed': processed_this_run,
+        'resumed_from': resumed_from,
+        'total_processed': checkpoint['processed'],
+        'total_matched': checkpoint['matched'],
+        'rule_hits': dict(rule_hits.most_common()),
+        'elapsed': elapsed,
+        'emails_per_second': processed_this_run / elapsed if elapsed > 0 else 0.0
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('source', help='JSONL or mbox file to classify')
+    parser.add_argument('--output', default='classification_results.jsonl')
+    parser.add_argument('--checkpoint', help='Progress file (defaults to OUTPUT.checkpoint)')
+    parser.add_argument('--format', choices=['jsonl', 'mbox'], help='Source format (guessed by default)')
+    parser.add_argument('--workers', type=int, help='Worker processes (defaults to the CPU count)')
+    parser.add_argument('--chunk-bytes', type=int, default=DEFAULT_CHUNK_BYTES,
+                        help='Bytes of the source read per worker task')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    summary = classify_mailbox(args.source, args.output, args.checkpoint, args.format,
+                               args.workers, args.chunk_bytes)
+
+    if summary['resumed_from']:
+        print(f"↩️  Resumed after {summary['resumed_from']} emails")
+    print(f"📧 Classified {summary['processed']} emails in {summary['elapsed']:.2f} s "
+          f"({summary['emails_per_second']:,.0f} emails/s)")
+    print(f"✅ {summary['total_matched']}/{summary['total_processed']} emails are job-related")
+    print("📊 Rule hits:")
+    for description, hits in summary['rule_hits'].items():
+        print(f"   {hits:>8}  {description}")
+
+if __name__ == '__main__':
+    main()
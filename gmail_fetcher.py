@@ -1,13 +1,24 @@
 import os
 import logging
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from base64 import urlsafe_b64decode
-from flask import session
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from flask import session, has_request_context
 import re
+import json
 import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from googleapiclient.errors import HttpError
+from utils.contacts_index import get_contacts_index
+from utils.logo_cache import get_logo_cache
+from utils.service_factory import service_factory
+from utils.credential_manager import get_credential_manager, token_data_from_credentials
+from utils.api_scheduler import execute_batch, retry_failed_calls
+from utils.message_store import get_message_store
+from utils.thread_cache import get_thread_cache
+from utils.gmail_watch import get_watch_manager
+from utils.gmail_pre_filter import GmailPreFilter
+from utils.email_filter import filter_job_emails
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -16,15 +27,50 @@ logger = logging.getLogger(__name__)
 # If modifying these scopes, delete the file token.pickle.
 SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
 
+# Number of API calls sent per Gmail batch request. Gmail accepts up to 100
+# calls per batch but recommends 50 to avoid rate limiting. A value of 1 or
+# less disables batching and issues one HTTP request per call.
+GMAIL_BATCH_SIZE = int(os.getenv('GMAIL_BATCH_SIZE', '50'))
+
+# Number of worker threads used to fetch and parse threads concurrently. A
+# value of 1 or less hydrates threads on the request thread using batching.
+GMAIL_HYDRATION_WORKERS = int(os.getenv('GMAIL_HYDRATION_WORKERS', '8'))
+
+# Number of worker threads used to resolve sender photos in bulk, and the
+# maximum number of senders accepted per bulk request
+SENDER_PHOTO_WORKERS = int(os.getenv('SENDER_PHOTO_WORKERS', '8'))
+MAX_SENDER_PHOTO_BATCH = 200
+
+# Headers and response fields requested for the metadata-only list view
+METADATA_HEADERS = ['From', 'To', 'Cc', 'Bcc', 'Subject', 'Date']
+MESSAGE_FIELDS = 'id,threadId,labelIds,snippet,historyId,internalDate,sizeEstimate,payload/headers'
+
+# Parsed message fields left out of compact responses
+COMPACT_DROPPED_FIELDS = ('headers', 'historyId', 'sizeEstimate')
+# Longest body kept for messages of expanded threads in compact responses
+COMPACT_BODY_MAX_CHARS = int(os.getenv('COMPACT_BODY_MAX_CHARS', '2000'))
+
+# Default and maximum number of threads/messages listed per inbox page
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100
+
+def fetch_company_logo(domain):
+    """Ask Clearbit's Logo API whether a domain has a logo."""
+    response = requests.get(f'https://logo.clearbit.com/{domain}', timeout=2)
+    if response.status_code == 200:
+        return f'https://logo.clearbit.com/{domain}'
+    return None
+
 def get_company_logo(email_domain):
-    """Get company logo URL using Clearbit's Logo API for a given email domain."""
+    """Get company logo URL using Clearbit's Logo API for a given email domain.
+
+    Results, including misses and failures, are remembered in the shared logo
+    cache so each domain is looked up at most once per TTL.
+    """
     try:
         # Extract domain from email
-        domain = email_domain.split('@')[-1]
-        # Use Clearbit's Logo API
-        response = requests.get(f'https://logo.clearbit.com/{domain}', timeout=2)
-        if response.status_code == 200:
-            return f'https://logo.clearbit.com/{domain}'
+        domain = email_domain.split('@')[-1].lower()
+        return get_logo_cache().get_or_fetch(domain, fetch_company_logo)
     except Exception as e:
         logger.error(f"Error getting company logo: {e}")
     return None
@@ -34,56 +80,112 @@ def extract_email_address(email_string):
     match = re.search(r'[\w\.-]+@[\w\.-]+', email_string)
     return match.group(0) if match else None
 
-def get_profile_photo(service, email_address):
-    """Get profile photo URL for a given email address using People API."""
+def get_profile_photo(service, email_address, contacts=None):
+    """Get profile photo URL for a given email address from the user's contacts index.
+
+    The index is loaded through the People API on first use and re-synced
+    once its TTL expires, so most lookups are a dictionary hit.
+    """
     try:
-        # Search for the person by email
-        results = service.people().connections().list(
-            resourceName='people/me',
-            pageSize=100,
-            personFields='photos,emailAddresses'
-        ).execute()
-
-        # Look for the person in connections
-        if 'connections' in results:
-            for person in results['connections']:
-                if 'emailAddresses' in person:
-                    for email_info in person['emailAddresses']:
-                        if email_info.get('value', '').lower() == email_address.lower():
-                            # Found the person, get their photo
-                            if 'photos' in person and person['photos']:
-                                # Prefer the primary, non-default photo
-                                for photo in person['photos']:
-                                    if photo.get('metadata', {}).get('primary') and not photo.get('default', False):
-                                        return photo.get('url')
-                                # Fallback to the first photo if no primary found
-                                return person['photos'][0].get('url')
+        if contacts is None:
+            contacts = get_contacts_index(get_user_key())
+        return contacts.ensure_fresh(service).get_photo(email_address)
     except Exception as e:
         logger.error(f"Error getting profile photo: {e}")
     return None
 
-def get_gmail_service():
-    """Gets an authorized Gmail API service instance using session credentials."""
-    creds = None
+def get_user_key():
+    """Identify the logged-in user for per-user caches."""
+    if has_request_context():
+        user = session.get('user') or {}
+        if user.get('email'):
+            return user['email']
+    return 'me'
 
-    # Use credentials from Flask session if available
-    token_data = session.get('google_token')
-    if token_data:
-        creds = Credentials(
-            token=token_data['token'],
-            refresh_token=token_data.get('refresh_token'),
-            token_uri=token_data['token_uri'],
-            client_id=token_data['client_id'],
-            client_secret=token_data['client_secret'],
-            scopes=token_data['scopes']
-        )
-        # Refresh if needed
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
+def add_sender_photo(email_content, people_service, contacts=None, resolved_photos=None):
+    """Set sender_photo from the sender's Google profile photo, or their company logo.
+
+    resolved_photos, when given, maps lowercased sender emails to the photo
+    already found for them (or None) and is filled in by this call.
+    """
+    sender_email = email_content.get('sender_email')
+    if not sender_email:
+        return
+    key = sender_email.lower()
+    if resolved_photos is not None and key in resolved_photos:
+        photo_url = resolved_photos[key]
     else:
+        try:
+            # First try to get Google profile photo, then fall back to company logo
+            photo_url = (get_profile_photo(people_service, sender_email, contacts)
+                         or get_company_logo(sender_email))
+        except Exception as e:
+            logger.error(f"Error getting photo for {sender_email}: {e}")
+            return
+        if resolved_photos is not None:
+            resolved_photos[key] = photo_url
+    if photo_url:
+        email_content['sender_photo'] = photo_url
+
+def get_sender_photos(sender_emails, workers=None):
+    """Resolve photos for many senders concurrently.
+
+    Args:
+        sender_emails: List of sender email addresses (duplicates are ignored)
+        workers: Maximum number of workers (defaults to SENDER_PHOTO_WORKERS)
+
+    Returns:
+        Dictionary mapping each lowercased email address to a photo URL or None
+    """
+    if workers is None:
+        workers = SENDER_PHOTO_WORKERS
+    unique_emails = list(dict.fromkeys(email.lower() for email in sender_emails if email))
+    if not unique_emails:
+        return {}
+
+    # Load the contacts index up front so workers only do dictionary lookups
+    _, people_service = get_gmail_service()
+    contacts = get_contacts_index(get_user_key()).ensure_fresh(people_service)
+
+    def resolve(email):
+        try:
+            return contacts.get_photo(email) or get_company_logo(email)
+        except Exception as e:
+            logger.error(f"Error getting photo for {email}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(unique_emails)))) as executor:
+        return dict(zip(unique_emails, executor.map(resolve, unique_emails)))
+
+def get_credentials():
+    """Get the user's Google credentials, refreshing them if expired.
+
+    Credentials come from the credential manager, which shares them across
+    the user's requests and refreshes them ahead of expiry. A refreshed
+    token is written back to the session with its expiry, so it survives a
+    restart instead of being refreshed again.
+    """
+    token_data = session.get('google_token')
+    if not token_data:
         raise Exception("No Google credentials in session. Please log in with Google.")
 
-    return build('gmail', 'v1', credentials=creds), build('people', 'v1', credentials=creds)
+    creds = get_credential_manager().get_credentials(get_user_key(), token_data)
+    fresh_token_data = token_data_from_credentials(creds)
+    if fresh_token_data != token_data:
+        session['google_token'] = fresh_token_data
+    return creds
+
+def build_services(creds):
+    """Get Gmail and People API service instances for the given credentials.
+
+    Services are built from the bundled discovery documents and shared across
+    threads per credentials object, so repeat calls skip construction entirely.
+    """
+    return service_factory.get_services(creds)
+
+def get_gmail_service():
+    """Gets an authorized Gmail API service instance using session credentials."""
+    return build_services(get_credentials())
 
 def extract_best_body(part):
     """Recursively extract the best body part (prefer html, fallback to plain)."""
@@ -104,8 +206,12 @@ def extract_best_body(part):
             return plain_body, 'plain'
     return '', 'plain'
 
-def get_email_content(message):
-    """Extract all useful fields from the message."""
+def get_email_content(message, include_body=True):
+    """Extract all useful fields from the message.
+
+    With include_body=False (messages fetched with format=metadata), body,
+    body_type and attachments are None; get_message_body() loads them later.
+    """
     if 'payload' not in message:
         return None
 
@@ -133,23 +239,25 @@ def get_email_content(message):
     else:
         sender_email = extract_email_address(from_header)
 
-    # Recursively get the best body part
-    body, body_type = extract_best_body(payload)
-
-    # Attachments
-    attachments = []
-    def find_attachments(part):
-        if part.get('filename'):
-            if 'attachmentId' in part.get('body', {}):
-                attachments.append({
-                    'filename': part['filename'],
-                    'mimeType': part.get('mimeType'),
-                    'size': part['body'].get('size'),
-                    'attachmentId': part['body']['attachmentId']
-                })
-        for subpart in part.get('parts', []):
-            find_attachments(subpart)
-    find_attachments(payload)
+    body, body_type, attachments = None, None, None
+    if include_body:
+        # Recursively get the best body part
+        body, body_type = extract_best_body(payload)
+
+        # Attachments
+        attachments = []
+        def find_attachments(part):
+            if part.get('filename'):
+                if 'attachmentId' in part.get('body', {}):
+                    attachments.append({
+                        'filename': part['filename'],
+                        'mimeType': part.get('mimeType'),
+                        'size': part['body'].get('size'),
+                        'attachmentId': part['body']['attachmentId']
+                    })
+            for subpart in part.get('parts', []):
+                find_attachments(subpart)
+        find_attachments(payload)
 
     return {
         'id': message.get('id'),
@@ -173,6 +281,455 @@ def get_email_content(message):
         'attachments': attachments
     }
 
+def get_request_params(metadata_only=False, thread=False):
+    """Extra messages().get() / threads().get() parameters for a list view fetch.
+
+    In metadata mode Gmail returns only the headers the inbox shows, and the
+    fields mask trims everything else from the response.
+    """
+    if not metadata_only:
+        return {}
+    fields = f'id,historyId,messages({MESSAGE_FIELDS})' if thread else MESSAGE_FIELDS
+    return {'format': 'metadata', 'metadataHeaders': METADATA_HEADERS, 'fields': fields}
+
+def strip_bodies(messages):
+    """Copy parsed messages without body content, as metadata mode returns them."""
+    return [dict(message, body=None, body_type=None, attachments=None) for message in messages]
+
+def compact_message(message, body_limit=None):
+    """
+    Copy a parsed message with only the fields the inbox UI reads.
+
+    The raw headers dict (already exposed as from/to/cc/bcc/date/subject),
+    historyId and sizeEstimate are dropped. The body is kept, cut to
+    body_limit characters, when body_limit is given; otherwise it is omitted
+    (None) and the client loads it from /message/<id>/body.
+    """
+    compact = {key: value for key, value in message.items() if key not in COMPACT_DROPPED_FIELDS}
+    body = message.get('body')
+    if body_limit is None:
+        compact.update(body=None, body_type=None)
+    elif body is not None and len(body) > body_limit:
+        # The client reloads truncated bodies when the message is opened
+        compact.update(body=body[:body_limit], body_truncated=True)
+    return compact
+
+def compact_thread(thread, include_bodies=False, body_limit=None):
+    """Compact every message of a parsed thread; bodies are kept only if include_bodies."""
+    body_limit = (body_limit or COMPACT_BODY_MAX_CHARS) if include_bodies else None
+    return dict(thread, messages=[compact_message(message, body_limit) for message in thread['messages']])
+
+def compact_email_data(email_data, expanded_thread_ids=()):
+    """Compact a fetch_emails() result, keeping truncated bodies for expanded threads only."""
+    expanded_thread_ids = set(expanded_thread_ids)
+    return dict(
+        email_data,
+        threads=[compact_thread(thread, thread['threadId'] in expanded_thread_ids)
+                 for thread in email_data.get('threads', [])],
+        individual_emails=[compact_message(email) for email in email_data.get('individual_emails', [])]
+    )
+
+def has_bodies(messages):
+    """Check that every parsed message was fetched with its body."""
+    return all(message.get('body') is not None for message in messages)
+
+def batch_execute(service, requests_by_id, batch_size=None):
+    """Execute API requests using the Gmail batch endpoint.
+
+    Args:
+        service: Gmail API service instance used to create batch requests
+        requests_by_id: Ordered mapping of request id to an unexecuted HttpRequest
+        batch_size: Maximum calls per batch (defaults to GMAIL_BATCH_SIZE)
+
+    Returns:
+        Tuple of (results, errors) dictionaries keyed by request id
+    """
+    if batch_size is None:
+        batch_size = GMAIL_BATCH_SIZE
+
+    results = {}
+    errors = {}
+    request_ids = list(requests_by_id)
+
+    if batch_size <= 1:
+        # Batching disabled, one round trip per request
+        for request_id in request_ids:
+            try:
+                results[request_id] = requests_by_id[request_id].execute()
+            except Exception as e:
+                errors[request_id] = e
+        return results, errors
+
+    def callback(request_id, response, exception):
+        if exception is not None:
+            errors[request_id] = exception
+        else:
+            results[request_id] = response
+
+    for start in range(0, len(request_ids), batch_size):
+        chunk = request_ids[start:start + batch_size]
+        batch = service.new_batch_http_request(callback=callback)
+        for request_id in chunk:
+            batch.add(requests_by_id[request_id], request_id=request_id)
+        try:
+            execute_batch(batch, [requests_by_id[request_id] for request_id in chunk])
+        except Exception as e:
+            # The whole batch failed (transport error or malformed response)
+            logger.error(f"Error executing batch of {len(chunk)} requests: {e}")
+            for request_id in chunk:
+                if request_id not in results:
+                    errors.setdefault(request_id, e)
+
+    retry_failed_calls(requests_by_id, results, errors)
+    return results, errors
+
+def batch_get_threads(service, thread_ids, batch_size=None, metadata_only=False):
+    """Fetch thread details in batches, preserving the input order.
+
+    Threads that fail to load are logged and left out of the result.
+    """
+    params = get_request_params(metadata_only, thread=True)
+    requests_by_id = {
+        thread_id: service.users().threads().get(userId='me', id=thread_id, **params)
+        for thread_id in thread_ids
+    }
+    results, errors = batch_execute(service, requests_by_id, batch_size)
+    for thread_id, error in errors.items():
+        logger.error(f"Error fetching thread {thread_id}: {error}")
+    return [results[thread_id] for thread_id in requests_by_id if thread_id in results]
+
+def batch_get_messages(service, message_ids, batch_size=None, metadata_only=False):
+    """Fetch message details in batches, preserving the input order.
+
+    Messages that fail to load are logged and left out of the result.
+    """
+    params = get_request_params(metadata_only)
+    requests_by_id = {
+        message_id: service.users().messages().get(userId='me', id=message_id, **params)
+        for message_id in message_ids
+    }
+    results, errors = batch_execute(service, requests_by_id, batch_size)
+    for message_id, error in errors.items():
+        logger.error(f"Error fetching message {message_id}: {error}")
+    return [results[message_id] for message_id in requests_by_id if message_id in results]
+
+def sort_threads_newest_first(thread_contents):
+    """Sort parsed threads by latest message timestamp, keeping input order for ties."""
+    return sorted(thread_contents, key=lambda x: x.get('latest_timestamp', 0), reverse=True)
+
+def hydrate_threads(thread_ids, creds, workers=None, contacts=None, enrich_photos=True,
+                    metadata_only=False, resolved_photos=None, errors=None):
+    """Fetch and parse threads concurrently using a bounded worker pool.
+
+    Each worker builds its own Gmail and People services since httplib2 is not
+    thread-safe. Threads that fail to load are logged and skipped.
+
+    Args:
+        thread_ids: List of thread IDs to hydrate
+        creds: Google credentials used to build the per-worker services
+        workers: Maximum number of workers (defaults to GMAIL_HYDRATION_WORKERS)
+        contacts: Contacts index used for sender photos (defaults to the current user's)
+        enrich_photos: Whether to resolve sender photos while parsing
+        metadata_only: Fetch headers only, leaving message bodies for get_message_body()
+        resolved_photos: Sender photos already resolved in this request, shared by all workers
+        errors: Optional dictionary filled with the exception of each thread that failed to load
+
+    Returns:
+        List of thread contents sorted newest first
+    """
+    if workers is None:
+        workers = GMAIL_HYDRATION_WORKERS
+    if not thread_ids:
+        return []
+    if contacts is None:
+        contacts = get_contacts_index(get_user_key())
+    if resolved_photos is None:
+        resolved_photos = {}
+
+    worker_state = threading.local()
+    params = get_request_params(metadata_only, thread=True)
+
+    def init_worker():
+        worker_state.gmail_service, worker_state.people_service = build_services(creds)
+
+    def hydrate(thread_id):
+        try:
+            thread_detail = worker_state.gmail_service.users().threads().get(
+                userId='me', id=thread_id, **params).execute()
+            return get_thread_content(
+                thread_detail, worker_state.people_service, contacts, enrich_photos,
+                include_body=not metadata_only, resolved_photos=resolved_photos)
+        except Exception as e:
+            logger.error(f"Error hydrating thread {thread_id}: {e}")
+            if errors is not None:
+                errors[thread_id] = e
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(thread_ids))),
+                            initializer=init_worker) as executor:
+        # map() yields results in submission order, so ties stay deterministic
+        thread_contents = [content for content in executor.map(hydrate, thread_ids) if content]
+
+    return sort_threads_newest_first(thread_contents)
+
+def load_threads(thread_ids, creds, gmail_service, people_service, contacts=None,
+                 enrich_photos=True, metadata_only=False, resolved_photos=None):
+    """Fetch and parse threads, concurrently when workers are enabled.
+
+    Falls back to batched gets parsed on the calling thread when
+    GMAIL_HYDRATION_WORKERS is 1 or less. Returns threads sorted newest first.
+    """
+    if GMAIL_HYDRATION_WORKERS > 1:
+        return hydrate_threads(thread_ids, creds, contacts=contacts, enrich_photos=enrich_photos,
+                               metadata_only=metadata_only, resolved_photos=resolved_photos)
+
+    if resolved_photos is None:
+        resolved_photos = {}
+    thread_contents = []
+    for thread_detail in batch_get_threads(gmail_service, thread_ids, metadata_only=metadata_only):
+        thread_content = get_thread_content(thread_detail, people_service, contacts, enrich_photos,
+                                            include_body=not metadata_only,
+                                            resolved_photos=resolved_photos)
+        if thread_content:
+            thread_contents.append(thread_content)
+    return sort_threads_newest_first(thread_contents)
+
+def fill_sender_photos(messages, people_service, contacts=None, resolved_photos=None):
+    """Resolve sender photos for stored messages that were saved without one."""
+    for message in messages:
+        if 'sender_photo' not in message:
+            add_sender_photo(message, people_service, contacts, resolved_photos)
+
+def load_threads_from_store(thread_refs, creds, gmail_service, people_service, contacts=None,
+                            enrich_photos=True, user_key=None, metadata_only=False,
+                            resolved_photos=None):
+    """Serve threads from the local message store, fetching only missing or stale ones.
+
+    A stored thread is current when its historyId matches the one reported by
+    threads().list. Fetched threads are written back to the store. A thread
+    stored from a metadata fetch is refetched when bodies are asked for, and
+    stored bodies are dropped from metadata responses.
+
+    Args:
+        thread_refs: Thread entries from threads().list with 'id' and 'historyId'
+        user_key: Store partition (defaults to the logged-in user)
+        metadata_only: Serve headers only, leaving message bodies for get_message_body()
+        resolved_photos: Sender photos already resolved in this request
+
+    Returns:
+        List of thread contents sorted newest first
+    """
+    if user_key is None:
+        user_key = get_user_key()
+    thread_ids = [thread['id'] for thread in thread_refs]
+    threads_by_id, stale_ids = get_stored_threads(thread_refs, user_key, metadata_only)
+    served_count = len(threads_by_id)
+    if enrich_photos:
+        for thread_content in threads_by_id.values():
+            fill_sender_photos(thread_content['messages'], people_service, contacts, resolved_photos)
+
+    if stale_ids:
+        fetched = load_threads(stale_ids, creds, gmail_service, people_service, contacts,
+                               enrich_photos, metadata_only, resolved_photos)
+        save_threads(user_key, fetched)
+        threads_by_id.update((thread_content['threadId'], thread_content) for thread_content in fetched)
+
+    logger.info(f'Served {served_count} threads from the message store, '
+                f'fetched {len(stale_ids)} from Gmail.')
+    return sort_threads_newest_first(
+        [threads_by_id[thread_id] for thread_id in thread_ids if thread_id in threads_by_id])
+
+def save_threads(user_key, thread_contents):
+    """Write freshly parsed threads to the message store and the in-memory thread cache."""
+    get_message_store().put_threads(user_key, thread_contents)
+    get_thread_cache().put_many(user_key, thread_contents)
+
+def get_stored_threads(thread_refs, user_key, metadata_only=False):
+    """Split listed threads into current stored copies and ids that must be fetched.
+
+    Copies are looked up by (threadId, historyId) in the thread cache, then
+    in the message store, so unchanged threads are neither fetched nor parsed.
+
+    Returns:
+        Tuple of (stored thread contents by id, stale thread ids in list order)
+    """
+    store = get_message_store()
+    thread_cache = get_thread_cache()
+    thread_ids = [thread['id'] for thread in thread_refs]
+
+    # Threads parsed at the listed historyId are served from memory first
+    threads_by_id = {}
+    for thread in thread_refs:
+        if thread.get('historyId'):
+            thread_content = thread_cache.get(user_key, thread['id'], thread['historyId'])
+            if thread_content:
+                threads_by_id[thread['id']] = thread_content
+    uncached_refs = [thread for thread in thread_refs if thread['id'] not in threads_by_id]
+
+    if uncached_refs:
+        stored_history_ids = store.get_thread_history_ids(
+            user_key, [thread['id'] for thread in uncached_refs])
+        current_ids = [thread['id'] for thread in uncached_refs
+                       if thread.get('historyId') and stored_history_ids.get(thread['id']) == thread['historyId']]
+        stored_threads = store.get_threads(user_key, current_ids)
+        thread_cache.put_many(user_key, stored_threads.values())
+        threads_by_id.update(stored_threads)
+
+    for thread_id, thread_content in list(threads_by_id.items()):
+        if metadata_only:
+            thread_content['messages'] = strip_bodies(thread_content['messages'])
+        elif not has_bodies(thread_content['messages']):
+            del threads_by_id[thread_id]
+    stale_ids = [thread_id for thread_id in thread_ids if thread_id not in threads_by_id]
+    return threads_by_id, stale_ids
+
+def load_messages_from_store(message_ids, gmail_service, people_service, contacts=None,
+                             enrich_photos=True, user_key=None, metadata_only=False,
+                             resolved_photos=None):
+    """Serve parsed messages from the local message store, fetching only missing ones.
+
+    Returns messages in the order of message_ids; ones that fail to load are skipped.
+    Like load_threads_from_store(), messages stored without a body are refetched
+    unless metadata_only is set, in which case stored bodies are dropped.
+    """
+    if user_key is None:
+        user_key = get_user_key()
+    store = get_message_store()
+
+    messages_by_id, missing_ids = get_stored_messages(message_ids, user_key, metadata_only)
+    if enrich_photos:
+        fill_sender_photos(messages_by_id.values(), people_service, contacts, resolved_photos)
+
+    fetched = []
+    for msg in batch_get_messages(gmail_service, missing_ids, metadata_only=metadata_only):
+        email_content = get_email_content(msg, include_body=not metadata_only)
+        if email_content:
+            if enrich_photos:
+                add_sender_photo(email_content, people_service, contacts, resolved_photos)
+            fetched.append(email_content)
+    if fetched:
+        store.put_messages(user_key, fetched)
+        messages_by_id.update((message['id'], message) for message in fetched)
+
+    return [messages_by_id[message_id] for message_id in message_ids if message_id in messages_by_id]
+
+def get_stored_messages(message_ids, user_key, metadata_only=False):
+    """Split message ids into usable stored messages and ids that must be fetched.
+
+    Returns:
+        Tuple of (stored messages by id, missing message ids in order)
+    """
+    messages_by_id = get_message_store().get_messages(user_key, message_ids)
+    if metadata_only:
+        messages_by_id = dict(zip(messages_by_id, strip_bodies(messages_by_id.values())))
+    else:
+        messages_by_id = {message_id: message for message_id, message in messages_by_id.items()
+                          if message.get('body') is not None}
+    missing_ids = [message_id for message_id in message_ids if message_id not in messages_by_id]
+    return messages_by_id, missing_ids
+
+def get_message_body(message_id, user_key=None):
+    """Load the body of a message listed in metadata mode.
+
+    Served from the message store when a full copy is stored, otherwise fetched
+    with format=full and written back so the next open is local.
+
+    Returns:
+        Dictionary with 'id', 'body', 'body_type' and 'attachments', or None
+        if the message does not exist
+    """
+    if user_key is None:
+        user_key = get_user_key()
+    store = get_message_store()
+
+    stored = store.get_messages(user_key, [message_id]).get(message_id)
+    if stored is None or stored.get('body') is None:
+        gmail_service, _ = get_gmail_service()
+        try:
+            msg = gmail_service.users().messages().get(userId='me', id=message_id).execute()
+        except HttpError as e:
+            if e.resp.status == 404:
+                return None
+            raise
+        email_content = get_email_content(msg)
+        if not email_content:
+            return None
+        if stored and 'sender_photo' in stored:
+            email_content['sender_photo'] = stored['sender_photo']
+        store.put_messages(user_key, [email_content])
+        stored = email_content
+
+    return {
+        'id': message_id,
+        'body': stored['body'],
+        'body_type': stored['body_type'],
+        'attachments': stored['attachments']
+    }
+
+def encode_page_cursor(thread_page_token=None, message_page_token=None):
+    """Pack the threads().list and messages().list page tokens into one opaque cursor.
+
+    Returns None when both lists are exhausted.
+    """
+    tokens = {}
+    if thread_page_token:
+        tokens['t'] = thread_page_token
+    if message_page_token:
+        tokens['m'] = message_page_token
+    if not tokens:
+        return None
+    return urlsafe_b64encode(json.dumps(tokens, separators=(',', ':')).encode()).decode().rstrip('=')
+
+def decode_page_cursor(cursor):
+    """Unpack a cursor from encode_page_cursor() into (thread_page_token, message_page_token).
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        tokens = json.loads(urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError('Invalid page cursor')
+    if not isinstance(tokens, dict) or not set(tokens) <= {'t', 'm'}:
+        raise ValueError('Invalid page cursor')
+    return tokens.get('t'), tokens.get('m')
+
+def encode_query_cursor(page_tokens):
+    """Pack the next page token of each job search query into one opaque cursor.
+
+    page_tokens holds one entry per query, None once that query is exhausted.
+    Returns None when every query is exhausted.
+    """
+    if not any(page_tokens):
+        return None
+    return urlsafe_b64encode(json.dumps({'q': page_tokens}, separators=(',', ':')).encode()).decode().rstrip('=')
+
+def decode_query_cursor(cursor, query_count=None):
+    """Unpack a cursor from encode_query_cursor() into the list of per-query page tokens.
+
+    Raises:
+        ValueError: If the cursor is malformed or was made for a different set of queries
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        page_tokens = json.loads(urlsafe_b64decode(padded.encode()))['q']
+    except Exception:
+        raise ValueError('Invalid page cursor')
+    if not isinstance(page_tokens, list) or (query_count is not None and len(page_tokens) != query_count):
+        raise ValueError('Invalid page cursor')
+    return page_tokens
+
+def list_page(resource, items_key, max_results, page_token=None, query=None):
+    """List one page of threads or messages. Returns (items, next page token)."""
+    params = {'userId': 'me', 'maxResults': max_results}
+    if page_token:
+        params['pageToken'] = page_token
+    if query:
+        params['q'] = query
+    results = resource.list(**params).execute()
+    return results.get(items_key, []), results.get('nextPageToken')
+
 def start_watch(service):
     """Start watching for Gmail notifications using Pub/Sub."""
     try:
@@ -210,96 +767,73 @@ def get_history_id(service):
         logger.error(f"Error getting history ID: {e}")
         return None
 
-def get_new_emails(service, history_id):
-    """Get new emails since the last history ID."""
-    try:
-        # Get history list
-        history_list = service.users().history().list(
-            userId='me',
-            startHistoryId=history_id,
-            historyTypes=['messageAdded']
-        ).execute()
-
-        new_emails = []
-        if 'history' in history_list:
-            for history in history_list['history']:
-                if 'messagesAdded' in history:
-                    for message_added in history['messagesAdded']:
-                        message = message_added['message']
-                        if message['labelIds'] and 'INBOX' in message['labelIds']:
-                            # Get full message details
-                            msg = service.users().messages().get(
-                                userId='me',
-                                id=message['id']
-                            ).execute()
-                            email_content = get_email_content(msg)
-                            if email_content:
-                                new_emails.append(email_content)
-
-        return new_emails
-    except Exception as e:
-        logger.error(f"Error getting new emails: {e}")
-        return []
+def list_history(service, start_history_id, history_types=None):
+    """Read every page of history records since start_history_id.
 
-def get_new_thread_updates(service, history_id):
-    """Get new thread updates since the last history ID."""
-    try:
-        # Get history list
-        history_list = service.users().history().list(
-            userId='me',
-            startHistoryId=history_id,
-            historyTypes=['messageAdded']
-        ).execute()
-
-        updated_thread_ids = set()
-        if 'history' in history_list:
-            for history in history_list['history']:
-                if 'messagesAdded' in history:
-                    for message_added in history['messagesAdded']:
-                        message = message_added['message']
-                        if message['labelIds'] and 'INBOX' in message['labelIds']:
-                            # Add the thread ID to our set of updated threads
-                            updated_thread_ids.add(message['threadId'])
-
-        # Get people service for profile photos
-        _, people_service = get_gmail_service()
-
-        # Fetch updated threads
-        updated_threads = []
-        for thread_id in updated_thread_ids:
-            try:
-                thread_detail = service.users().threads().get(
-                    userId='me', id=thread_id).execute()
-                thread_content = get_thread_content(thread_detail, people_service)
-                if thread_content:
-                    updated_threads.append(thread_content)
-            except Exception as e:
-                logger.error(f"Error fetching updated thread {thread_id}: {e}")
+    Args:
+        service: Gmail API service instance
+        start_history_id: History ID to read changes after
+        history_types: Optional list of history types to filter on
 
-        return updated_threads
-    except Exception as e:
-        logger.error(f"Error getting new thread updates: {e}")
-        return []
+    Returns:
+        Tuple of (history records, mailbox historyId reported by the last page)
+
+    Raises:
+        HttpError: With status 404 when start_history_id is too old to sync from
+    """
+    records = []
+    page_token = None
+    latest_history_id = None
+    while True:
+        params = {'userId': 'me', 'startHistoryId': start_history_id}
+        if history_types:
+            params['historyTypes'] = history_types
+        if page_token:
+            params['pageToken'] = page_token
+        history_list = service.users().history().list(**params).execute()
+        records.extend(history_list.get('history', []))
+        latest_history_id = history_list.get('historyId', latest_history_id)
+        page_token = history_list.get('nextPageToken')
+        if not page_token:
+            return records, latest_history_id
 
-def fetch_emails(max_results=10):
+def fetch_emails(max_results=DEFAULT_PAGE_SIZE, enrich_photos=True, page_token=None,
+                 metadata_only=False):
     """Fetch emails from Gmail and enrich with sender photo or company logo.
-    Also fetches threads and returns both, with threads taking precedence."""
+    Also fetches threads and returns both, with threads taking precedence.
+    With enrich_photos=False, sender_photo is left for get_sender_photos().
+    With metadata_only=True, bodies are None and are loaded with get_message_body().
+    Pass the returned next_page_token as page_token to fetch the following page."""
     try:
-        gmail_service, people_service = get_gmail_service()
+        creds = get_credentials()
+        gmail_service, people_service = build_services(creds)
+        contacts = get_contacts_index(get_user_key())
         
-        # First, get threads
-        thread_results = gmail_service.users().threads().list(
-            userId='me', maxResults=max_results).execute()
-        threads = thread_results.get('threads', [])
+        thread_page_token, message_page_token = (
+            decode_page_cursor(page_token) if page_token else (None, None))
+        threads, next_thread_page_token = [], None
+        messages, next_message_page_token = [], None
+        
+        # First, get threads (skipped once a later page has exhausted them)
+        if not page_token or thread_page_token:
+            threads, next_thread_page_token = list_page(
+                gmail_service.users().threads(), 'threads', max_results, thread_page_token)
         
         # Get individual messages for emails that aren't part of threads
-        message_results = gmail_service.users().messages().list(
-            userId='me', maxResults=max_results).execute()
-        messages = message_results.get('messages', [])
+        if not page_token or message_page_token:
+            messages, next_message_page_token = list_page(
+                gmail_service.users().messages(), 'messages', max_results, message_page_token)
+        
+        next_page_token = encode_page_cursor(next_thread_page_token, next_message_page_token)
         
         if not messages and not threads:
             logger.info('No messages or threads found.')
-            return []
+            return {
+                'threads': [],
+                'individual_emails': [],
+                'total_count': 0,
+                'next_page_token': next_page_token
+            }
         
         logger.info(f'Found {len(threads)} threads and {len(messages)} individual messages.')
         
@@ -308,31 +842,19 @@ def fetch_emails(max_results=10):
         email_list = []  # Initialize email_list here
         thread_message_ids = set()  # Track message IDs that are part of threads
         
-        for thread in threads:
-            thread_detail = gmail_service.users().threads().get(
-                userId='me', id=thread['id']).execute()
-            
-            thread_content = get_thread_content(thread_detail, people_service)
+        # Each sender's photo is looked up once for the whole page
+        resolved_photos = {}
+        thread_contents = load_threads_from_store(
+            threads, creds, gmail_service, people_service, contacts, enrich_photos,
+            metadata_only=metadata_only, resolved_photos=resolved_photos)
+        
+        for thread_content in thread_contents:
             if thread_content:
                 # If thread has only one message, treat it as an individual email
                 if thread_content['message_count'] == 1:
                     # Add the single message to individual emails
                     single_message = thread_content['messages'][0]
-                    # Try to get profile photo for the sender
-                    if single_message['sender_email'] and people_service:
-                        try:
-                            # First try to get Google profile photo
-                            photo_url = get_profile_photo(people_service, single_message['sender_email'])
-                            if photo_url:
-                                single_message['sender_photo'] = photo_url
-                            else:
-                                # If no Google photo, try to get company logo
-                                company_logo = get_company_logo(single_message['sender_email'])
-                                if company_logo:
-                                    single_message['sender_photo'] = company_logo
-                        except Exception as e:
-                            logger.error(f"Error getting photo for {single_message['sender_email']}: {e}")
-                    
+                    # Sender photo was already resolved by get_thread_content()
                     email_list.append(single_message)
                     # Add message ID to thread_message_ids to prevent duplication
                     thread_message_ids.add(single_message['id'])
@@ -341,7 +863,7 @@ def fetch_emails(max_results=10):
                     logger.info(f'Single Message Thread - From: {single_message["sender"]}')
                     logger.info(f'Subject: {single_message["subject"]}')
                     logger.info('-'*50)
-                    logger.info(f'Body: {single_message["body"][:200]}...')  # Show first 200 chars
+                    logger.info(f'Body: {(single_message["body"] or single_message["snippet"])[:200]}...')  # Show first 200 chars
                     logger.info('='*50)
                 else:
                     # Add all message IDs from this thread to our set
@@ -355,163 +877,196 @@ def fetch_emails(max_results=10):
                     logger.info('='*50)
         
         # Process individual messages (those not part of threads)
-        for message in messages:
-            if message['id'] not in thread_message_ids:
-                msg = gmail_service.users().messages().get(
-                    userId='me', id=message['id']).execute()
-                
-                email_content = get_email_content(msg)
-                if email_content:
-                    # Try to get profile photo for the sender
-                    if email_content['sender_email']:
-                        # First try to get Google profile photo
-                        photo_url = get_profile_photo(people_service, email_content['sender_email'])
-                        if photo_url:
-                            email_content['sender_photo'] = photo_url
-                        else:
-                            # If no Google photo, try to get company logo
-                            company_logo = get_company_logo(email_content['sender_email'])
-                            if company_logo:
-                                email_content['sender_photo'] = company_logo
-                    
-                    email_list.append(email_content)
-                    logger.info('\n' + '='*50)
-                    logger.info(f'Individual Email - From: {email_content["sender"]}')
-                    logger.info(f'Subject: {email_content["subject"]}')
-                    logger.info('-'*50)
-                    logger.info(f'Body: {email_content["body"][:200]}...')  # Show first 200 chars
-                    logger.info('='*50)
+        individual_emails = load_messages_from_store(
+            [message['id'] for message in messages if message['id'] not in thread_message_ids],
+            gmail_service, people_service, contacts, enrich_photos, metadata_only=metadata_only,
+            resolved_photos=resolved_photos)
+        
+        for email_content in individual_emails:
+            email_list.append(email_content)
+            logger.info('\n' + '='*50)
+            logger.info(f'Individual Email - From: {email_content["sender"]}')
+            logger.info(f'Subject: {email_content["subject"]}')
+            logger.info('-'*50)
+            logger.info(f'Body: {(email_content["body"] or email_content["snippet"])[:200]}...')  # Show first 200 chars
+            logger.info('='*50)
         
-        # Start watching for new emails
-        watch_response = start_watch(gmail_service)
-        if watch_response:
-            logger.info(f"Started watching for new emails. Expiration: {watch_response.get('expiration')}")
+        # Keep the Gmail watch alive; it is only renewed shortly before its lease expires
+        get_watch_manager().ensure_watch(gmail_service, get_user_key())
         
         # Return both threads and individual emails
         return {
             'threads': thread_list,
             'individual_emails': email_list,
-            'total_count': len(thread_list) + len(email_list)
+            'total_count': len(thread_list) + len(email_list),
+            'next_page_token': next_page_token
         }
     
     except Exception as e:
         logger.error(f'An error occurred: {e}')
-        # Return empty structure on error
-        return {
-            'threads': [],
-            'individual_emails': [],
-            'total_count': 0
-        }
+        # Raised rather than returned as an empty inbox, which would be cached and shared
+        raise e
+
+def fetch_threads(max_results=DEFAULT_PAGE_SIZE, enrich_photos=True, metadata_only=False):
+    """Fetch email threads from Gmail and enrich with sender photos or company logos.
+    With enrich_photos=False, sender_photo is left for get_sender_photos().
+    With metadata_only=True, bodies are None and are loaded with get_message_body()."""
+    thread_list, _ = fetch_threads_page(max_results, enrich_photos, metadata_only=metadata_only)
+    return thread_list
 
-def fetch_threads(max_results=10):
-    """Fetch email threads from Gmail and enrich with sender photos or company logos."""
+def fetch_threads_page(max_results=DEFAULT_PAGE_SIZE, enrich_photos=True, page_token=None,
+                       metadata_only=False):
+    """Fetch one page of email threads. Returns (threads, next page token or None)."""
     try:
-        gmail_service, people_service = get_gmail_service()
+        creds = get_credentials()
+        gmail_service, people_service = build_services(creds)
+        contacts = get_contacts_index(get_user_key())
         
         # Get list of threads
-        results = gmail_service.users().threads().list(
-            userId='me', maxResults=max_results).execute()
-        threads = results.get('threads', [])
+        thread_page_token = decode_page_cursor(page_token)[0] if page_token else None
+        threads, next_thread_page_token = list_page(
+            gmail_service.users().threads(), 'threads', max_results, thread_page_token)
+        next_page_token = encode_page_cursor(next_thread_page_token)
         
         if not threads:
             logger.info('No threads found.')
-            return []
+            return [], next_page_token
         
         logger.info(f'Found {len(threads)} threads.')
         
         # Fetch each thread with all its messages
-        thread_list = []
-        for thread in threads:
-            thread_detail = gmail_service.users().threads().get(
-                userId='me', id=thread['id']).execute()
-            
-            thread_content = get_thread_content(thread_detail, people_service)
-            if thread_content:
-                thread_list.append(thread_content)
-                logger.info('\n' + '='*50)
-                logger.info(f'Thread: {thread_content["subject"]}')
-                logger.info(f'Messages: {len(thread_content["messages"])}')
-                logger.info('='*50)
-        
-        # Sort threads by most recent message timestamp (newest first)
-        thread_list.sort(key=lambda x: x.get('latest_timestamp', 0), reverse=True)
+        # Threads come back sorted by most recent message timestamp (newest first)
+        thread_list = load_threads_from_store(
+            threads, creds, gmail_service, people_service, contacts, enrich_photos,
+            metadata_only=metadata_only)
+        for thread_content in thread_list:
+            logger.info('\n' + '='*50)
+            logger.info(f'Thread: {thread_content["subject"]}')
+            logger.info(f'Messages: {len(thread_content["messages"])}')
+            logger.info('='*50)
         
-        # Start watching for new emails
-        watch_response = start_watch(gmail_service)
-        if watch_response:
-            logger.info(f"Started watching for new emails. Expiration: {watch_response.get('expiration')}")
+        # Keep the Gmail watch alive; it is only renewed shortly before its lease expires
+        get_watch_manager().ensure_watch(gmail_service, get_user_key())
         
-        return thread_list
+        return thread_list, next_page_token
     
     except Exception as e:
         logger.error(f'An error occurred: {e}')
         raise e
 
-def get_thread_content(thread_detail, people_service):
-    """Extract all useful fields from a thread and its messages."""
+def fetch_job_emails(max_results=DEFAULT_PAGE_SIZE, enrich_photos=True, page_token=None,
+                     metadata_only=False):
+    """Fetch candidate job emails with Gmail search, then keep the ones JobEmailFilter accepts.
+
+    The GmailPreFilter queries run as q= on messages().list, so only matching
+    messages are downloaded. Each query lists up to max_results messages per
+    page, and a message matched by several queries is loaded once. Gmail
+    search misses keywords inside longer words, which the job filter would
+    accept (see GmailPreFilter).
+
+    Returns:
+        Dictionary with the job 'emails' (newest first), 'candidate_count',
+        'matched_count' and 'next_page_token'
+    """
+    creds = get_credentials()
+    gmail_service, people_service = build_services(creds)
+    contacts = get_contacts_index(get_user_key())
+
+    queries = GmailPreFilter().get_job_queries()
+    page_tokens = decode_query_cursor(page_token, len(queries)) if page_token else [None] * len(queries)
+    next_page_tokens = [None] * len(queries)
+
+    candidate_ids = []
+    for index, query in enumerate(queries):
+        # Queries exhausted on an earlier page are skipped
+        if page_token and not page_tokens[index]:
+            continue
+        messages, next_page_tokens[index] = list_page(
+            gmail_service.users().messages(), 'messages', max_results, page_tokens[index], query)
+        candidate_ids.extend(message['id'] for message in messages)
+    candidate_ids = list(dict.fromkeys(candidate_ids))
+
+    candidates = load_messages_from_store(
+        candidate_ids, gmail_service, people_service, contacts, enrich_photos,
+        metadata_only=metadata_only, resolved_photos={})
+    filter_result = filter_job_emails(candidates)
+    job_emails = sorted(filter_result['filtered_emails'],
+                        key=lambda email: int(email.get('internalDate') or 0), reverse=True)
+
+    logger.info(f'{len(queries)} job queries found {len(candidate_ids)} candidates, '
+                f'{len(job_emails)} kept by the job filter.')
+    return {
+        'emails': job_emails,
+        'candidate_count': len(candidate_ids),
+        'matched_count': len(job_emails),
+        'next_page_token': encode_query_cursor(next_page_tokens)
+    }
+
+def get_thread_content(thread_detail, people_service, contacts=None, enrich_photos=True,
+                       include_body=True, resolved_photos=None):
+    """Extract all useful fields from a thread and its messages.
+
+    Every message is parsed once, and thread metadata and participants are
+    collected in the same pass. include_body is passed to get_email_content().
+    resolved_photos is shared with add_sender_photo() so each sender is looked
+    up once; pass the same dictionary to dedup senders across threads.
+    """
     if 'messages' not in thread_detail or not thread_detail['messages']:
         return None
     
     messages = thread_detail['messages']
     thread_id = thread_detail['id']
+    if resolved_photos is None:
+        resolved_photos = {}
     
     # Sort messages by internal date (newest first)
     messages.sort(key=lambda x: int(x.get('internalDate', 0)), reverse=True)
     
-    # Get the most recent message for thread metadata
-    latest_message = messages[0]
-    latest_email_content = get_email_content(latest_message)
-    
-    if not latest_email_content:
-        return None
-    
     # Process all messages in the thread
     thread_messages = []
     latest_timestamp = 0
+    thread_subject = None
+    participants = {}
     
     for message in messages:
-        email_content = get_email_content(message)
-        if email_content:
-            # Try to get profile photo for the sender
-            if email_content['sender_email'] and people_service:
-                try:
-                    # First try to get Google profile photo
-                    photo_url = get_profile_photo(people_service, email_content['sender_email'])
-                    if photo_url:
-                        email_content['sender_photo'] = photo_url
-                    else:
-                        # If no Google photo, try to get company logo
-                        company_logo = get_company_logo(email_content['sender_email'])
-                        if company_logo:
-                            email_content['sender_photo'] = company_logo
-                except Exception as e:
-                    logger.error(f"Error getting photo for {email_content['sender_email']}: {e}")
-            
-            thread_messages.append(email_content)
-            
-            # Track the latest timestamp
-            message_timestamp = int(message.get('internalDate', 0))
-            if message_timestamp > latest_timestamp:
-                latest_timestamp = message_timestamp
+        email_content = get_email_content(message, include_body)
+        if not email_content:
+            # The most recent message supplies the thread metadata
+            if not thread_messages:
+                return None
+            continue
+        
+        # Try to get profile photo for the sender
+        if enrich_photos and people_service:
+            add_sender_photo(email_content, people_service, contacts, resolved_photos)
+        
+        thread_messages.append(email_content)
+        
+        # Track the latest timestamp
+        message_timestamp = int(message.get('internalDate', 0))
+        if message_timestamp > latest_timestamp:
+            latest_timestamp = message_timestamp
+        
+        # Use the newest message that has a subject
+        if not thread_subject and email_content['subject'] and email_content['subject'] != 'No Subject':
+            thread_subject = email_content['subject']
+        
+        participants.update(dict.fromkeys(get_message_participants(email_content)))
     
-    # Ensure we have at least one message
-    if not thread_messages:
-        return None
+    latest_email_content = thread_messages[0]
     
-    # Get subject from latest message or fallback to first message with subject
-    thread_subject = latest_email_content['subject']
-    if not thread_subject or thread_subject == 'No Subject':
+    # Fall back to email addresses found in sender names
+    if not participants:
         for message in thread_messages:
-            if message.get('subject') and message['subject'] != 'No Subject':
-                thread_subject = message['subject']
-                break
-        if not thread_subject or thread_subject == 'No Subject':
-            thread_subject = 'No Subject'
+            email = extract_email_address(message['sender'])
+            if email:
+                participants[email] = None
     
     return {
         'threadId': thread_id,
-        'subject': thread_subject,
-        'participants': get_thread_participants(thread_messages),
+        'historyId': thread_detail.get('historyId'),
+        'subject': thread_subject or 'No Subject',
+        'participants': list(participants),
         'latest_snippet': latest_email_content['snippet'],
         'latest_timestamp': latest_timestamp,
         'message_count': len(thread_messages),
@@ -521,31 +1076,18 @@ def get_thread_content(thread_detail, people_service):
         'latest_sender_photo': latest_email_content.get('sender_photo')
     }
 
-def get_thread_participants(messages):
-    """Extract unique participants from all messages in a thread."""
-    participants = set()
-    for message in messages:
-        if message.get('sender_email'):
-            participants.add(message['sender_email'])
-        if message.get('to'):
-            # Extract email addresses from 'to' field
-            to_emails = extract_emails_from_string(message['to'])
-            participants.update(to_emails)
-        if message.get('cc'):
-            # Extract email addresses from 'cc' field
-            cc_emails = extract_emails_from_string(message['cc'])
-            participants.update(cc_emails)
-    
-    # If no participants found, try to extract from sender names
-    if not participants:
-        for message in messages:
-            if message.get('sender'):
-                # Try to extract email from sender name
-                email = extract_email_address(message['sender'])
-                if email:
-                    participants.add(email)
-    
-    return list(participants) if participants else []
+def get_message_participants(message):
+    """Extract the sender, To and Cc addresses of one parsed message."""
+    participants = []
+    if message.get('sender_email'):
+        participants.append(message['sender_email'])
+    if message.get('to'):
+        # Extract email addresses from 'to' field
+        participants.extend(extract_emails_from_string(message['to']))
+    if message.get('cc'):
+        # Extract email addresses from 'cc' field
+        participants.extend(extract_emails_from_string(message['cc']))
+    return participants
 
 def extract_emails_from_string(email_string):
     """Extract email addresses from a string that might contain multiple emails."""
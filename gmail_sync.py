@@ -0,0 +1,155 @@
+import os
+import logging
+from googleapiclient.errors import HttpError
+from gmail_fetcher import (
+    build_services, list_history, hydrate_threads, load_threads, get_history_id,
+    sort_threads_newest_first
+)
+from utils.contacts_index import get_contacts_index
+from utils.message_store import get_message_store
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# History record types applied by the sync engine
+SYNC_HISTORY_TYPES = ['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved']
+
+# Number of most recent threads reloaded when the history cursor has expired
+FULL_RESYNC_MAX_THREADS = int(os.getenv('FULL_RESYNC_MAX_THREADS', '50'))
+
+def collect_changes(history_records):
+    """
+    Reduce history records to the set of changes the store needs.
+
+    Returns:
+        Dictionary with 'added_thread_ids' (new INBOX mail), 'deleted' message
+        and thread ids, and 'label_changes' as (message_id, added, removed)
+    """
+    added_thread_ids = set()
+    deleted_message_ids = set()
+    deleted_thread_ids = set()
+    label_changes = []
+
+    for history in history_records:
+        for message_added in history.get('messagesAdded', []):
+            message = message_added['message']
+            if 'INBOX' in (message.get('labelIds') or []):
+                added_thread_ids.add(message['threadId'])
+        for message_deleted in history.get('messagesDeleted', []):
+            message = message_deleted['message']
+            deleted_message_ids.add(message['id'])
+            deleted_thread_ids.add(message['threadId'])
+        for label_added in history.get('labelsAdded', []):
+            label_changes.append((label_added['message']['id'], label_added.get('labelIds', []), []))
+        for label_removed in history.get('labelsRemoved', []):
+            label_changes.append((label_removed['message']['id'], [], label_removed.get('labelIds', [])))
+
+    return {
+        'added_thread_ids': added_thread_ids,
+        'deleted_message_ids': deleted_message_ids,
+        'deleted_thread_ids': deleted_thread_ids,
+        'label_changes': label_changes
+    }
+
+def sync_mailbox(service, creds, history_id, user_key):
+    """
+    Bring the local message store up to date with Gmail since history_id.
+
+    Reads every page of history, refetches threads that gained or lost
+    messages, applies label changes (including read/unread) to stored messages
+    in place, and advances the cursor to the historyId Gmail reports. A thread
+    is only deleted once Gmail answers 404 for it; if any changed thread fails
+    to load for another reason, the cursor stays put so the next sync retries.
+    When the cursor is too old for history().list, falls back to full_resync().
+
+    Args:
+        service: Gmail API service instance
+        creds: Google credentials used to hydrate changed threads
+        history_id: Cursor from the previous sync
+        user_key: Message store partition of the user being synced
+
+    Returns:
+        Dictionary with the new 'history_id', 'updated_threads' (newest first),
+        'deleted_thread_ids' and whether a 'full_resync' happened
+    """
+    try:
+        history_records, latest_history_id = list_history(service, history_id, SYNC_HISTORY_TYPES)
+    except HttpError as e:
+        if e.resp.status == 404:
+            logger.warning(f"History ID {history_id} expired, running a full resync")
+            return full_resync(service, creds, user_key)
+        raise
+
+    store = get_message_store()
+    changes = collect_changes(history_records)
+
+    if changes['deleted_message_ids']:
+        store.delete_messages(user_key, list(changes['deleted_message_ids']))
+
+    relabeled_thread_ids = set()
+    for message_id, added, removed in changes['label_changes']:
+        thread_id = store.update_labels(user_key, message_id, added, removed)
+        if thread_id:
+            relabeled_thread_ids.add(thread_id)
+
+    # Threads that gained or lost messages are refetched, the rest are patched in place
+    refetch_ids = changes['added_thread_ids'] | changes['deleted_thread_ids']
+    updated_threads = []
+    errors = {}
+    if refetch_ids:
+        updated_threads = hydrate_threads(
+            list(refetch_ids), creds, contacts=get_contacts_index(user_key), errors=errors)
+        store.put_threads(user_key, updated_threads)
+
+    # Only a thread Gmail no longer has (404) is deleted; other failures are retried
+    gone_ids = {thread_id for thread_id, error in errors.items()
+                if isinstance(error, HttpError) and error.resp.status == 404}
+    deleted_thread_ids = [thread_id for thread_id in changes['deleted_thread_ids'] if thread_id in gone_ids]
+    if deleted_thread_ids:
+        store.delete_threads(user_key, deleted_thread_ids)
+
+    failed_ids = set(errors) - gone_ids
+    if failed_ids:
+        # Replaying history is idempotent, so the next pass reapplies it from the old cursor
+        logger.warning(f"{len(failed_ids)} changed threads failed to load, keeping history ID {history_id}")
+        latest_history_id = history_id
+
+    relabeled = store.get_threads(user_key, list(relabeled_thread_ids - refetch_ids))
+    updated_threads = sort_threads_newest_first(updated_threads + list(relabeled.values()))
+
+    logger.info(f"Synced {len(history_records)} history records: {len(updated_threads)} threads "
+                f"updated, {len(deleted_thread_ids)} deleted")
+    return {
+        'history_id': latest_history_id or history_id,
+        'updated_threads': updated_threads,
+        'deleted_thread_ids': deleted_thread_ids,
+        'full_resync': False
+    }
+
+def full_resync(service, creds, user_key, max_threads=None):
+    """
+    Rebuild the user's message store from the most recent threads.
+
+    The profile historyId is read before listing so that changes made during
+    the resync are picked up by the next incremental sync.
+    """
+    if max_threads is None:
+        max_threads = FULL_RESYNC_MAX_THREADS
+
+    history_id = get_history_id(service)
+    thread_results = service.users().threads().list(userId='me', maxResults=max_threads).execute()
+    thread_ids = [thread['id'] for thread in thread_results.get('threads', [])]
+
+    _, people_service = build_services(creds)
+    threads = load_threads(thread_ids, creds, service, people_service, get_contacts_index(user_key))
+    store = get_message_store()
+    store.clear(user_key)
+    store.put_threads(user_key, threads)
+
+    logger.info(f"Full resync reloaded {len(threads)} threads at history ID {history_id}")
+    return {
+        'history_id': history_id,
+        'updated_threads': threads,
+        'deleted_thread_ids': [],
+        'full_resync': True
+    }
@@ -0,0 +1,320 @@
+import os
+import json
+import queue
+import asyncio
+import logging
+import threading
+from gmail_fetcher import build_services, get_history_id, strip_bodies
+from gmail_sync import sync_mailbox
+from utils.credential_manager import get_credential_manager
+from utils.gmail_watch import get_watch_manager
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Seconds between incremental syncs of a mailbox with open event streams
+MAILBOX_SYNC_INTERVAL = float(os.getenv('MAILBOX_SYNC_INTERVAL', '5'))
+
+# Seconds between keepalive comments on an idle event stream
+EVENT_KEEPALIVE_INTERVAL = float(os.getenv('EVENT_KEEPALIVE_INTERVAL', '15'))
+
+# Events buffered per connection before a slow client is told to resync
+EVENT_QUEUE_SIZE = 100
+
+def to_delta_event(sync_result):
+    """
+    Build the event sent to clients from a sync_mailbox() result.
+
+    Threads are sent without bodies, like the metadata-only inbox, since
+    clients load bodies when a message is opened.
+    """
+    return {
+        'type': 'resync' if sync_result['full_resync'] else 'delta',
+        'history_id': sync_result['history_id'],
+        'updated_threads': [dict(thread, messages=strip_bodies(thread.get('messages', [])))
+                            for thread in sync_result['updated_threads']],
+        'deleted_thread_ids': sync_result['deleted_thread_ids']
+    }
+
+def format_sse(event):
+    """Encode an event as a Server-Sent Events message."""
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+class Subscription:
+    """One open event stream. Events are read from a bounded queue."""
+
+    def __init__(self, user_key, max_size=EVENT_QUEUE_SIZE):
+        self.user_key = user_key
+        self.queue = queue.Queue(maxsize=max_size)
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except (queue.Full, asyncio.QueueFull):
+            # The client fell behind, so replace its backlog with a single resync
+            self.clear()
+            self.queue.put_nowait({'type': 'resync'})
+
+    def clear(self):
+        try:
+            while True:
+                self.queue.get_nowait()
+        except (queue.Empty, asyncio.QueueEmpty):
+            pass
+
+    def close(self):
+        try:
+            self.queue.put_nowait(None)
+        except (queue.Full, asyncio.QueueFull):
+            self.clear()
+            self.queue.put_nowait(None)
+
+    def get(self, timeout=None):
+        """Next event, 'keepalive' when none arrived within timeout, or None once closed."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return 'keepalive'
+
+class AsyncSubscription(Subscription):
+    """
+    An event stream read on an event loop, holding no thread while it waits.
+
+    The hub's sync loops put events from their own threads, so puts are
+    handed to the event loop.
+    """
+
+    def __init__(self, user_key, loop, max_size=EVENT_QUEUE_SIZE):
+        self.user_key = user_key
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=max_size)
+
+    def _call_soon(self, callback, *args):
+        try:
+            self.loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # The loop has closed along with the stream
+            pass
+
+    def put(self, event):
+        self._call_soon(super().put, event)
+
+    def close(self):
+        self._call_soon(super().close)
+
+    async def get(self, timeout=None):
+        """Next event, 'keepalive' when none arrived within timeout, or None once closed."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return 'keepalive'
+
+class MailboxSyncLoop:
+    """
+    Background sync of one user's mailbox.
+
+    Runs sync_mailbox() every interval while the user has open streams and
+    hands each non-empty result to the hub. wake() syncs immediately.
+    """
+
+    def __init__(self, hub, user_key, creds, history_id=None, interval=None):
+        self.hub = hub
+        self.user_key = user_key
+        self.creds = creds
+        self.history_id = history_id
+        self.interval = MAILBOX_SYNC_INTERVAL if interval is None else interval
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self.run, name=f'mailbox-sync-{user_key}', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+
+    def wake(self):
+        self._wake.set()
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def sync_once(self):
+        """Run one incremental sync and publish its changes."""
+        get_credential_manager().ensure_fresh(self.user_key, self.creds)
+        gmail_service, _ = build_services(self.creds)
+        if not self.history_id:
+            self.history_id = get_history_id(gmail_service)
+            return
+        sync_result = sync_mailbox(gmail_service, self.creds, self.history_id, self.user_key)
+        if sync_result['history_id'] != self.history_id:
+            # Kept with the watch lease, so a push after the last stream closes syncs from here
+            get_watch_manager().record_history_id(self.user_key, sync_result['history_id'])
+        self.history_id = sync_result['history_id']
+        if sync_result['full_resync'] or sync_result['updated_threads'] or sync_result['deleted_thread_ids']:
+            self.hub.publish(self.user_key, to_delta_event(sync_result))
+
+    def run(self):
+        logger.info(f"Started mailbox sync loop for {self.user_key}")
+        while not self._stopped.is_set():
+            try:
+                self.sync_once()
+            except Exception as e:
+                logger.error(f"Error syncing mailbox for {self.user_key}: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+        logger.info(f"Stopped mailbox sync loop for {self.user_key}")
+
+class MailboxEventHub:
+    """
+    Fans mailbox changes out to every open event stream.
+
+    Each user with at least one stream has exactly one sync loop, so Gmail
+    API calls grow with the number of users rather than open tabs. The loop
+    stops when the user's last stream closes.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+        self._loops = {}
+        # Users with a one-off sync running, and whether another pass was requested
+        self._one_off_syncs = {}
+
+    def subscribe(self, user_key, creds, history_id=None, subscription=None):
+        """Open a stream for user_key (or register subscription), starting its sync loop if needed."""
+        if subscription is None:
+            subscription = Subscription(user_key)
+        with self._lock:
+            self._subscriptions.setdefault(user_key, set()).add(subscription)
+            loop = self._loops.get(user_key)
+            if loop and loop.is_alive():
+                # The newest session credentials are the freshest
+                loop.creds = creds
+            else:
+                loop = MailboxSyncLoop(self, user_key, creds, history_id, self.interval)
+                self._loops[user_key] = loop
+                loop.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Close a stream, stopping the user's sync loop after their last one."""
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_key, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.user_key, None)
+                loop = self._loops.pop(subscription.user_key, None)
+                if loop:
+                    loop.stop()
+
+    def publish(self, user_key, event):
+        """Send an event to every open stream of user_key."""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_key, ()))
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    def notify(self, user_key):
+        """
+        Sync user_key's mailbox now instead of at the next interval.
+
+        Returns:
+            True if the user has a running sync loop to wake
+        """
+        with self._lock:
+            loop = self._loops.get(user_key)
+        if loop:
+            loop.wake()
+        return loop is not None
+
+    def sync_once(self, user_key, creds):
+        """
+        Sync the mailbox of a user without a sync loop once, in the background.
+
+        The sync starts from the historyId stored with the user's watch lease
+        and stores the new one there, so their message store is current when
+        they next load the inbox. A call while the sync runs asks for one more
+        pass instead of starting a second sync.
+        """
+        with self._lock:
+            if user_key in self._one_off_syncs:
+                self._one_off_syncs[user_key] = True
+                return
+            self._one_off_syncs[user_key] = False
+        threading.Thread(target=self._run_one_off_sync, args=(user_key, creds),
+                         name=f'mailbox-sync-once-{user_key}', daemon=True).start()
+
+    def _run_one_off_sync(self, user_key, creds):
+        again = True
+        while again:
+            try:
+                get_credential_manager().ensure_fresh(user_key, creds)
+                gmail_service, _ = build_services(creds)
+                watch_manager = get_watch_manager()
+                lease = watch_manager.get_lease(user_key)
+                if lease and lease['history_id']:
+                    sync_result = sync_mailbox(gmail_service, creds, lease['history_id'], user_key)
+                    watch_manager.record_history_id(user_key, sync_result['history_id'])
+                else:
+                    watch_manager.record_history_id(user_key, get_history_id(gmail_service))
+            except Exception as e:
+                logger.error(f"Error syncing mailbox for {user_key}: {e}")
+            with self._lock:
+                again = self._one_off_syncs[user_key]
+                if again:
+                    self._one_off_syncs[user_key] = False
+                else:
+                    del self._one_off_syncs[user_key]
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'users': len(self._loops),
+                'connections': sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+            }
+
+    def stream(self, subscription, keepalive=None):
+        """Yield Server-Sent Events for a subscription until it is closed or the client leaves."""
+        keepalive = EVENT_KEEPALIVE_INTERVAL if keepalive is None else keepalive
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                event = subscription.get(timeout=keepalive)
+                if event is None:
+                    return
+                if event == 'keepalive':
+                    yield ': keepalive\n\n'
+                    continue
+                yield format_sse(event)
+        finally:
+            self.unsubscribe(subscription)
+
+    async def stream_async(self, subscription, keepalive=None):
+        """stream() for an AsyncSubscription, as an async generator."""
+        keepalive = EVENT_KEEPALIVE_INTERVAL if keepalive is None else keepalive
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                event = await subscription.get(timeout=keepalive)
+                if event is None:
+                    return
+                if event == 'keepalive':
+                    yield ': keepalive\n\n'
+                    continue
+                yield format_sse(event)
+        finally:
+            self.unsubscribe(subscription)
+
+_event_hub = None
+_event_hub_lock = threading.Lock()
+
+def get_event_hub() -> MailboxEventHub:
+    """Get the process-wide mailbox event hub, creating it on first use."""
+    global _event_hub
+    with _event_hub_lock:
+        if _event_hub is None:
+            _event_hub = MailboxEventHub()
+        return _event_hub
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Stand in for Pub/Sub by POSTing a Gmail push notification to the backend.
+
+Builds the same envelope a push subscription delivers for a mailbox change,
+so the /gmail/push receiver can be exercised locally without a Google Cloud
+project.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import requests
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.gmail_watch import encode_push_envelope
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('email_address', help='Gmail address the notification is for')
+    parser.add_argument('history_id', help='Mailbox historyId reported by the notification')
+    parser.add_argument('--url', default='http://localhost:5001/gmail/push')
+    parser.add_argument('--token', default=os.getenv('GMAIL_PUSH_TOKEN'),
+                        help='Push token expected by the receiver (defaults to GMAIL_PUSH_TOKEN)')
+    args = parser.parse_args()
+
+    params = {'token': args.token} if args.token else {}
+    response = requests.post(args.url, params=params,
+                             json=encode_push_envelope(args.email_address, args.history_id))
+    print(f"{response.status_code} {json.dumps(response.json()) if response.content else ''}")
+
+if __name__ == '__main__':
+    main()
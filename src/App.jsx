@@ -11,6 +11,7 @@ function App() {
     return savedEmailData ? JSON.parse(savedEmailData) : { threads: [], individual_emails: [], total_count: 0 }
   })
   const [loading, setLoading] = useState(false)
+  const [loadingMore, setLoadingMore] = useState(false)
   const [error, setError] = useState(null)
   const [serverStatus, setServerStatus] = useState('checking')
   const [selectedEmail, setSelectedEmail] = useState(null)
@@ -35,39 +36,53 @@ function App() {
     localStorage.setItem('expanded_threads', JSON.stringify(expandedThreads))
   }, [expandedThreads])
 
-  // Poll for new emails every 30 seconds
+  // Apply mailbox changes pushed by the server as they happen
   useEffect(() => {
     if (!user) return
 
-    const checkNewEmails = async () => {
-      try {
-        const response = await fetch('http://localhost:5001/check-new-emails', {
-          method: 'GET',
-          headers: {
-            'Accept': 'application/json',
-            'Content-Type': 'application/json',
-          },
-          credentials: 'include',
-        })
-
-        if (!response.ok) {
-          throw new Error(`HTTP error! status: ${response.status}`)
-        }
-
-        const data = await response.json()
-        if (data.has_new && data.updated_threads) {
-          // For now, we'll refetch all emails when new emails arrive
-          // In a more sophisticated implementation, we'd merge new emails into existing data
-          fetchEmails()
+    const applyDelta = (delta) => {
+      const updatedIds = new Set(delta.updated_threads.map(thread => thread.threadId))
+      const removedIds = new Set([...delta.deleted_thread_ids, ...updatedIds])
+      // Like fetch_emails, a thread with a single message is shown as an individual email
+      const updatedThreads = delta.updated_threads.filter(thread => thread.message_count !== 1)
+      const updatedEmails = delta.updated_threads
+        .filter(thread => thread.message_count === 1)
+        .map(thread => thread.messages[0])
+      setEmailData(prev => {
+        const threads = [
+          ...updatedThreads,
+          ...prev.threads.filter(thread => !removedIds.has(thread.threadId))
+        ]
+        const threadMessageIds = new Set(threads.flatMap(thread => thread.messages.map(message => message.id)))
+        const updatedEmailIds = new Set(updatedEmails.map(email => email.id))
+        const individualEmails = [
+          ...updatedEmails,
+          ...prev.individual_emails.filter(
+            email => !removedIds.has(email.threadId) && !threadMessageIds.has(email.id) && !updatedEmailIds.has(email.id)
+          )
+        ]
+        return {
+          ...prev,
+          threads,
+          individual_emails: individualEmails,
+          total_count: threads.length + individualEmails.length
         }
-        setLastCheck(Date.now())
-      } catch (err) {
-        console.error('Error checking for new emails:', err)
-      }
+      })
     }
 
-    const interval = setInterval(checkNewEmails, 30000) // Check every 30 seconds
-    return () => clearInterval(interval)
+    const events = new EventSource('http://localhost:5001/events', { withCredentials: true })
+    events.addEventListener('delta', (event) => {
+      applyDelta(JSON.parse(event.data))
+      setLastCheck(Date.now())
+    })
+    events.addEventListener('resync', () => {
+      fetchEmails()
+    })
+    events.onerror = (err) => {
+      // EventSource reconnects on its own
+      console.error('Mailbox event stream error:', err)
+    }
+    return () => events.close()
   }, [user])
 
   // Clear data from localStorage on logout
@@ -92,14 +107,38 @@ function App() {
     }))
   }
 
+  // Open a message, loading its body first if the list was fetched without bodies
+  const openEmail = async (email) => {
+    setSelectedEmail(email)
+    if (email.body != null && !email.body_truncated) return
+    try {
+      const response = await fetch(`http://localhost:5001/message/${email.id}/body`, {
+        method: 'GET',
+        headers: {
+          'Accept': 'application/json',
+          'Content-Type': 'application/json',
+        },
+        credentials: 'include',
+      })
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`)
+      }
+      const content = await response.json()
+      setSelectedEmail(prev => (prev && prev.id === email.id ? { ...prev, ...content, body_truncated: false } : prev))
+    } catch (err) {
+      console.error('Error loading message body:', err)
+      setSelectedEmail(prev => (prev && prev.id === email.id ? { ...prev, body: '', body_type: 'plain' } : prev))
+    }
+  }
+
   // Handle selecting a message from a thread
   const handleSelectMessage = (message) => {
-    setSelectedEmail(message)
+    openEmail(message)
   }
 
   // Handle selecting an individual email
   const handleSelectEmail = (email) => {
-    setSelectedEmail(email)
+    openEmail(email)
   }
 
   // Format date for email list
@@ -188,11 +227,55 @@ function App() {
     }
   }
 
+  // Resolve sender photos in one bulk request after the inbox has rendered
+  const loadSenderPhotos = async (data) => {
+    const messages = [
+      ...(data.threads || []).flatMap(thread => thread.messages),
+      ...(data.individual_emails || [])
+    ]
+    const senders = [...new Set(messages.map(message => message.sender_email).filter(Boolean))]
+    if (senders.length === 0) return
+
+    try {
+      const response = await fetch('http://localhost:5001/sender-photos', {
+        method: 'POST',
+        headers: {
+          'Accept': 'application/json',
+          'Content-Type': 'application/json',
+        },
+        credentials: 'include',
+        body: JSON.stringify({ emails: senders }),
+      })
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`)
+      }
+      const { photos } = await response.json()
+      const withPhoto = (message) => {
+        const photo = message.sender_email && photos[message.sender_email.toLowerCase()]
+        return photo ? { ...message, sender_photo: photo } : message
+      }
+      setEmailData(prev => ({
+        ...prev,
+        threads: prev.threads.map(thread => {
+          const threadMessages = thread.messages.map(withPhoto)
+          return {
+            ...thread,
+            messages: threadMessages,
+            latest_sender_photo: threadMessages[0]?.sender_photo || thread.latest_sender_photo
+          }
+        }),
+        individual_emails: prev.individual_emails.map(withPhoto)
+      }))
+    } catch (err) {
+      console.error('Error loading sender photos:', err)
+    }
+  }
+
   const fetchEmails = async () => {
     setLoading(true)
     setError(null)
     try {
-      const response = await fetch('http://localhost:5001/fetch-emails', {
+      const response = await fetch('http://localhost:5001/fetch-emails?defer_photos=1&metadata_only=1&compact=1', {
         method: 'GET',
         headers: {
           'Accept': 'application/json',
@@ -209,6 +292,7 @@ function App() {
       const data = await response.json()
       setEmailData(data)
       setLastCheck(Date.now())
+      loadSenderPhotos(data)
     } catch (err) {
       console.error('Error fetching emails:', err)
       if (err.message.includes('Failed to fetch')) {
@@ -220,6 +304,48 @@ function App() {
     setLoading(false)
   }
 
+  // Fetch the next page and merge it into the current inbox
+  const loadMoreEmails = async () => {
+    if (!emailData.next_page_token || loadingMore) return
+    setLoadingMore(true)
+    try {
+      const params = new URLSearchParams({ defer_photos: '1', metadata_only: '1', compact: '1', pageToken: emailData.next_page_token })
+      const response = await fetch(`http://localhost:5001/fetch-emails?${params}`, {
+        method: 'GET',
+        headers: {
+          'Accept': 'application/json',
+          'Content-Type': 'application/json',
+        },
+        credentials: 'include',
+      })
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`)
+      }
+      const page = await response.json()
+      setEmailData(prev => {
+        const threadIds = new Set(prev.threads.map(thread => thread.threadId))
+        const threads = [...prev.threads, ...page.threads.filter(thread => !threadIds.has(thread.threadId))]
+        const threadMessageIds = new Set(threads.flatMap(thread => thread.messages.map(message => message.id)))
+        const emailIds = new Set(prev.individual_emails.map(email => email.id))
+        const individualEmails = [
+          ...prev.individual_emails,
+          ...page.individual_emails.filter(email => !emailIds.has(email.id))
+        ].filter(email => !threadMessageIds.has(email.id))
+        return {
+          ...prev,
+          threads,
+          individual_emails: individualEmails,
+          total_count: threads.length + individualEmails.length,
+          next_page_token: page.next_page_token
+        }
+      })
+      loadSenderPhotos(page)
+    } catch (err) {
+      console.error('Error loading more emails:', err)
+    }
+    setLoadingMore(false)
+  }
+
   // Combine and sort all items newest-first
   const getSortedItems = () => {
     const threads = emailData.threads.map(thread => ({
@@ -370,6 +496,17 @@ function App() {
                 </li>
               )}
             </ul>
+            {emailData.next_page_token && (
+              <div className="px-4 py-3 text-center border-t border-gray-200">
+                <button
+                  onClick={loadMoreEmails}
+                  disabled={loadingMore}
+                  className="text-sm font-medium text-blue-600 hover:text-blue-800 disabled:opacity-50"
+                >
+                  {loadingMore ? 'Loading...' : 'Load more'}
+                </button>
+              </div>
+            )}
           </div>
         </div>
       </div>
@@ -44,7 +44,7 @@ beforeAll(() => {
         json: () => Promise.resolve({ user: mockUser })
       });
     }
-    if (url.endsWith('/fetch-emails')) {
+    if (url.includes('/fetch-emails')) {
       return Promise.resolve({
         ok: true,
         json: () => Promise.resolve(mockEmails)
@@ -114,7 +114,7 @@ test('shows error if fetch-emails fails', async () => {
         json: () => Promise.resolve({ user: mockUser })
       });
     }
-    if (url.endsWith('/fetch-emails')) {
+    if (url.includes('/fetch-emails')) {
       return Promise.resolve({
         ok: false,
         json: () => Promise.resolve({ error: 'Server error' })
@@ -156,9 +156,11 @@ function EmailModal({ email, onClose }) {
             </div>
             <div className="flex justify-center">
               <div style={gmailBodyStyles} className="prose max-w-none">
-                {email.body_type === 'html'
-                  ? <div dangerouslySetInnerHTML={{ __html: DOMPurify.sanitize(gmailHtml(email.body)) }} />
-                  : linkifyWithImages(email.body)
+                {email.body == null
+                  ? <div className="text-gray-500">Loading message...</div>
+                  : email.body_type === 'html'
+                    ? <div dangerouslySetInnerHTML={{ __html: DOMPurify.sanitize(gmailHtml(email.body)) }} />
+                    : linkifyWithImages(email.body)
                 }
               </div>
             </div>
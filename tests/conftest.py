@@ -1,3 +1,35 @@
 import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from utils import api_scheduler, credential_manager, gmail_watch, single_flight, thread_cache
+
+@pytest.fixture(autouse=True)
+def fresh_thread_cache(monkeypatch):
+    """Give each test an empty thread cache, so threads never leak between tests' stores."""
+    monkeypatch.setattr(thread_cache, '_thread_cache', thread_cache.ThreadCache())
+
+@pytest.fixture(autouse=True)
+def fresh_api_scheduler(monkeypatch):
+    """Give each test full quota buckets and no recorded retries."""
+    monkeypatch.setattr(api_scheduler, '_api_scheduler', api_scheduler.ApiScheduler())
+
+@pytest.fixture(autouse=True)
+def fresh_single_flight(monkeypatch):
+    """Keep one test's inbox fetch from answering another's within the grace window."""
+    monkeypatch.setattr(single_flight, '_single_flight', single_flight.SingleFlight())
+
+@pytest.fixture(autouse=True)
+def fresh_credential_manager(monkeypatch):
+    """Keep credentials shared by one test's requests away from the next test."""
+    manager = credential_manager.CredentialManager()
+    monkeypatch.setattr(credential_manager, '_credential_manager', manager)
+    yield
+    manager.stop()
+
+@pytest.fixture(autouse=True)
+def fresh_watch_manager(monkeypatch):
+    """Keep watch leases and sync cursors in memory rather than in the working directory."""
+    monkeypatch.setattr(gmail_watch, '_watch_manager', gmail_watch.WatchLeaseManager(':memory:'))
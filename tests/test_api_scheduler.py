@@ -0,0 +1,90 @@
+import json
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from utils.api_scheduler import ApiScheduler, parse_retry_after
+
+def http_error(status, reason=None, retry_after=None):
+    headers = {'status': status}
+    if retry_after is not None:
+        headers['retry-after'] = retry_after
+    body = {'error': {'code': status, 'message': 'error',
+                      'errors': [{'reason': reason}] if reason else []}}
+    return HttpError(httplib2.Response(headers), json.dumps(body).encode())
+
+class FakeClock:
+    """A monotonic clock that only moves when the scheduler sleeps."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+def make_scheduler(**kwargs):
+    clock = FakeClock()
+    return ApiScheduler(sleep=clock.sleep, clock=clock, **kwargs), clock.sleeps
+
+def failing_then_ok(*errors):
+    remaining = list(errors)
+
+    def send():
+        if remaining:
+            raise remaining.pop(0)
+        return 'ok'
+    return send
+
+def test_calls_beyond_the_users_quota_are_paced():
+    scheduler, sleeps = make_scheduler(limits={'gmail': (10, 20)})
+
+    for _ in range(2):
+        scheduler.execute('user', 'gmail.users.threads.get', lambda: 'ok')
+    assert sleeps == []
+    scheduler.execute('user', 'gmail.users.threads.get', lambda: 'ok')
+    assert sleeps == [1.0]
+    # Other users have their own bucket
+    scheduler.execute('other-user', 'gmail.users.threads.get', lambda: 'ok')
+    assert len(sleeps) == 1
+
+    stats = scheduler.get_stats()
+    assert (stats['calls'], stats['quota_units'], stats['throttled'], stats['buckets']) == (4, 40, 1, 2)
+
+def test_rate_limits_are_retried_honouring_retry_after():
+    scheduler, sleeps = make_scheduler()
+    send = failing_then_ok(http_error(429, retry_after='3'), http_error(403, 'userRateLimitExceeded'))
+
+    assert scheduler.execute('user', 'gmail.users.messages.list', send) == 'ok'
+    assert 3 <= sleeps[0] <= 3.5
+    assert len(sleeps) == 2
+
+    stats = scheduler.get_stats()
+    assert (stats['rate_limited'], stats['retried'], stats['failed']) == (2, 2, 0)
+
+def test_permanent_errors_and_exhausted_retries_fail():
+    scheduler, sleeps = make_scheduler(max_retries=2)
+
+    with pytest.raises(HttpError):
+        scheduler.execute('user', 'gmail.users.threads.get', failing_then_ok(http_error(404)))
+    assert sleeps == []
+
+    with pytest.raises(HttpError):
+        scheduler.execute('user', 'gmail.users.threads.get', failing_then_ok(*[http_error(503)] * 3))
+    assert len(sleeps) == 2
+
+    # A Retry-After longer than the longest backoff fails instead of blocking the request
+    with pytest.raises(HttpError):
+        scheduler.execute('user', 'gmail.users.threads.get',
+                          failing_then_ok(http_error(429, retry_after='3600')))
+    assert scheduler.get_stats()['failed'] == 3
+
+def test_retry_after_accepts_seconds_and_dates():
+    assert parse_retry_after('7') == 7
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0
+    assert parse_retry_after('soon') is None
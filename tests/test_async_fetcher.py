@@ -0,0 +1,272 @@
+import asyncio
+import json
+
+import pytest
+
+import asgi
+import async_fetcher
+from async_fetcher import GMAIL_API_URL, AsyncGmailClient, fetch_emails_async
+from utils import message_store
+from utils.message_store import MessageStore
+
+def gmail_message(message_id, thread_id, timestamp):
+    return {
+        'id': message_id,
+        'threadId': thread_id,
+        'historyId': '1',
+        'labelIds': ['INBOX'],
+        'snippet': 'Hello',
+        'internalDate': str(timestamp),
+        'payload': {'mimeType': 'text/plain',
+                    'headers': [{'name': 'From', 'value': 'Ann <ann@example.com>'},
+                                {'name': 'Subject', 'value': f'Subject {thread_id}'}],
+                    'body': {'data': 'SGVsbG8='}}
+    }
+
+class FakeResponse:
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self.data = data
+        self.text = json.dumps(data)
+        self.headers = {}
+
+    def json(self):
+        return self.data
+
+class FakeGmailHttp:
+    """Serves Gmail REST paths from memory, tracking how many calls overlap."""
+
+    def __init__(self, thread_count):
+        self.threads = {
+            f't{index}': {'id': f't{index}', 'historyId': '5', 'messages': [
+                gmail_message(f't{index}-m{number}', f't{index}', 1000 * index + number)
+                for number in range(1 if index % 2 else 2)]}
+            for index in range(thread_count)
+        }
+        self.paths = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def get(self, url, params=None, headers=None):
+        path = url[len(GMAIL_API_URL) + 1:]
+        self.paths.append(path)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+
+        if path == 'profile':
+            return FakeResponse(200, {'historyId': '77'})
+        if path == 'threads':
+            return FakeResponse(200, {'threads': [{'id': thread_id, 'historyId': '5'}
+                                                  for thread_id in self.threads]})
+        if path == 'messages':
+            # m-solo has no listed thread, t1-m0 belongs to a listed thread
+            return FakeResponse(200, {'messages': [{'id': 'm-solo', 'threadId': 'solo'},
+                                                   {'id': 't1-m0', 'threadId': 't1'}]})
+        if path.startswith('threads/'):
+            return FakeResponse(200, self.threads[path.split('/', 1)[1]])
+        if path == 'messages/m-solo':
+            return FakeResponse(200, gmail_message('m-solo', 'solo', 99999))
+        return FakeResponse(404, {'error': 'not found'})
+
+class FakeCreds:
+    token = 'token'
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = MessageStore(str(tmp_path / 'messages.db'))
+    monkeypatch.setattr(message_store, '_message_store', store)
+    return store
+
+def test_fetch_emails_async_is_concurrent_bounded_and_uses_the_store(store):
+    http = FakeGmailHttp(thread_count=12)
+
+    async def run():
+        client = AsyncGmailClient(FakeCreds(), http, asyncio.Semaphore(4))
+        return await fetch_emails_async(client, 'user', max_results=12)
+
+    data = asyncio.run(run())
+    assert [thread['threadId'] for thread in data['threads']] == [f't{index}' for index in range(10, -1, -2)]
+    # Single-message threads and unthreaded messages are individual emails
+    assert {email['id'] for email in data['individual_emails']} == (
+        {f't{index}-m0' for index in range(1, 12, 2)} | {'m-solo'})
+    assert data['total_count'] == 13
+    assert 1 < http.max_in_flight <= 4
+
+    # Unchanged threads are served from the store on the next load
+    http.paths.clear()
+    asyncio.run(run())
+    assert not [path for path in http.paths if path.startswith('threads/')]
+
+def test_async_client_refreshes_a_rejected_token_once(monkeypatch):
+    from datetime import timedelta
+    from google.oauth2.credentials import Credentials
+    from utils.credential_manager import utcnow
+
+    creds = Credentials(token='old-token', refresh_token='refresh', token_uri='uri',
+                        client_id='client', client_secret='secret',
+                        expiry=utcnow() + timedelta(minutes=30))
+    refreshes = []
+
+    def refresh(self, request):
+        refreshes.append(self.token)
+        self.token = 'new-token'
+
+    monkeypatch.setattr(Credentials, 'refresh', refresh)
+
+    class RevokedTokenHttp:
+        def __init__(self):
+            self.tokens = []
+
+        async def get(self, url, params=None, headers=None):
+            token = headers['Authorization'].split(' ', 1)[1]
+            self.tokens.append(token)
+            if token != 'new-token':
+                return FakeResponse(401, {'error': 'invalid credentials'})
+            return FakeResponse(200, {'historyId': '1'})
+
+    http = RevokedTokenHttp()
+
+    async def run():
+        client = AsyncGmailClient(creds, http, asyncio.Semaphore(1), user_key='user')
+        return await client.get('profile')
+
+    # The token has not expired by the clock, yet Gmail turned it down
+    assert asyncio.run(run()) == {'historyId': '1'}
+    assert http.tokens == ['old-token', 'new-token']
+    assert refreshes == ['old-token']
+
+def test_asgi_serves_inbox_routes_on_the_async_pipeline(store, monkeypatch):
+    from backend import app as flask_app
+    http = FakeGmailHttp(thread_count=2)
+    monkeypatch.setattr(async_fetcher, 'get_loop_resources', lambda: (http, asyncio.Semaphore(4)))
+    monkeypatch.setattr(asgi, 'get_credentials', lambda: FakeCreds())
+    monkeypatch.setattr(asgi, 'ensure_watch', lambda creds, user_key: None)
+    photo_lookups = []
+
+    def fake_get_sender_photos(emails):
+        photo_lookups.append(emails)
+        return {email.lower(): f'https://photos/{email}' for email in emails}
+
+    monkeypatch.setattr(async_fetcher, 'get_sender_photos', fake_get_sender_photos)
+
+    flask_app.config['TESTING'] = True
+    with flask_app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['user'] = {'email': 'test@example.com', 'name': 'Test User'}
+        cookie = client.get_cookie('session')
+    headers = [(b'cookie', f'session={cookie.value}'.encode())]
+
+    async def call(path, extra_headers=(), query=b''):
+        scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query,
+                 'headers': headers + list(extra_headers)}
+        messages = []
+        sent = iter([{'type': 'http.request', 'body': b''}])
+
+        async def receive():
+            try:
+                return next(sent)
+            except StopIteration:
+                await asyncio.sleep(3600)
+
+        async def send(message):
+            messages.append(message)
+
+        await asgi.app(scope, receive, send)
+        start = messages[0]
+        body = b''.join(message.get('body', b'') for message in messages[1:])
+        return start['status'], dict(start['headers']), body
+
+    status, response_headers, body = asyncio.run(call('/fetch-threads', query=b'metadata_only=1'))
+    assert status == 200
+    assert [thread['threadId'] for thread in json.loads(body)] == ['t1', 't0']
+    etag = response_headers[b'etag']
+    # Photos are resolved unless ?defer_photos=1, as in the Flask views
+    assert {message.get('sender_photo') for thread in json.loads(body)
+            for message in thread['messages']} == {'https://photos/ann@example.com'}
+    assert photo_lookups
+
+    status, _, body = asyncio.run(call('/fetch-threads', [(b'if-none-match', etag)], b'metadata_only=1'))
+    assert status == 304 and body == b''
+
+    photo_lookups.clear()
+    status, deferred_headers, _ = asyncio.run(
+        call('/fetch-threads', query=b'metadata_only=1&defer_photos=1'))
+    assert status == 200 and not photo_lookups
+    assert deferred_headers[b'etag'] != etag
+
+    # Other routes go to the Flask app
+    status, _, body = asyncio.run(call('/'))
+    assert status == 200
+    assert json.loads(body) == {'status': 'Server is running'}
+
+    headers = []
+    status, _, _ = asyncio.run(call('/fetch-emails'))
+    assert status == 401
+
+def test_asgi_event_streams_hold_no_threads(monkeypatch):
+    import mail_events
+    from backend import app as flask_app
+    from async_fetcher import run_blocking
+
+    monkeypatch.setattr(mail_events, 'get_event_hub', lambda: hub)
+    monkeypatch.setattr(asgi, 'get_event_hub', lambda: hub)
+    monkeypatch.setattr(asgi, 'get_credentials', lambda: FakeCreds())
+    monkeypatch.setattr(mail_events.MailboxSyncLoop, 'start', lambda self: None)
+    hub = mail_events.MailboxEventHub()
+
+    flask_app.config['TESTING'] = True
+    with flask_app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['user'] = {'email': 'test@example.com', 'name': 'Test User'}
+        cookie = client.get_cookie('session')
+    scope = {'type': 'http', 'method': 'GET', 'path': '/events', 'query_string': b'',
+             'headers': [(b'cookie', f'session={cookie.value}'.encode())]}
+
+    async def run():
+        disconnect = asyncio.Event()
+        streams = []
+
+        async def open_stream():
+            messages = []
+            sent = iter([{'type': 'http.request', 'body': b''}])
+
+            async def receive():
+                try:
+                    return next(sent)
+                except StopIteration:
+                    await disconnect.wait()
+                    return {'type': 'http.disconnect'}
+
+            async def send(message):
+                messages.append(message)
+
+            streams.append(messages)
+            await asgi.app(scope, receive, send)
+
+        tasks = [asyncio.ensure_future(open_stream()) for _ in range(40)]
+        while hub.get_stats()['connections'] < 40:
+            await asyncio.sleep(0.01)
+
+        # Forty open streams leave the blocking pool free
+        started = asyncio.get_running_loop().time()
+        await run_blocking(lambda: None)
+        assert asyncio.get_running_loop().time() - started < 1
+
+        await asyncio.to_thread(hub.publish, 'test@example.com', {'type': 'resync'})
+        await asyncio.sleep(0.05)
+        disconnect.set()
+        await asyncio.gather(*tasks)
+        return streams
+
+    streams = asyncio.run(run())
+    start = streams[0][0]
+    headers = dict(start['headers'])
+    assert start['status'] == 200
+    assert headers[b'content-type'].startswith(b'text/event-stream')
+    assert b'content-length' not in headers
+    body = b''.join(message.get('body', b'') for message in streams[0][1:])
+    assert body.startswith(b'retry: 5000') and b'event: resync' in body
+    # Disconnected streams are unsubscribed
+    assert hub.get_stats() == {'users': 0, 'connections': 0}
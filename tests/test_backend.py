@@ -36,4 +36,381 @@ def test_fetch_emails_unauthorized(client):
     resp = client.get('/fetch-emails')
     assert resp.status_code == 401
     data = resp.get_json()
-    assert data['error'] == 'Unauthorized' 
\ No newline at end of file
+    assert data['error'] == 'Unauthorized' 
+
+def test_sender_photos_unauthorized(client):
+    resp = client.post('/sender-photos', json={'emails': ['a@example.com']})
+    assert resp.status_code == 401
+
+def test_sender_photos_returns_map(client, monkeypatch):
+    import backend
+    monkeypatch.setattr(backend, 'get_sender_photos',
+                        lambda emails: {email.lower(): None for email in emails})
+    with client.session_transaction() as sess:
+        sess['user'] = {'email': 'test@example.com', 'name': 'Test User'}
+
+    resp = client.post('/sender-photos', json={'emails': ['A@example.com']})
+    assert resp.status_code == 200
+    assert resp.get_json() == {'photos': {'a@example.com': None}}
+
+    resp = client.post('/sender-photos', json={'emails': 'a@example.com'})
+    assert resp.status_code == 400
+
+def test_fetch_emails_rejects_bad_page_args(client):
+    with client.session_transaction() as sess:
+        sess['user'] = {'email': 'test@example.com', 'name': 'Test User'}
+
+    assert client.get('/fetch-emails?limit=abc').status_code == 400
+    assert client.get('/fetch-emails?pageToken=not-a-cursor').status_code == 400
+
+def test_fetch_emails_passes_page_args(client, monkeypatch):
+    import backend
+    from gmail_fetcher import encode_page_cursor
+    calls = []
+
+    def fake_fetch_emails(max_results, enrich_photos, page_token, metadata_only=False):
+        calls.append((max_results, page_token, metadata_only))
+        return {'threads': [], 'individual_emails': [], 'total_count': 0, 'next_page_token': None}
+
+    monkeypatch.setattr(backend, 'fetch_emails', fake_fetch_emails)
+    with client.session_transaction() as sess:
+        sess['user'] = {'email': 'test@example.com', 'name': 'Test User'}
+
+    cursor = encode_page_cursor('threads-2', 'messages-2')
+    resp = client.get(f'/fetch-emails?limit=500&pageToken={cursor}&metadata_only=1')
+    assert resp.status_code == 200
+    assert calls == [(100, cursor, True)]
+
+def test_message_body(client, monkeypatch):
+    import backend
+    assert client.get('/message/m1/body').status_code == 401
+
+    bodies = {'m1': {'id': 'm1', 'body': 'Hello', 'body_type': 'plain', 'attachments': []}}
+    monkeypatch.setattr(backend, 'get_message_body', lambda message_id: bodies.get(message_id))
+    with client.session_transaction() as sess:
+        sess['user'] = {'email': 'test@example.com', 'name': 'Test User'}
+
+    resp = client.get('/message/m1/body')
+    assert resp.status_code == 200
+    assert resp.get_json()['body'] == 'Hello'
+    assert client.get('/message/m2/body').status_code == 404
+
+def test_message_body_of_an_unknown_message_is_a_404(client, monkeypatch):
+    import httplib2
+    import gmail_fetcher
+    from googleapiclient.errors import HttpError
+
+    class MissingMessageService:
+        def users(self):
+            return self
+
+        def messages(self):
+            return self
+
+        def get(self, userId, id):
+            return self
+
+        def execute(self):
+            raise HttpError(httplib2.Response({'status': 404}), b'{"error": {"code": 404}}')
+
+    monkeypatch.setattr(gmail_fetcher, 'get_gmail_service', lambda: (MissingMessageService(), None))
+    with client.session_transaction() as sess:
+        sess['user'] = {'email': 'test@example.com', 'name': 'Test User'}
+
+    resp = client.get('/message/unknown/body')
+    assert resp.status_code == 404
+    assert resp.get_json() == {'error': 'Message not found'}
+
+def test_fetch_job_emails_validates_cursor(client, monkeypatch):
+    import backend
+    monkeypatch.setattr(backend, 'fetch_job_emails', lambda *args, **kwargs: {
+        'emails': [], 'candidate_count': 0, 'matched_count': 0, 'next_page_token': None})
+    assert client.get('/fetch-job-emails').status_code == 401
+
+    with client.session_transaction() as sess:
+        sess['user'] = {'email': 'test@example.com', 'name': 'Test User'}
+
+    assert client.get('/fetch-job-emails').get_json()['matched_count'] == 0
+    assert client.get('/fetch-job-emails?pageToken=not-a-cursor').status_code == 400
+
+def test_fetch_job_emails_is_versioned_by_history_id(client, monkeypatch):
+    import backend
+    history = {'id': '100'}
+    fetches = []
+    monkeypatch.setattr(backend, 'get_gmail_service', lambda: (object(), object()))
+    monkeypatch.setattr(backend, 'get_history_id', lambda service: history['id'])
+    monkeypatch.setattr(backend, 'fetch_job_emails', lambda *args, **kwargs: fetches.append(1) or {
+        'emails': [], 'candidate_count': 0, 'matched_count': 0, 'next_page_token': None})
+    with client.session_transaction() as sess:
+        sess['user'] = {'email': 'test@example.com', 'name': 'Test User'}
+
+    etag = client.get('/fetch-job-emails').headers['ETag']
+    assert client.get('/fetch-job-emails', headers={'If-None-Match': etag}).status_code == 304
+
+    # A changed mailbox is not answered from the coalesced fetch of the old one
+    history['id'] = '101'
+    resp = client.get('/fetch-job-emails', headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] != etag
+    assert len(fetches) == 2
+
+def test_events_stream(client, monkeypatch):
+    import backend
+    from mail_events import MailboxEventHub, Subscription
+
+    class FakeHub(MailboxEventHub):
+        def subscribe(self, user_key, creds, history_id=None):
+            subscription = Subscription(user_key)
+            subscription.put({'type': 'delta', 'history_id': '2', 'updated_threads': [], 'deleted_thread_ids': ['t1']})
+            subscription.close()
+            return subscription
+
+    assert client.get('/events').status_code == 401
+
+    monkeypatch.setattr(backend, 'get_credentials', lambda: object())
+    monkeypatch.setattr(backend, 'get_event_hub', lambda: FakeHub())
+    with client.session_transaction() as sess:
+        sess['user'] = {'email': 'test@example.com', 'name': 'Test User'}
+
+    resp = client.get('/events')
+    assert resp.status_code == 200
+    assert resp.mimetype == 'text/event-stream'
+    assert 'event: delta\ndata: ' in resp.get_data(as_text=True)
+
+def test_gmail_push_wakes_the_users_sync_loop(client, monkeypatch, tmp_path):
+    import backend
+    from utils.gmail_watch import WatchLeaseManager, encode_push_envelope
+
+    manager = WatchLeaseManager(str(tmp_path / 'leases.db'))
+    manager.set_lease('test@example.com', 'me@gmail.com', 'topic', '1', 0)
+    notified = []
+    synced_once = []
+
+    class FakeHub:
+        has_loop = True
+
+        def notify(self, user_key):
+            notified.append(user_key)
+            return self.has_loop
+
+        def sync_once(self, user_key, creds):
+            synced_once.append((user_key, creds.token))
+
+    hub = FakeHub()
+    monkeypatch.setattr(backend, 'get_watch_manager', lambda: manager)
+    monkeypatch.setattr(backend, 'get_event_hub', lambda: hub)
+
+    resp = client.post('/gmail/push', json=encode_push_envelope('me@gmail.com', '7'))
+    assert resp.status_code == 200
+    assert resp.get_json() == {'user_found': True, 'synced': True}
+    assert notified == ['test@example.com']
+    assert synced_once == []
+
+    # Without a sync loop the mailbox is synced once with the stored credentials
+    hub.has_loop = False
+    resp = client.post('/gmail/push', json=encode_push_envelope('me@gmail.com', '7'))
+    assert resp.get_json() == {'user_found': True, 'synced': False}
+    backend.get_credential_manager().get_credentials('test@example.com', {
+        'token': 'stored', 'refresh_token': 'refresh', 'token_uri': 'uri', 'client_id': 'id',
+        'client_secret': 'secret', 'scopes': [], 'expiry': '2999-01-01T00:00:00'})
+    resp = client.post('/gmail/push', json=encode_push_envelope('me@gmail.com', '7'))
+    assert resp.get_json() == {'user_found': True, 'synced': True}
+    assert synced_once == [('test@example.com', 'stored')]
+
+    # A notification the stored cursor has already passed needs no sync
+    manager.record_history_id('test@example.com', '9')
+    resp = client.post('/gmail/push', json=encode_push_envelope('me@gmail.com', '8'))
+    assert resp.get_json() == {'user_found': True, 'synced': False}
+    assert len(synced_once) == 1
+
+    resp = client.post('/gmail/push', json=encode_push_envelope('other@gmail.com', '7'))
+    assert resp.get_json() == {'user_found': False, 'synced': False}
+    assert client.post('/gmail/push', json={'message': {}}).status_code == 400
+
+    monkeypatch.setenv('GMAIL_PUSH_TOKEN', 'secret')
+    assert client.post('/gmail/push', json=encode_push_envelope('me@gmail.com', '8')).status_code == 403
+    resp = client.post('/gmail/push?token=secret', json=encode_push_envelope('me@gmail.com', '8'))
+    assert resp.status_code == 200
+
+def test_fetch_emails_and_threads_honour_if_none_match(client, monkeypatch):
+    import backend
+    history = {'id': '100'}
+    fetches = []
+
+    monkeypatch.setattr(backend, 'get_gmail_service', lambda: (object(), object()))
+    monkeypatch.setattr(backend, 'get_history_id', lambda service: history['id'])
+    monkeypatch.setattr(backend, 'fetch_emails', lambda *args, **kwargs: fetches.append('emails') or {
+        'threads': [], 'individual_emails': [], 'total_count': 0, 'next_page_token': None})
+    monkeypatch.setattr(backend, 'fetch_threads_page', lambda *args, **kwargs: fetches.append('threads') or ([], None))
+    with client.session_transaction() as sess:
+        sess['user'] = {'email': 'test@example.com', 'name': 'Test User'}
+
+    for path in ['/fetch-emails', '/fetch-threads']:
+        resp = client.get(path)
+        assert resp.status_code == 200
+        etag = resp.headers['ETag']
+        assert resp.headers['Cache-Control'] == 'private, no-cache'
+
+        # Unchanged mailbox: no fetch and no body
+        resp = client.get(path, headers={'If-None-Match': etag})
+        assert resp.status_code == 304
+        assert resp.data == b''
+        assert resp.headers['ETag'] == etag
+
+        # Different page parameters get a different validator
+        assert client.get(f'{path}?limit=20', headers={'If-None-Match': etag}).status_code == 200
+
+        history['id'] = str(int(history['id']) + 1)
+        resp = client.get(path, headers={'If-None-Match': etag})
+        assert resp.status_code == 200
+        assert resp.headers['ETag'] != etag
+
+    assert fetches == ['emails'] * 3 + ['threads'] * 3
+
+def test_conditional_fetch_makes_no_gmail_call_while_the_watch_is_live(client, monkeypatch):
+    import time
+    import backend
+    from utils.gmail_watch import encode_push_envelope, get_watch_manager
+
+    monkeypatch.setenv('GMAIL_NOTIFICATION_TOPIC', 'topic')
+    watch_manager = get_watch_manager()
+    watch_manager.set_lease('test@example.com', 'me@gmail.com', 'topic', '100', time.time() + 3600)
+    profile_calls = []
+    monkeypatch.setattr(backend, 'get_gmail_service', lambda: profile_calls.append(1) or (object(), object()))
+    monkeypatch.setattr(backend, 'get_history_id', lambda service: profile_calls.append(1) or '100')
+    monkeypatch.setattr(backend, 'fetch_emails', lambda *args, **kwargs: {
+        'threads': [], 'individual_emails': [], 'total_count': 0, 'next_page_token': None})
+    monkeypatch.setattr(backend.get_event_hub(), 'notify', lambda user_key: True)
+    with client.session_transaction() as sess:
+        sess['user'] = {'email': 'test@example.com', 'name': 'Test User'}
+
+    etag = client.get('/fetch-emails').headers['ETag']
+    assert client.get('/fetch-emails', headers={'If-None-Match': etag}).status_code == 304
+    assert profile_calls == []
+
+    # A pushed change gives the inbox a new validator straight away
+    client.post('/gmail/push', json=encode_push_envelope('me@gmail.com', '101'))
+    resp = client.get('/fetch-emails', headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] != etag
+    assert profile_calls == []
+
+def test_failed_fetch_is_not_cached_as_an_empty_inbox(client, monkeypatch):
+    import backend
+    import gmail_fetcher
+    history = {'id': '99'}
+    attempts = []
+
+    def failing_credentials():
+        attempts.append(history['id'])
+        raise RuntimeError('Gmail unavailable')
+
+    monkeypatch.setattr(backend, 'get_gmail_service', lambda: (object(), object()))
+    monkeypatch.setattr(backend, 'get_history_id', lambda service: history['id'])
+    monkeypatch.setattr(backend, 'fetch_emails', lambda *args, **kwargs: {
+        'threads': [], 'individual_emails': [], 'total_count': 0, 'next_page_token': None})
+    with client.session_transaction() as sess:
+        sess['user'] = {'email': 'test@example.com', 'name': 'Test User'}
+    etag = client.get('/fetch-emails').headers['ETag']
+
+    # The mailbox changes and the next fetch fails upstream
+    history['id'] = '100'
+    monkeypatch.setattr(backend, 'fetch_emails', gmail_fetcher.fetch_emails)
+    monkeypatch.setattr(gmail_fetcher, 'get_credentials', failing_credentials)
+    resp = client.get('/fetch-emails', headers={'If-None-Match': etag})
+    assert resp.status_code == 500
+    assert 'ETag' not in resp.headers
+
+    # Nothing was cached for historyId 100: the next request fetches again
+    resp = client.get('/fetch-emails', headers={'If-None-Match': etag})
+    assert resp.status_code == 500
+    assert attempts == ['100', '100']
+
+def test_identical_inbox_fetches_are_coalesced(client, monkeypatch):
+    import backend
+    history = {'id': '100'}
+    fetches = []
+
+    monkeypatch.setattr(backend, 'get_gmail_service', lambda: (object(), object()))
+    monkeypatch.setattr(backend, 'get_history_id', lambda service: history['id'])
+    monkeypatch.setattr(backend, 'fetch_emails', lambda *args, **kwargs: fetches.append(args) or {
+        'threads': [], 'individual_emails': [], 'total_count': 0, 'next_page_token': None})
+    with client.session_transaction() as sess:
+        sess['user'] = {'email': 'test@example.com', 'name': 'Test User'}
+
+    # A second tab within the grace window shares the first fetch, whatever its ?compact=
+    assert client.get('/fetch-emails').status_code == 200
+    assert client.get('/fetch-emails?compact=1').status_code == 200
+    assert len(fetches) == 1
+
+    # Other parameters or a changed mailbox fetch again
+    client.get('/fetch-emails?limit=20')
+    history['id'] = '101'
+    client.get('/fetch-emails')
+    assert len(fetches) == 3
+
+def test_failed_inbox_fetch_is_not_shared_within_the_grace_window(client, monkeypatch):
+    import backend
+    import gmail_fetcher
+    attempts = []
+
+    def failing_credentials():
+        attempts.append(1)
+        raise RuntimeError('Gmail unavailable')
+
+    monkeypatch.setattr(backend, 'get_gmail_service', lambda: (object(), object()))
+    monkeypatch.setattr(backend, 'get_history_id', lambda service: '100')
+    monkeypatch.setattr(gmail_fetcher, 'get_credentials', failing_credentials)
+    with client.session_transaction() as sess:
+        sess['user'] = {'email': 'test@example.com', 'name': 'Test User'}
+
+    assert client.get('/fetch-emails').status_code == 500
+    assert client.get('/fetch-emails').status_code == 500
+    assert len(attempts) == 2
+
+def test_fetch_emails_compact_and_compressed(client, monkeypatch):
+    import gzip
+    import json
+    import backend
+    from gmail_fetcher import COMPACT_BODY_MAX_CHARS
+
+    def message(message_id, thread_id):
+        return {'id': message_id, 'threadId': thread_id, 'headers': {'From': 'a@example.com'},
+                'historyId': '9', 'sizeEstimate': 10, 'from': 'a@example.com', 'subject': 'Hi',
+                'body': '<p>' + 'x' * 5000 + '</p>', 'body_type': 'html', 'attachments': []}
+
+    email_data = {
+        'threads': [{'threadId': 't1', 'messages': [message('m1', 't1')]},
+                    {'threadId': 't2', 'messages': [message('m2', 't2')]}],
+        'individual_emails': [message('m3', 'm3')],
+        'total_count': 3,
+        'next_page_token': None
+    }
+    monkeypatch.setattr(backend, 'get_gmail_service', lambda: (object(), object()))
+    monkeypatch.setattr(backend, 'get_history_id', lambda service: '100')
+    monkeypatch.setattr(backend, 'fetch_emails', lambda *args, **kwargs: email_data)
+    with client.session_transaction() as sess:
+        sess['user'] = {'email': 'test@example.com', 'name': 'Test User'}
+
+    resp = client.get('/fetch-emails?compact=1&expanded=t2', headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in resp.headers['Vary']
+    etag = resp.headers['ETag']
+    assert etag.endswith('-gzip"')
+
+    data = json.loads(gzip.decompress(resp.data))
+    first, second = (thread['messages'][0] for thread in data['threads'])
+    assert 'headers' not in first and 'historyId' not in first and 'sizeEstimate' not in first
+    assert first['from'] == 'a@example.com'
+    assert first['body'] is None
+    # Expanded threads keep a truncated body
+    assert second['body_truncated'] and len(second['body']) == COMPACT_BODY_MAX_CHARS
+    assert data['individual_emails'][0]['body'] is None
+
+    # The compressed validator revalidates the unchanged response
+    assert client.get('/fetch-emails?compact=1&expanded=t2',
+                      headers={'If-None-Match': etag, 'Accept-Encoding': 'gzip'}).status_code == 304
+
+    resp = client.get('/fetch-emails', headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in resp.headers
+    assert resp.get_json()['threads'][0]['messages'][0]['headers'] == {'From': 'a@example.com'}
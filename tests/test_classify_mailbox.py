@@ -0,0 +1,136 @@
+import json
+import mailbox
+from email.message import EmailMessage
+
+import classify_mailbox
+from utils.mail_sources import iter_emails, iter_regions
+
+def write_jsonl(path, count):
+    with open(path, 'w') as f:
+        for index in range(count):
+            subject = 'Interview invitation' if index % 2 else 'Weekly newsletter'
+            f.write(json.dumps({'id': f'm{index}', 'subject': subject,
+                                'sender_email': f'user{index}@example.com',
+                                'from': f'User <user{index}@example.com>'}) + '\n')
+        f.write('not json\n')
+
+def read_results(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+def test_classifies_in_order_with_rule_hits(tmp_path):
+    source, output = tmp_path / 'mail.jsonl', tmp_path / 'results.jsonl'
+    write_jsonl(source, 25)
+
+    summary = classify_mailbox.classify_mailbox(str(source), str(output), workers=2, chunk_bytes=300)
+
+    results = read_results(output)
+    assert [result['index'] for result in results] == list(range(25))
+    assert [result['is_job_related'] for result in results] == [bool(index % 2) for index in range(25)]
+    assert summary['processed'] == summary['total_processed'] == 25
+    assert summary['total_matched'] == 12
+    assert summary['rule_hits']['Subject contains keyword: interview'] == 12
+
+    # A completed run has nothing left to do
+    summary = classify_mailbox.classify_mailbox(str(source), str(output), workers=2, chunk_bytes=300)
+    assert summary['processed'] == 0
+    assert len(read_results(output)) == 25
+
+def test_resumes_from_checkpoint(tmp_path):
+    source, output = tmp_path / 'mail.jsonl', tmp_path / 'results.jsonl'
+    write_jsonl(source, 10)
+    classify_mailbox.classify_mailbox(str(source), str(output), workers=1, chunk_bytes=200)
+    lines = output.read_bytes().splitlines(keepends=True)
+
+    # Simulate a crash after three results were checkpointed and part of a fourth was written
+    output.write_bytes(b''.join(lines[:3]) + b'{"index": 3, "trunc')
+    source_lines = source.read_bytes().splitlines(keepends=True)
+    checkpoint = {'processed': 3, 'source_offset': len(b''.join(source_lines[:3])),
+                  'output_offset': len(b''.join(lines[:3])), 'matched': 1,
+                  'rule_hits': {'Subject contains keyword: interview': 1}}
+    (tmp_path / 'results.jsonl.checkpoint').write_text(json.dumps(checkpoint))
+
+    summary = classify_mailbox.classify_mailbox(str(source), str(output), workers=2, chunk_bytes=200)
+
+    assert summary['resumed_from'] == 3
+    assert summary['processed'] == 7
+    assert output.read_bytes().splitlines(keepends=True) == lines
+    assert summary['total_matched'] == 5
+    assert summary['rule_hits']['Subject contains keyword: interview'] == 5
+
+def test_restarts_when_the_output_is_shorter_than_the_checkpoint(tmp_path):
+    source, output = tmp_path / 'mail.jsonl', tmp_path / 'results.jsonl'
+    write_jsonl(source, 10)
+    classify_mailbox.classify_mailbox(str(source), str(output), workers=1, chunk_bytes=200)
+    expected = output.read_bytes()
+
+    output.unlink()
+    summary = classify_mailbox.classify_mailbox(str(source), str(output), workers=2, chunk_bytes=200)
+
+    assert summary['resumed_from'] == 0
+    assert summary['processed'] == 10
+    assert output.read_bytes() == expected
+    assert summary['total_matched'] == 5
+
+def write_mbox(path, count):
+    box = mailbox.mbox(str(path))
+    for index in range(count):
+        message = EmailMessage()
+        message['From'] = f'User <user{index}@example.com>'
+        message['Subject'] = 'Interview invitation' if index % 2 else 'Weekly newsletter'
+        message['Message-ID'] = f'<m{index}@example.com>'
+        message.set_content('From the team\n' * (index % 4))
+        box.add(message)
+    box.flush()
+
+def test_byte_ranges_cover_every_email_once(tmp_path):
+    jsonl, mbox = tmp_path / 'mail.jsonl', tmp_path / 'mail.mbox'
+    write_jsonl(jsonl, 20)
+    write_mbox(mbox, 20)
+
+    for path in [jsonl, mbox]:
+        source_format = 'mbox' if path == mbox else 'jsonl'
+        for region_size in [1, 150, 1000, 10 ** 6]:
+            regions = list(iter_regions(str(path), source_format, region_size))
+            assert regions[0][0] == 0 and regions[-1][1] == path.stat().st_size
+            assert all(end == next_start for (_, end), (next_start, _) in zip(regions, regions[1:]))
+            emails = [email for start, end in regions
+                      for email in iter_emails(str(path), source_format, start, end)]
+            assert emails == list(iter_emails(str(path)))
+
+def test_workers_parse_mbox_sources(tmp_path):
+    source, output = tmp_path / 'mail.mbox', tmp_path / 'results.jsonl'
+    write_mbox(source, 9)
+
+    summary = classify_mailbox.classify_mailbox(str(source), str(output), workers=2, chunk_bytes=500)
+
+    results = read_results(output)
+    assert [result['index'] for result in results] == list(range(9))
+    assert [result['id'] for result in results] == [f'm{index}@example.com' for index in range(9)]
+    assert summary['total_matched'] == 4
+
+    # A checkpoint without a source offset cannot be resumed from
+    checkpoint_path = tmp_path / 'results.jsonl.checkpoint'
+    checkpoint = json.loads(checkpoint_path.read_text())
+    del checkpoint['source_offset']
+    checkpoint_path.write_text(json.dumps(checkpoint))
+    summary = classify_mailbox.classify_mailbox(str(source), str(output), workers=1, chunk_bytes=500)
+    assert summary['resumed_from'] == 0
+    assert read_results(output) == results
+
+def test_mbox_source(tmp_path):
+    path = tmp_path / 'mail.mbox'
+    box = mailbox.mbox(str(path))
+    message = EmailMessage()
+    message['From'] = 'Recruiter <jobs@mail.greenhouse.io>'
+    message['Subject'] = '=?utf-8?q?Your_application?='
+    message['Message-ID'] = '<abc@example.com>'
+    message.set_content('Thanks for applying')
+    box.add(message)
+    box.flush()
+
+    emails = list(iter_emails(str(path)))
+
+    assert emails[0]['id'] == 'abc@example.com'
+    assert emails[0]['subject'] == 'Your application'
+    assert emails[0]['sender_email'] == 'jobs@mail.greenhouse.io'
@@ -0,0 +1,73 @@
+from utils.contacts_index import ContactsIndex
+
+def person(resource_name, email, url, deleted=False):
+    return {
+        'resourceName': resource_name,
+        'emailAddresses': [{'value': email}],
+        'photos': [{'url': url, 'metadata': {'primary': True}}],
+        'metadata': {'deleted': deleted}
+    }
+
+class FakePeopleService:
+    """Serves connections.list pages and records every call."""
+
+    def __init__(self, pages, sync_pages=None):
+        self.pages = pages
+        self.sync_pages = sync_pages or []
+        self.calls = []
+
+    def people(self):
+        return self
+
+    def connections(self):
+        return self
+
+    def list(self, **params):
+        self.calls.append(params)
+        pages = self.sync_pages if 'syncToken' in params else self.pages
+        index = int(params.get('pageToken', 0))
+        page = {'connections': pages[index]}
+        if index + 1 < len(pages):
+            page['nextPageToken'] = str(index + 1)
+        else:
+            page['nextSyncToken'] = f'sync-{len(self.calls)}'
+        return FakeRequest(page)
+
+class FakeRequest:
+    def __init__(self, page):
+        self.page = page
+
+    def execute(self):
+        return self.page
+
+def test_index_loads_all_pages_once():
+    service = FakePeopleService([
+        [person('people/1', 'Ada@example.com', 'ada.png')],
+        [person('people/2', 'bob@example.com', 'bob.png')]
+    ])
+    index = ContactsIndex(ttl=60)
+
+    index.ensure_fresh(service)
+    index.ensure_fresh(service)
+
+    assert len(service.calls) == 2
+    assert index.get_photo('ada@example.com') == 'ada.png'
+    assert index.get_photo('bob@example.com') == 'bob.png'
+    assert index.get_photo('nobody@example.com') is None
+
+def test_stale_index_syncs_incrementally():
+    service = FakePeopleService(
+        [[person('people/1', 'ada@example.com', 'ada.png'),
+          person('people/2', 'bob@example.com', 'bob.png')]],
+        sync_pages=[[person('people/1', 'ada@example.com', 'ada-new.png'),
+                     person('people/2', 'bob@example.com', 'bob.png', deleted=True)]]
+    )
+    index = ContactsIndex(ttl=60)
+    index.ensure_fresh(service)
+
+    index.synced_at -= 61
+    index.ensure_fresh(service)
+
+    assert service.calls[-1]['syncToken'] == 'sync-1'
+    assert index.get_photo('ada@example.com') == 'ada-new.png'
+    assert index.get_photo('bob@example.com') is None
@@ -0,0 +1,80 @@
+import threading
+import time
+from datetime import timedelta
+
+from flask import Flask, session
+from google.oauth2.credentials import Credentials
+
+import gmail_fetcher
+from utils.credential_manager import CredentialManager, get_credential_manager, utcnow
+
+def make_token_data(token='old-token', expiry=None):
+    return {'token': token, 'refresh_token': 'refresh', 'token_uri': 'https://oauth2.example.com/token',
+            'client_id': 'client', 'client_secret': 'secret', 'scopes': ['gmail.readonly'],
+            'expiry': expiry.isoformat() if expiry else None}
+
+def fake_refresh(monkeypatch, delay=0.0):
+    """Make Credentials.refresh hand out a new one-hour token, counting the calls."""
+    refreshes = []
+
+    def refresh(self, request):
+        time.sleep(delay)
+        refreshes.append(self.token)
+        self.token = f'token-{len(refreshes)}'
+        self.expiry = utcnow() + timedelta(hours=1)
+
+    monkeypatch.setattr(Credentials, 'refresh', refresh)
+    return refreshes
+
+def test_concurrent_requests_refresh_an_expired_token_once(monkeypatch):
+    refreshes = fake_refresh(monkeypatch, delay=0.05)
+    manager = CredentialManager(request_factory=object)
+    token_data = make_token_data(expiry=utcnow() - timedelta(minutes=1))
+
+    tokens = []
+    workers = [threading.Thread(target=lambda: tokens.append(
+        manager.get_credentials('user', token_data).token)) for _ in range(8)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    manager.stop()
+
+    assert refreshes == ['old-token']
+    assert tokens == ['token-1'] * 8
+    assert manager.get_stats() == {'refreshes': 1, 'background_refreshes': 0,
+                                   'refresh_failures': 0, 'users': 1}
+
+def test_refreshed_tokens_are_written_back_to_the_session(monkeypatch):
+    refreshes = fake_refresh(monkeypatch)
+    app = Flask(__name__)
+    app.secret_key = 'test'
+
+    with app.test_request_context():
+        session['user'] = {'email': 'me@example.com'}
+        session['google_token'] = make_token_data(expiry=utcnow() - timedelta(minutes=1))
+        creds = gmail_fetcher.get_credentials()
+
+        assert session['google_token']['token'] == 'token-1'
+        assert session['google_token']['expiry'] == creds.expiry.isoformat()
+        # The next request uses the stored token without a round trip
+        assert gmail_fetcher.get_credentials().token == 'token-1'
+    assert refreshes == ['old-token']
+
+def test_background_refresh_renews_tokens_before_they_expire(monkeypatch):
+    refreshes = fake_refresh(monkeypatch)
+    manager = get_credential_manager()
+    manager.get_credentials('expiring', make_token_data('expiring-token', utcnow() + timedelta(minutes=4, seconds=30)))
+    manager.get_credentials('fresh', make_token_data('fresh-token', utcnow() + timedelta(minutes=50)))
+    # Unknown expiry is left to the API client's 401 retry
+    manager.get_credentials('unknown', make_token_data('unknown-token'))
+    assert refreshes == []
+
+    manager.refresh_expiring()
+    assert refreshes == ['expiring-token']
+    assert manager.get_stats()['background_refreshes'] == 1
+
+    # Users idle for longer than the timeout are no longer kept fresh
+    manager.idle_timeout = 0
+    manager.refresh_expiring()
+    assert manager.get_stats()['users'] == 0
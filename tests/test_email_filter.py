@@ -94,6 +94,119 @@ def test_filter_configuration():
     
     return True
 
+def reference_matches(job_filter, email):
+    """Rule-by-rule evaluation the compiled rule set has to agree with."""
+    subject = email['subject'].lower()
+    sender_email = email['sender_email'].lower()
+    from_header = email['from'].lower()
+    all_text = f"{subject} {sender_email} {from_header}"
+    matched = []
+    for rule in job_filter.rules:
+        if rule.rule_type == 'keyword':
+            is_match = job_filter.matches_keyword(subject, rule.pattern)
+        elif rule.rule_type == 'domain':
+            is_match = (job_filter.matches_domain(sender_email, rule.pattern) or
+                        job_filter.matches_domain(from_header, rule.pattern))
+        else:
+            is_match = job_filter.matches_regex(all_text, rule.pattern)
+        if is_match:
+            matched.append(rule.description)
+    return matched
+
+def test_compiled_rules_match_rule_by_rule_evaluation():
+    """The compiled rule set returns the same matches, in rule order."""
+    job_filter = JobEmailFilter()
+    subjects = ['Your Application was received', 'Re: roles and recruitment', 'Lunch?',
+                'CVs wanted: JOB opening', 'careers@ newsletter', 'Interviewing for the position', '']
+    senders = ['jobs@linkedin.com', 'no-reply@mail.greenhouse.io', 'friend@example.com',
+               'alerts@notlinkedin.com', 'team@lever.co']
+
+    for subject in subjects:
+        for sender in senders:
+            for from_header in [f'Someone <{sender}>', sender]:
+                email = {'subject': subject, 'sender_email': sender, 'from': from_header}
+                _, matched_rules = job_filter.filter_email(email)
+                assert [rule['description'] for rule in matched_rules] == reference_matches(job_filter, email)
+
+def baseline_filter_email(job_filter, email):
+    """The original rule-by-rule loop, which compares sender domains exactly."""
+    subject = email['subject'].lower()
+    sender_email = email['sender_email'].lower()
+    from_header = email['from'].lower()
+    all_text = f"{subject} {sender_email} {from_header}"
+    matched_rules = []
+    for rule in job_filter.rules:
+        if rule.rule_type == 'keyword':
+            is_match = rule.pattern in subject
+        elif rule.rule_type == 'domain':
+            is_match = (job_filter.extract_domain(sender_email) == rule.pattern or
+                        job_filter.extract_domain(from_header) == rule.pattern)
+        else:
+            is_match = job_filter.matches_regex(all_text, rule.pattern)
+        if is_match:
+            matched_rules.append({'rule_type': rule.rule_type, 'pattern': rule.pattern,
+                                  'confidence': rule.confidence, 'description': rule.description})
+    max_confidence = max(rule['confidence'] for rule in matched_rules) if matched_rules else 0
+    return bool(matched_rules) and max_confidence >= job_filter.settings['min_confidence'], matched_rules
+
+def test_exact_domain_matching_is_the_default_and_matches_the_baseline():
+    job_filter = JobEmailFilter()
+    assert not job_filter.settings['match_subdomains']
+    subjects = ['Hello', 'Interview invitation', 'Your application']
+    senders = ['jobs@linkedin.com', 'noreply@mail.linkedin.com', 'no-reply@us.greenhouse.io',
+               'alerts@notlinkedin.com', 'team@lever.co', 'friend@example.com']
+
+    for subject in subjects:
+        for sender in senders:
+            for from_header in [f'Someone <{sender}>', sender]:
+                email = {'subject': subject, 'sender_email': sender, 'from': from_header}
+                assert job_filter.filter_email(email) == baseline_filter_email(job_filter, email)
+
+def test_domain_rules_match_subdomains_when_enabled():
+    job_filter = JobEmailFilter()
+    email = {'subject': 'Hello', 'sender_email': 'noreply@mail.linkedin.com', 'from': 'LinkedIn'}
+    exact_hash = job_filter.config_hash
+    assert job_filter.filter_email(email) == (False, [])
+
+    job_filter.settings = dict(job_filter.settings, match_subdomains=True)
+    job_filter.reload_rules()
+    assert job_filter.config_hash != exact_hash
+    _, matched_rules = job_filter.filter_email(email)
+    assert [rule['pattern'] for rule in matched_rules] == ['linkedin.com']
+    assert job_filter.matches_domain('noreply@mail.linkedin.com', 'linkedin.com')
+
+    _, matched_rules = job_filter.filter_email(
+        {'subject': 'Hello', 'sender_email': 'noreply@notlinkedin.com', 'from': 'Not LinkedIn'})
+    assert matched_rules == []
+
+def test_classification_cache(monkeypatch):
+    job_filter = JobEmailFilter()
+    job_filter.cache.max_size = 2
+    email = {'id': 'm1', 'subject': 'Interview invitation', 'sender_email': 'a@example.com',
+             'from': 'A <a@example.com>'}
+
+    first = job_filter.filter_email(email)
+    assert job_filter.filter_email(email) == first
+    assert job_filter.cache.hits == 1 and job_filter.cache.misses == 1
+
+    # Changing the rules changes the key, so the cached result is not reused
+    job_filter.job_keywords = ['invitation']
+    job_filter.regex_patterns = []
+    job_filter.reload_rules()
+    is_job_related, matched_rules = job_filter.filter_email(email)
+    assert [rule['pattern'] for rule in matched_rules] == ['invitation']
+    assert job_filter.cache.misses == 2
+
+    job_filter.filter_email(dict(email, id='m2'))
+    stats = job_filter.get_filter_stats()['cache']
+    assert stats['evictions'] == 1
+    assert stats['size'] == 2
+    assert stats['hit_rate'] == 0.25
+
+    # Emails without an id are classified without caching
+    job_filter.filter_email(dict(email, id=None))
+    assert job_filter.cache.misses == 3
+
 if __name__ == "__main__":
     print("Running email filter tests...")
     print()
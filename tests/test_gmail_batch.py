@@ -0,0 +1,152 @@
+import json
+import math
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httplib2
+import pytest
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+
+from gmail_fetcher import batch_get_threads
+from utils import api_scheduler
+from utils.api_scheduler import ApiScheduler, scheduled_request_builder
+
+MISSING_THREAD = 'missing'
+# Answers 429 the first time it is requested
+RATE_LIMITED_THREAD = 'rate-limited'
+
+def thread_payload(thread_id):
+    return {'id': thread_id, 'messages': [{'id': f'{thread_id}-m1', 'threadId': thread_id}]}
+
+class FakeGmailHandler(BaseHTTPRequestHandler):
+    """Serves single thread GETs and the multipart batch endpoint."""
+
+    def log_message(self, *args):
+        pass
+
+    def _thread_response(self, path):
+        self.server.paths.append(path)
+        thread_id = path.split('?')[0].rstrip('/').split('/')[-1]
+        if thread_id == MISSING_THREAD:
+            return 404, {'error': {'code': 404, 'message': 'Not Found'}}
+        if thread_id == RATE_LIMITED_THREAD and thread_id not in self.server.rate_limited:
+            self.server.rate_limited.add(thread_id)
+            return 429, {'error': {'code': 429, 'message': 'Too many requests',
+                                   'errors': [{'reason': 'rateLimitExceeded'}]}}
+        return 200, thread_payload(thread_id)
+
+    def do_GET(self):
+        self.server.round_trips += 1
+        status, payload = self._thread_response(self.path)
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.server.round_trips += 1
+        raw = self.rfile.read(int(self.headers['Content-Length']))
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + raw)
+
+        boundary = 'fake_batch_boundary'
+        parts = []
+        for part in message.iter_parts():
+            request_line = part.get_payload(decode=True).decode().splitlines()[0]
+            status, payload = self._thread_response(request_line.split(' ')[1])
+            content_id = part['Content-ID'].strip('<>')
+            parts.append(
+                f'--{boundary}\r\n'
+                'Content-Type: application/http\r\n'
+                f'Content-ID: <response-{content_id}>\r\n\r\n'
+                f'HTTP/1.1 {status} OK\r\n'
+                'Content-Type: application/json\r\n\r\n'
+                f'{json.dumps(payload)}\r\n'
+            )
+        body = (''.join(parts) + f'--{boundary}--\r\n').encode()
+        self.send_response(200)
+        self.send_header('Content-Type', f'multipart/mixed; boundary={boundary}')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+@pytest.fixture
+def fake_gmail():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGmailHandler)
+    server.round_trips = 0
+    server.paths = []
+    server.rate_limited = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    document = json.loads(discovery_cache.get_static_doc('gmail', 'v1'))
+    document['rootUrl'] = f'http://127.0.0.1:{server.server_address[1]}/'
+    server.document = document
+    service = build_from_document(document, http=httplib2.Http())
+    yield server, service
+
+    server.shutdown()
+    server.server_close()
+
+@pytest.mark.parametrize('thread_count,batch_size', [(50, 50), (50, 20), (7, 3)])
+def test_batching_reduces_round_trips(fake_gmail, thread_count, batch_size):
+    server, service = fake_gmail
+    thread_ids = [f't{i}' for i in range(thread_count)]
+
+    threads = batch_get_threads(service, thread_ids, batch_size=1)
+    assert server.round_trips == thread_count
+    assert [t['id'] for t in threads] == thread_ids
+
+    server.round_trips = 0
+    server.paths = []
+    threads = batch_get_threads(service, thread_ids, batch_size=batch_size)
+    assert server.round_trips == math.ceil(thread_count / batch_size)
+    assert [t['id'] for t in threads] == thread_ids
+
+def test_batch_item_errors_are_isolated(fake_gmail):
+    server, service = fake_gmail
+    thread_ids = ['t1', MISSING_THREAD, 't2']
+
+    threads = batch_get_threads(service, thread_ids, batch_size=50)
+
+    assert server.round_trips == 1
+    assert [t['id'] for t in threads] == ['t1', 't2']
+
+def test_metadata_requests_ask_for_headers_only(fake_gmail):
+    server, service = fake_gmail
+
+    threads = batch_get_threads(service, ['t1', 't2'], batch_size=50, metadata_only=True)
+
+    assert [thread['id'] for thread in threads] == ['t1', 't2']
+    for path in server.paths:
+        assert 'format=metadata' in path
+        assert 'metadataHeaders=Subject' in path
+        assert 'fields=id%2ChistoryId%2Cmessages%28' in path
+
+def test_rate_limited_batch_calls_are_retried(fake_gmail, monkeypatch):
+    server, _ = fake_gmail
+    service = build_from_document(server.document, http=httplib2.Http(),
+                                  requestBuilder=scheduled_request_builder('user'))
+    now = [0.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    scheduler = ApiScheduler(sleep=sleep, clock=lambda: now[0])
+    monkeypatch.setattr(api_scheduler, '_api_scheduler', scheduler)
+
+    threads = batch_get_threads(service, ['t1', RATE_LIMITED_THREAD, 't2'], batch_size=50)
+
+    assert [t['id'] for t in threads] == ['t1', RATE_LIMITED_THREAD, 't2']
+    # One batch, then the rate-limited call alone after a backoff
+    assert server.round_trips == 2
+    assert len(sleeps) == 1
+    stats = scheduler.get_stats()
+    assert (stats['rate_limited'], stats['retried'], stats['quota_units']) == (1, 1, 40)
@@ -0,0 +1,100 @@
+import threading
+import time
+
+import gmail_fetcher
+
+class FakeRequest:
+    def __init__(self, service, thread_id):
+        self.service = service
+        self.thread_id = thread_id
+
+    def execute(self):
+        self.service.owners.add(threading.get_ident())
+        time.sleep(0.05)
+        if self.thread_id == 'broken':
+            raise Exception('boom')
+        timestamp = int(self.thread_id[1:])
+        return {
+            'id': self.thread_id,
+            'messages': [{
+                'id': f'{self.thread_id}-m1',
+                'threadId': self.thread_id,
+                'internalDate': str(timestamp),
+                'payload': {'headers': [{'name': 'Subject', 'value': self.thread_id}]}
+            }]
+        }
+
+class FakeGmailService:
+    def __init__(self):
+        self.owners = set()
+
+    def users(self):
+        return self
+
+    def threads(self):
+        return self
+
+    def get(self, userId, id):
+        return FakeRequest(self, id)
+
+def test_hydrate_threads_concurrent_and_newest_first(monkeypatch):
+    services = []
+
+    def fake_build_services(creds):
+        service = FakeGmailService()
+        services.append(service)
+        return service, None
+
+    monkeypatch.setattr(gmail_fetcher, 'build_services', fake_build_services)
+    thread_ids = ['t3', 't10', 'broken', 't7', 't1', 't5', 't2', 't8']
+
+    started = time.perf_counter()
+    threads = gmail_fetcher.hydrate_threads(thread_ids, creds=None, workers=4)
+    elapsed = time.perf_counter() - started
+
+    assert [t['threadId'] for t in threads] == ['t10', 't8', 't7', 't5', 't3', 't2', 't1']
+    # Eight 50ms waits spread over four workers, not summed
+    assert elapsed < 0.3
+    # Every worker built its own service and never shared it
+    assert len(services) == 4
+    assert all(len(service.owners) == 1 for service in services)
+
+def make_message(index, sender):
+    return {
+        'id': f'm{index}',
+        'threadId': 't1',
+        'internalDate': str(1000 + index),
+        'payload': {'mimeType': 'text/plain', 'body': {'data': 'SGk='}, 'headers': [
+            {'name': 'From', 'value': f'{sender.title()} <{sender}@example.com>'},
+            {'name': 'To', 'value': 'me@example.com'},
+            {'name': 'Subject', 'value': 'No Subject' if index == 29 else 'Offer'}
+        ]}
+    }
+
+def test_thread_content_parses_once_and_dedups_senders(monkeypatch):
+    parsed = []
+    lookups = []
+    original_get_email_content = gmail_fetcher.get_email_content
+
+    def counting_get_email_content(message, include_body=True):
+        parsed.append(message['id'])
+        return original_get_email_content(message, include_body)
+
+    def fake_get_company_logo(email):
+        lookups.append(email)
+        return f'https://logo.example/{email}'
+
+    monkeypatch.setattr(gmail_fetcher, 'get_email_content', counting_get_email_content)
+    monkeypatch.setattr(gmail_fetcher, 'get_profile_photo', lambda service, email, contacts=None: None)
+    monkeypatch.setattr(gmail_fetcher, 'get_company_logo', fake_get_company_logo)
+    messages = [make_message(index, 'ann' if index % 3 else 'bob') for index in range(30)]
+
+    thread = gmail_fetcher.get_thread_content({'id': 't1', 'messages': messages}, people_service=object())
+
+    assert sorted(parsed) == sorted(f'm{index}' for index in range(30))
+    assert sorted(lookups) == ['ann@example.com', 'bob@example.com']
+    assert thread['message_count'] == 30
+    assert thread['subject'] == 'Offer'
+    assert thread['latest_sender'] == 'Ann'
+    assert thread['latest_sender_photo'] == 'https://logo.example/ann@example.com'
+    assert sorted(thread['participants']) == ['ann@example.com', 'bob@example.com', 'me@example.com']
@@ -0,0 +1,98 @@
+import re
+
+import pytest
+
+import gmail_fetcher
+from utils.filter_config import JOB_DOMAINS, JOB_KEYWORDS
+from utils.gmail_pre_filter import GmailPreFilter
+
+def query_terms(query):
+    return {(operator, term) for operator, group in re.findall(r'(subject|from):\(([^)]*)\)', query)
+            for term in group.split(' OR ')}
+
+def test_queries_cover_the_filter_config_within_the_length_limit():
+    pre_filter = GmailPreFilter(max_query_length=120)
+
+    queries = pre_filter.get_job_queries()
+
+    assert len(queries) > 1
+    assert all(len(query) <= 120 for query in queries)
+    terms = [term for query in queries for term in query_terms(query)]
+    assert len(terms) == len(set(terms))
+    assert set(terms) == ({('subject', form) for keyword in JOB_KEYWORDS
+                           for form in GmailPreFilter.word_forms(keyword)} |
+                          {('from', domain) for domain in JOB_DOMAINS})
+    assert {('subject', 'applications'), ('subject', 'opportunities')} <= set(terms)
+
+def test_single_query_when_it_fits():
+    pre_filter = GmailPreFilter(keywords=['job offer', 'interview'], domains=['lever.co'])
+
+    assert pre_filter.get_job_queries() == [
+        'subject:("job offer" OR interview OR interviews) OR from:(lever.co)']
+    assert pre_filter.get_job_query() == pre_filter.get_job_queries()[0]
+
+class FakeMessagesResource:
+    """messages().list() returning one page per query, keyed by query and page token."""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.calls = []
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def list(self, **params):
+        self.calls.append(params)
+        self.response = self.pages[(params['q'], params.get('pageToken'))]
+        return self
+
+    def execute(self):
+        return self.response
+
+def test_fetch_job_emails_runs_queries_then_the_job_filter(monkeypatch):
+    queries = ['subject:(interview)', 'from:(lever.co)']
+    monkeypatch.setattr(gmail_fetcher.GmailPreFilter, 'get_job_queries', lambda self: queries)
+    service = FakeMessagesResource({
+        ('subject:(interview)', None): {'messages': [{'id': 'm1'}, {'id': 'm2'}], 'nextPageToken': 'p2'},
+        ('from:(lever.co)', None): {'messages': [{'id': 'm2'}, {'id': 'm3'}]},
+        ('subject:(interview)', 'p2'): {'messages': [{'id': 'm4'}]},
+    })
+    messages = {
+        'm1': {'id': 'm1', 'subject': 'Interview on Monday', 'sender_email': 'a@example.com',
+               'from': 'A <a@example.com>', 'internalDate': '100'},
+        'm2': {'id': 'm2', 'subject': 'Your interview', 'sender_email': 'b@jobs.lever.co',
+               'from': 'B <b@jobs.lever.co>', 'internalDate': '300'},
+        'm3': {'id': 'm3', 'subject': 'Newsletter', 'sender_email': 'c@example.com',
+               'from': 'C <c@example.com>', 'internalDate': '200'},
+        'm4': {'id': 'm4', 'subject': 'Interview follow-up', 'sender_email': 'd@example.com',
+               'from': 'D <d@example.com>', 'internalDate': '50'},
+    }
+    loaded = []
+
+    def fake_load_messages(message_ids, *args, **kwargs):
+        loaded.append(message_ids)
+        return [dict(messages[message_id]) for message_id in message_ids]
+
+    monkeypatch.setattr(gmail_fetcher, 'get_credentials', lambda: None)
+    monkeypatch.setattr(gmail_fetcher, 'build_services', lambda creds: (service, None))
+    monkeypatch.setattr(gmail_fetcher, 'get_contacts_index', lambda user_key: None)
+    monkeypatch.setattr(gmail_fetcher, 'load_messages_from_store', fake_load_messages)
+
+    result = gmail_fetcher.fetch_job_emails(max_results=2)
+
+    assert loaded == [['m1', 'm2', 'm3']]
+    assert [email['id'] for email in result['emails']] == ['m2', 'm1']
+    assert result['candidate_count'] == 3
+    assert gmail_fetcher.decode_query_cursor(result['next_page_token'], 2) == ['p2', None]
+
+    result = gmail_fetcher.fetch_job_emails(max_results=2, page_token=result['next_page_token'])
+
+    assert [call.get('pageToken') for call in service.calls[2:]] == ['p2']
+    assert [email['id'] for email in result['emails']] == ['m4']
+    assert result['next_page_token'] is None
+
+    with pytest.raises(ValueError):
+        gmail_fetcher.decode_query_cursor(gmail_fetcher.encode_query_cursor(['p2']), 2)
@@ -0,0 +1,121 @@
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+import gmail_sync
+from utils import message_store
+from utils.message_store import MessageStore
+
+def make_thread(thread_id, message_ids, timestamp, history_id='1'):
+    return {
+        'threadId': thread_id,
+        'historyId': history_id,
+        'latest_timestamp': timestamp,
+        'messages': [{'id': message_id, 'threadId': thread_id, 'labelIds': ['INBOX', 'UNREAD'],
+                      'internalDate': str(timestamp)} for message_id in message_ids]
+    }
+
+class FakeHistoryService:
+    """Serves history().list pages, or a 404 for an expired start history ID."""
+
+    def __init__(self, pages, expired=False):
+        self.pages = pages
+        self.expired = expired
+        self.calls = []
+
+    def users(self):
+        return self
+
+    def history(self):
+        return self
+
+    def list(self, **params):
+        self.calls.append(params)
+        return self
+
+    def execute(self):
+        if self.expired:
+            raise HttpError(httplib2.Response({'status': 404}), b'{}')
+        index = int(self.calls[-1].get('pageToken', 0))
+        page = dict(self.pages[index])
+        if index + 1 < len(self.pages):
+            page['nextPageToken'] = str(index + 1)
+        return page
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = MessageStore(str(tmp_path / 'messages.db'))
+    monkeypatch.setattr(message_store, '_message_store', store)
+    return store
+
+def test_sync_applies_every_change_type_across_pages(store, monkeypatch):
+    store.put_threads('user', [make_thread('t1', ['m1'], 100), make_thread('t2', ['m2', 'm3'], 200)])
+    hydrated = []
+
+    def fake_hydrate(thread_ids, creds, contacts=None, errors=None):
+        hydrated.extend(thread_ids)
+        threads = {'t2': make_thread('t2', ['m2'], 200, '7'), 't3': make_thread('t3', ['m4'], 300, '8')}
+        return [threads[thread_id] for thread_id in thread_ids if thread_id in threads]
+
+    monkeypatch.setattr(gmail_sync, 'hydrate_threads', fake_hydrate)
+    service = FakeHistoryService([
+        {'historyId': '5', 'history': [
+            {'labelsRemoved': [{'message': {'id': 'm1'}, 'labelIds': ['UNREAD']}]},
+            {'messagesDeleted': [{'message': {'id': 'm3', 'threadId': 't2'}}]}
+        ]},
+        {'historyId': '9', 'history': [
+            {'messagesAdded': [{'message': {'id': 'm4', 'threadId': 't3', 'labelIds': ['INBOX']}}]},
+            {'messagesAdded': [{'message': {'id': 'd1', 'threadId': 't4', 'labelIds': ['DRAFT']}}]}
+        ]}
+    ])
+
+    result = gmail_sync.sync_mailbox(service, None, '4', 'user')
+
+    assert len(service.calls) == 2
+    assert result['history_id'] == '9'
+    assert sorted(hydrated) == ['t2', 't3']
+    assert [t['threadId'] for t in result['updated_threads']] == ['t3', 't2', 't1']
+    assert result['deleted_thread_ids'] == []
+    assert store.get_messages('user', ['m1'])['m1']['labelIds'] == ['INBOX']
+    assert store.get_threads('user', ['t1'])['t1']['messages'][0]['labelIds'] == ['INBOX']
+    assert store.get_messages('user', ['m3']) == {}
+
+def test_only_threads_gmail_reports_gone_are_deleted(store, monkeypatch):
+    store.put_threads('user', [make_thread('t1', ['m1', 'm2'], 100), make_thread('t2', ['m3', 'm4'], 200)])
+
+    def fake_hydrate(thread_ids, creds, contacts=None, errors=None):
+        errors['t1'] = HttpError(httplib2.Response({'status': 404}), b'{}')
+        errors['t2'] = HttpError(httplib2.Response({'status': 503}), b'{}')
+        errors['t3'] = TimeoutError('timed out')
+        return []
+
+    monkeypatch.setattr(gmail_sync, 'hydrate_threads', fake_hydrate)
+    service = FakeHistoryService([{'historyId': '9', 'history': [
+        {'messagesDeleted': [{'message': {'id': 'm1', 'threadId': 't1'}},
+                             {'message': {'id': 'm3', 'threadId': 't2'}}]},
+        {'messagesAdded': [{'message': {'id': 'm5', 'threadId': 't3', 'labelIds': ['INBOX']}}]}
+    ]}])
+
+    result = gmail_sync.sync_mailbox(service, None, '4', 'user')
+
+    assert result['deleted_thread_ids'] == ['t1']
+    assert store.get_threads('user', ['t1']) == {}
+    assert 't2' in store.get_threads('user', ['t2'])
+    # The failed refetches are retried from the same cursor on the next sync
+    assert result['history_id'] == '4'
+
+def test_sync_advances_cursor_without_changes(store):
+    service = FakeHistoryService([{'historyId': '12'}])
+
+    result = gmail_sync.sync_mailbox(service, None, '10', 'user')
+
+    assert result['history_id'] == '12'
+    assert result['updated_threads'] == []
+
+def test_expired_history_id_falls_back_to_full_resync(store, monkeypatch):
+    monkeypatch.setattr(gmail_sync, 'full_resync',
+                        lambda service, creds, user_key: {'history_id': '50', 'full_resync': True})
+
+    result = gmail_sync.sync_mailbox(FakeHistoryService([], expired=True), None, '1', 'user')
+
+    assert result == {'history_id': '50', 'full_resync': True}
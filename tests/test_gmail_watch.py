@@ -0,0 +1,111 @@
+import sqlite3
+import time
+
+import pytest
+
+from utils.gmail_watch import WatchLeaseManager, decode_push_envelope, encode_push_envelope
+
+class FakeWatchService:
+    """Serves users().watch() and users().getProfile(), counting watch calls."""
+
+    def __init__(self, lease_seconds=7 * 24 * 3600, fail=False):
+        self.lease_seconds = lease_seconds
+        self.fail = fail
+        self.watch_calls = []
+        self._pending = None
+
+    def users(self):
+        return self
+
+    def watch(self, userId, body):
+        self.watch_calls.append(body)
+        self._pending = 'watch'
+        return self
+
+    def getProfile(self, userId):
+        self._pending = 'profile'
+        return self
+
+    def execute(self):
+        if self.fail:
+            raise RuntimeError('watch failed')
+        if self._pending == 'profile':
+            return {'emailAddress': 'Me@Gmail.com', 'historyId': '42'}
+        return {'historyId': '42', 'expiration': str(int((time.time() + self.lease_seconds) * 1000))}
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setenv('GMAIL_NOTIFICATION_TOPIC', 'projects/p/topics/gmail')
+    return WatchLeaseManager(str(tmp_path / 'leases.db'), renewal_margin=3600, retry_interval=60)
+
+def test_watch_is_only_renewed_near_expiry(manager):
+    service = FakeWatchService()
+    lease = manager.ensure_watch(service, 'user')
+    assert lease['email_address'] == 'me@gmail.com'
+    assert lease['topic_name'] == 'projects/p/topics/gmail'
+    for _ in range(5):
+        manager.ensure_watch(service, 'user')
+    assert len(service.watch_calls) == 1
+
+    # Within the renewal margin the lease is renewed once
+    manager.set_lease('user', 'me@gmail.com', 'projects/p/topics/gmail', '42', time.time() + 600)
+    manager.ensure_watch(service, 'user')
+    manager.ensure_watch(service, 'user')
+    assert len(service.watch_calls) == 2
+    assert manager.find_user('ME@gmail.com') == 'user'
+
+def test_failed_watch_is_retried_after_interval(manager):
+    service = FakeWatchService(fail=True)
+    assert manager.ensure_watch(service, 'user') is None
+    assert manager.ensure_watch(service, 'user') is None
+    assert len(service.watch_calls) == 1
+
+    manager._failures['user'] -= 120
+    service.fail = False
+    assert manager.ensure_watch(service, 'user')['history_id'] == '42'
+    assert len(service.watch_calls) == 2
+
+def test_no_topic_means_no_watch(manager, monkeypatch):
+    monkeypatch.delenv('GMAIL_NOTIFICATION_TOPIC')
+    service = FakeWatchService()
+    assert manager.ensure_watch(service, 'user') is None
+    assert service.watch_calls == []
+
+def test_mailbox_history_id_only_moves_forward_while_the_watch_is_live(manager, tmp_path, monkeypatch):
+    manager.set_lease('user', 'me@gmail.com', 'projects/p/topics/gmail', '42', time.time() + 600)
+    assert manager.get_mailbox_history_id('user') == '42'
+
+    manager.record_mailbox_history_id('user', '50')
+    # A redelivered older notification does not move it back
+    manager.record_mailbox_history_id('user', '45')
+    manager.record_history_id('user', '44')
+    assert manager.get_mailbox_history_id('user') == '50'
+    assert manager.get_lease('user')['history_id'] == '44'
+
+    # Without a live watch on the configured topic, changes are not pushed
+    assert manager.get_mailbox_history_id('user', now=time.time() + 3600) is None
+    monkeypatch.setenv('GMAIL_NOTIFICATION_TOPIC', 'projects/p/topics/other')
+    assert manager.get_mailbox_history_id('user') is None
+
+def test_lease_files_without_the_mailbox_column_are_upgraded(tmp_path):
+    path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE watch_leases (user_key TEXT PRIMARY KEY, email_address TEXT,'
+                 ' topic_name TEXT, history_id TEXT, expiration REAL NOT NULL, renewed_at REAL NOT NULL)')
+    conn.execute("INSERT INTO watch_leases VALUES ('user', 'me@gmail.com', 'topic', '7', 0, 0)")
+    conn.commit()
+    conn.close()
+
+    manager = WatchLeaseManager(path)
+    assert manager.get_lease('user')['mailbox_history_id'] is None
+    manager.record_mailbox_history_id('user', '8')
+    assert manager.get_lease('user')['mailbox_history_id'] == '8'
+
+def test_push_envelope_round_trip():
+    envelope = encode_push_envelope('Me@Gmail.com', '1234')
+    assert decode_push_envelope(envelope) == {'email_address': 'me@gmail.com', 'history_id': '1234'}
+
+    for malformed in [None, {}, {'message': {}}, {'message': {'data': 'bm90IGpzb24='}},
+                      {'message': {'data': 'e30='}}]:
+        with pytest.raises(ValueError):
+            decode_push_envelope(malformed)
@@ -0,0 +1,58 @@
+import threading
+import time
+
+from utils.logo_cache import LogoCache
+
+def test_positive_and_negative_entries_use_separate_ttls(tmp_path):
+    cache = LogoCache(str(tmp_path / 'logos.db'), positive_ttl=60, negative_ttl=1)
+    cache.set('acme.com', 'https://logo.clearbit.com/acme.com')
+    cache.set('nologo.com', None)
+
+    assert cache.get('acme.com') == (True, 'https://logo.clearbit.com/acme.com')
+    assert cache.get('nologo.com') == (True, None)
+    assert cache.get('unknown.com') == (False, None)
+
+    cache.positive_ttl = cache.negative_ttl = 0
+    time.sleep(0.01)
+    assert cache.get('acme.com') == (False, None)
+    assert cache.get('nologo.com') == (False, None)
+
+def test_entries_persist_across_instances(tmp_path):
+    path = str(tmp_path / 'logos.db')
+    LogoCache(path).set('acme.com', 'acme.png')
+
+    assert LogoCache(path).get('acme.com') == (True, 'acme.png')
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = LogoCache(str(tmp_path / 'logos.db'), max_entries=2)
+    cache.set('a.com', 'a.png')
+    time.sleep(0.01)
+    cache.set('b.com', 'b.png')
+    time.sleep(0.01)
+    cache.get('a.com')
+    time.sleep(0.01)
+    cache.set('c.com', 'c.png')
+
+    assert len(cache) == 2
+    assert cache.get('b.com') == (False, None)
+    assert cache.get('a.com')[0] and cache.get('c.com')[0]
+
+def test_concurrent_misses_fetch_once_and_failures_are_remembered(tmp_path):
+    cache = LogoCache(str(tmp_path / 'logos.db'))
+    calls = []
+
+    def slow_failing_fetch(domain):
+        calls.append(domain)
+        time.sleep(0.05)
+        raise TimeoutError('slow domain')
+
+    workers = [threading.Thread(target=cache.get_or_fetch, args=('slow.com', slow_failing_fetch))
+               for _ in range(5)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert calls == ['slow.com']
+    assert cache.get_or_fetch('slow.com', slow_failing_fetch) is None
+    assert calls == ['slow.com']
@@ -0,0 +1,135 @@
+import time
+import threading
+
+import mail_events
+from mail_events import MailboxEventHub, Subscription, format_sse, to_delta_event
+
+class FakeCreds:
+    expired = False
+    refresh_token = None
+
+def make_sync_result(thread_ids, history_id):
+    return {
+        'history_id': history_id,
+        'updated_threads': [{'threadId': thread_id, 'messages': [{'id': f'{thread_id}-m', 'body': 'hi'}]}
+                            for thread_id in thread_ids],
+        'deleted_thread_ids': [],
+        'full_resync': False
+    }
+
+def test_one_sync_loop_per_user_fans_out_to_every_stream(monkeypatch):
+    synced = []
+    changes = threading.Event()
+
+    def fake_sync(service, creds, history_id, user_key):
+        synced.append((history_id, user_key))
+        if len(synced) == 1:
+            changes.set()
+            return make_sync_result(['t1'], '11')
+        return make_sync_result([], history_id)
+
+    monkeypatch.setattr(mail_events, 'build_services', lambda creds: (None, None))
+    monkeypatch.setattr(mail_events, 'sync_mailbox', fake_sync)
+
+    hub = MailboxEventHub(interval=60)
+    first = hub.subscribe('user', FakeCreds(), history_id='10')
+    second = hub.subscribe('user', FakeCreds(), history_id='10')
+    assert hub.get_stats() == {'users': 1, 'connections': 2}
+    assert changes.wait(5)
+
+    for subscription in (first, second):
+        event = subscription.get(timeout=5)
+        assert event['type'] == 'delta'
+        assert event['history_id'] == '11'
+        assert [thread['threadId'] for thread in event['updated_threads']] == ['t1']
+        # Deltas are sent without bodies, which clients load on demand
+        assert event['updated_threads'][0]['messages'][0]['body'] is None
+
+    # Only one loop syncs, starting from the given cursor
+    assert synced[0] == ('10', 'user')
+
+    loop = hub._loops['user']
+    hub.unsubscribe(first)
+    assert hub._loops['user'] is loop
+    hub.unsubscribe(second)
+    loop._thread.join(5)
+    assert not loop.is_alive()
+    assert hub.get_stats() == {'users': 0, 'connections': 0}
+
+def test_notify_wakes_the_loop_and_empty_syncs_are_not_published(monkeypatch):
+    calls = []
+    second_sync = threading.Event()
+
+    def fake_sync(service, creds, history_id, user_key):
+        calls.append(history_id)
+        if len(calls) == 2:
+            second_sync.set()
+        return make_sync_result([], history_id)
+
+    monkeypatch.setattr(mail_events, 'build_services', lambda creds: (None, None))
+    monkeypatch.setattr(mail_events, 'get_history_id', lambda service: '5')
+    monkeypatch.setattr(mail_events, 'sync_mailbox', fake_sync)
+
+    hub = MailboxEventHub(interval=60)
+    subscription = hub.subscribe('user', FakeCreds())
+    # The first pass only reads the current history ID, later ones sync from it
+    while not second_sync.is_set():
+        hub.notify('user')
+        second_sync.wait(0.05)
+    assert calls[:2] == ['5', '5']
+    assert subscription.get(timeout=0.01) == 'keepalive'
+    hub.unsubscribe(subscription)
+
+def test_sync_once_syncs_from_the_lease_cursor_and_stores_the_new_one(monkeypatch):
+    watch_manager = mail_events.get_watch_manager()
+    watch_manager.set_lease('user', 'me@gmail.com', 'topic', '10', 0)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fake_sync(service, creds, history_id, user_key):
+        calls.append(history_id)
+        started.set()
+        release.wait(5)
+        return make_sync_result(['t1'], str(int(history_id) + 1))
+
+    monkeypatch.setattr(mail_events, 'build_services', lambda creds: (None, None))
+    monkeypatch.setattr(mail_events, 'sync_mailbox', fake_sync)
+
+    hub = MailboxEventHub(interval=60)
+    hub.sync_once('user', FakeCreds())
+    assert started.wait(5)
+    # Notifications during the sync ask for a single further pass
+    hub.sync_once('user', FakeCreds())
+    hub.sync_once('user', FakeCreds())
+    release.set()
+    for _ in range(100):
+        if 'user' not in hub._one_off_syncs:
+            break
+        time.sleep(0.05)
+
+    assert calls == ['10', '11']
+    assert watch_manager.get_lease('user')['history_id'] == '12'
+    # Nothing is published: the user has no open streams
+    assert hub.get_stats() == {'users': 0, 'connections': 0}
+
+def test_slow_subscriber_is_told_to_resync():
+    subscription = Subscription('user', max_size=2)
+    for index in range(3):
+        subscription.put({'type': 'delta', 'index': index})
+    assert subscription.get(timeout=0) == {'type': 'resync'}
+    assert subscription.get(timeout=0) == 'keepalive'
+
+def test_stream_formats_events_and_unsubscribes_when_closed():
+    hub = MailboxEventHub()
+    subscription = Subscription('user')
+    hub._subscriptions['user'] = {subscription}
+    event = to_delta_event(dict(make_sync_result(['t1'], '3'), full_resync=True))
+    subscription.put(event)
+    subscription.close()
+
+    chunks = list(hub.stream(subscription, keepalive=0.01))
+    assert chunks[0].startswith('retry:')
+    assert chunks[1] == format_sse(event)
+    assert chunks[1].startswith('event: resync\ndata: ')
+    assert hub.get_stats()['connections'] == 0
@@ -0,0 +1,85 @@
+import mailbox
+import tracemalloc
+from email.message import EmailMessage
+
+import mail_ingest
+from utils.mail_sources import iter_emails, iter_mbox_messages, normalize_message_id
+
+def make_message(index, body_size=0):
+    message = EmailMessage()
+    message['From'] = 'Greenhouse <no-reply@greenhouse.io>'
+    message['To'] = 'me@example.com'
+    message['Subject'] = f'Application update {index}'
+    message['Date'] = 'Tue, 14 Nov 2023 22:13:20 +0000'
+    message['Message-ID'] = f'<m{index}@example.com>'
+    message.set_content('Thanks for applying.\nFrom the team\n' + 'x' * body_size)
+    message.add_alternative('<p>Thanks for <b>applying</b>.</p>', subtype='html')
+    message.add_attachment(b'%PDF-1.4', maintype='application', subtype='pdf', filename='offer.pdf')
+    # Fixed boundaries, since the email package caches a compiled regex per boundary
+    for level, part in enumerate(part for part in message.walk() if part.is_multipart()):
+        part.set_boundary(f'boundary-{level}')
+    return message
+
+def write_mbox(path, count, body_size=0):
+    box = mailbox.mbox(str(path))
+    for index in range(count):
+        box.add(make_message(index, body_size))
+    box.flush()
+
+def test_mbox_messages_match_get_email_content_shape(tmp_path):
+    path = tmp_path / 'corpus.mbox'
+    write_mbox(path, 3)
+
+    emails = list(mail_ingest.ingest_emails([str(path)]))
+
+    assert [email['id'] for email in emails] == ['m0@example.com', 'm1@example.com', 'm2@example.com']
+    email = emails[0]
+    assert email['sender'] == 'Greenhouse'
+    assert email['sender_email'] == 'no-reply@greenhouse.io'
+    assert email['body_type'] == 'html'
+    assert email['body'].strip() == '<p>Thanks for <b>applying</b>.</p>'
+    assert email['snippet'] == 'Thanks for applying. From the team'
+    assert email['internalDate'] == '1700000000000'
+    assert [(a['filename'], a['mimeType'], a['size']) for a in email['attachments']] == [
+        ('offer.pdf', 'application/pdf', 8)]
+    # The escaped ">From" body line is neither a separator nor left escaped
+    assert len(list(iter_mbox_messages(str(path)))) == 3
+    assert b'\nFrom the team' in next(iter_mbox_messages(str(path)))[1]
+
+def test_message_ids_match_between_ingest_and_classification(tmp_path):
+    assert normalize_message_id(' <m1@example.com> ') == 'm1@example.com'
+    assert normalize_message_id(None) == ''
+
+    path = tmp_path / 'corpus.mbox'
+    box = mailbox.mbox(str(path))
+    message = make_message(1)
+    message.replace_header('Message-ID', ' <m1@example.com> ')
+    box.add(message)
+    box.flush()
+
+    ingested = next(mail_ingest.ingest_emails([str(path)]))
+    classified = next(iter_emails(str(path)))
+    assert ingested['id'] == classified['id'] == 'm1@example.com'
+
+def test_eml_files_and_classification(tmp_path):
+    (tmp_path / 'one.eml').write_bytes(bytes(make_message(1)))
+
+    summary = mail_ingest.replay([str(tmp_path)], output=str(tmp_path / 'out.jsonl'))
+
+    assert summary['processed'] == 1
+    assert summary['matched'] == 1
+
+def test_memory_stays_flat(tmp_path):
+    def peak_for(count):
+        path = tmp_path / f'corpus-{count}.mbox'
+        write_mbox(path, count, body_size=20000)
+        tracemalloc.start()
+        summary = mail_ingest.replay([str(path)])
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        assert summary['processed'] == count
+        return peak
+
+    small, large = peak_for(30), peak_for(300)
+    # Ten times the mail (about 6 MB) must not need noticeably more memory
+    assert large < small * 1.5
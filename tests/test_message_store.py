@@ -0,0 +1,114 @@
+import gmail_fetcher
+from utils import message_store
+from utils.message_store import MessageStore
+
+def make_thread(thread_id, history_id, timestamp):
+    return {
+        'threadId': thread_id,
+        'historyId': history_id,
+        'latest_timestamp': timestamp,
+        'messages': [{'id': f'{thread_id}-m1', 'threadId': thread_id,
+                      'internalDate': str(timestamp), 'sender_photo': None,
+                      'body': 'Hello', 'body_type': 'plain', 'attachments': []}]
+    }
+
+def test_store_round_trip(tmp_path):
+    store = MessageStore(str(tmp_path / 'messages.db'))
+    store.put_threads('user', [make_thread('t1', '10', 100), make_thread('t2', '20', 200)])
+
+    assert store.get_thread_history_ids('user', ['t1', 't2', 't3']) == {'t1': '10', 't2': '20'}
+    assert [t['threadId'] for t in store.recent_threads('user')] == ['t2', 't1']
+    assert set(store.get_messages('user', ['t1-m1', 't2-m1'])) == {'t1-m1', 't2-m1'}
+    assert store.get_threads('other-user', ['t1']) == {}
+
+    store.delete_threads('user', ['t1'])
+    assert store.get_messages('user', ['t1-m1']) == {}
+
+def test_only_missing_or_stale_threads_are_fetched(tmp_path, monkeypatch):
+    store = MessageStore(str(tmp_path / 'messages.db'))
+    store.put_threads('user', [make_thread('t1', '10', 100), make_thread('t2', '20', 200)])
+    monkeypatch.setattr(message_store, '_message_store', store)
+
+    fetched_ids = []
+
+    def fake_load_threads(thread_ids, *args, **kwargs):
+        fetched_ids.extend(thread_ids)
+        return [make_thread(thread_id, '99', 300) for thread_id in thread_ids]
+
+    monkeypatch.setattr(gmail_fetcher, 'load_threads', fake_load_threads)
+    thread_refs = [{'id': 't1', 'historyId': '10'}, {'id': 't2', 'historyId': '21'},
+                   {'id': 't3', 'historyId': '30'}]
+
+    threads = gmail_fetcher.load_threads_from_store(
+        thread_refs, None, None, None, enrich_photos=False, user_key='user')
+
+    assert fetched_ids == ['t2', 't3']
+    assert [t['threadId'] for t in threads] == ['t2', 't3', 't1']
+    assert store.get_thread_history_ids('user', ['t2', 't3']) == {'t2': '99', 't3': '99'}
+
+def test_metadata_threads_are_refetched_for_bodies(tmp_path, monkeypatch):
+    store = MessageStore(str(tmp_path / 'messages.db'))
+    metadata_thread = make_thread('t2', '20', 200)
+    metadata_thread['messages'] = gmail_fetcher.strip_bodies(metadata_thread['messages'])
+    store.put_threads('user', [make_thread('t1', '10', 100), metadata_thread])
+    monkeypatch.setattr(message_store, '_message_store', store)
+
+    calls = []
+
+    def fake_load_threads(thread_ids, *args, **kwargs):
+        calls.append((thread_ids, args[5]))
+        return [make_thread(thread_id, '20', 200) for thread_id in thread_ids]
+
+    monkeypatch.setattr(gmail_fetcher, 'load_threads', fake_load_threads)
+    thread_refs = [{'id': 't1', 'historyId': '10'}, {'id': 't2', 'historyId': '20'}]
+
+    # Metadata view serves both from the store, without bodies
+    threads = gmail_fetcher.load_threads_from_store(
+        thread_refs, None, None, None, enrich_photos=False, user_key='user', metadata_only=True)
+    assert calls == []
+    assert [t['messages'][0]['body'] for t in threads] == [None, None]
+    assert store.get_threads('user', ['t1'])['t1']['messages'][0]['body'] == 'Hello'
+
+    # Full view refetches the thread that was stored without bodies
+    threads = gmail_fetcher.load_threads_from_store(
+        thread_refs, None, None, None, enrich_photos=False, user_key='user')
+    assert calls == [(['t2'], False)]
+    assert [t['messages'][0]['body'] for t in threads] == ['Hello', 'Hello']
+
+def test_get_message_body_fetches_once(tmp_path, monkeypatch):
+    store = MessageStore(str(tmp_path / 'messages.db'))
+    monkeypatch.setattr(message_store, '_message_store', store)
+    metadata_message = gmail_fetcher.get_email_content({
+        'id': 'm1', 'threadId': 't1',
+        'payload': {'headers': [{'name': 'From', 'value': 'Ann <ann@example.com>'}]}
+    }, include_body=False)
+    assert metadata_message['body'] is None
+    store.put_messages('user', [dict(metadata_message, sender_photo='photo-url')])
+
+    class FakeService:
+        def __init__(self):
+            self.calls = 0
+
+        def users(self):
+            return self
+
+        def messages(self):
+            return self
+
+        def get(self, **params):
+            self.calls += 1
+            return self
+
+        def execute(self):
+            return {'id': 'm1', 'threadId': 't1', 'payload': {
+                'mimeType': 'text/plain', 'headers': [],
+                'body': {'data': 'SGVsbG8='}}}
+
+    service = FakeService()
+    monkeypatch.setattr(gmail_fetcher, 'get_gmail_service', lambda: (service, None))
+
+    expected = {'id': 'm1', 'body': 'Hello', 'body_type': 'plain', 'attachments': []}
+    assert gmail_fetcher.get_message_body('m1', user_key='user') == expected
+    assert gmail_fetcher.get_message_body('m1', user_key='user') == expected
+    assert service.calls == 1
+    assert store.get_messages('user', ['m1'])['m1']['sender_photo'] == 'photo-url'
@@ -0,0 +1,50 @@
+import threading
+
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+
+from utils.service_factory import ServiceFactory
+
+def make_credentials(token):
+    return Credentials(token=token, refresh_token='refresh', client_id='client')
+
+def run_in_thread(func):
+    result = []
+    worker = threading.Thread(target=lambda: result.append(func()))
+    worker.start()
+    worker.join()
+    return result[0]
+
+def test_services_are_shared_across_threads_per_credentials():
+    factory = ServiceFactory()
+    creds = make_credentials('token-1')
+    gmail, people = factory.get_services(creds)
+
+    assert factory.get_services(creds) == (gmail, people)
+    assert run_in_thread(lambda: factory.get_services(creds)) == (gmail, people)
+    assert hasattr(gmail.users(), 'threads')
+    assert hasattr(people.people(), 'connections')
+
+def test_token_refresh_keeps_services_and_new_credentials_get_their_own():
+    factory = ServiceFactory()
+    creds = make_credentials('token-1')
+    gmail, _ = factory.get_services(creds)
+
+    # Refreshes update the credentials object in place
+    creds.token = 'token-2'
+    assert factory.get_services(creds)[0] is gmail
+    assert factory.get_services(make_credentials('token-2'))[0] is not gmail
+
+def test_calls_use_the_calling_threads_transport():
+    factory = ServiceFactory()
+    creds = make_credentials('token-1')
+    gmail, _ = factory.get_services(creds)
+    request = gmail.users().getProfile(userId='me')
+
+    main_http = request.http_factory()
+    other_http = run_in_thread(request.http_factory)
+
+    assert isinstance(main_http, AuthorizedHttp)
+    assert main_http.credentials is creds
+    assert main_http.http is factory.get_thread_http()
+    assert other_http.http is not main_http.http
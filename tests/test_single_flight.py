@@ -0,0 +1,81 @@
+import asyncio
+import threading
+
+import pytest
+
+from utils.single_flight import AsyncSingleFlight, SingleFlight
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return {'total_count': 3}
+
+    results = []
+    workers = [threading.Thread(target=lambda: results.append(flight.do(('user', 10), fetch)))
+               for _ in range(5)]
+    for worker in workers:
+        worker.start()
+    while flight.get_stats()['coalesced'] < 4:
+        threading.Event().wait(0.01)
+    release.set()
+    for worker in workers:
+        worker.join()
+
+    assert len(calls) == 1
+    assert len(results) == 5 and all(result is results[0] for result in results)
+    assert flight.get_stats() == {'calls': 1, 'coalesced': 4, 'grace_hits': 0, 'in_flight': 0}
+
+def test_results_are_reused_for_the_grace_window_and_errors_never():
+    now = [0.0]
+    flight = SingleFlight(grace=2, clock=lambda: now[0])
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return len(calls)
+
+    assert flight.do('key', fetch) == 1
+    now[0] = 1.5
+    assert flight.do('key', fetch) == 1
+    assert flight.do('other-key', fetch) == 2
+    now[0] = 3.5
+    assert flight.do('key', fetch) == 3
+    assert flight.get_stats()['grace_hits'] == 1
+
+    def fail():
+        calls.append(1)
+        raise RuntimeError('quota exceeded')
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            flight.do('failing', fail)
+    assert len(calls) == 5
+
+def test_async_callers_share_one_call_and_survive_a_cancelled_caller():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return ['t1', 't0']
+
+    async def run():
+        cancelled = asyncio.ensure_future(flight.do('key', fetch))
+        await asyncio.sleep(0)
+        waiters = [flight.do('key', fetch) for _ in range(3)]
+        cancelled.cancel()
+        results = await asyncio.gather(*waiters)
+        # Finished within the grace window
+        results.append(await flight.do('key', fetch))
+        return results
+
+    results = asyncio.run(run())
+    assert results == [['t1', 't0']] * 4
+    assert len(calls) == 1
+    assert flight.stats == {'calls': 1, 'coalesced': 3, 'grace_hits': 1}
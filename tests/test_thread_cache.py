@@ -0,0 +1,64 @@
+import json
+
+import gmail_fetcher
+from utils import message_store
+from utils.message_store import MessageStore
+from utils.thread_cache import ThreadCache, get_thread_cache
+
+def make_thread(thread_id, history_id, body='Hello'):
+    return {
+        'threadId': thread_id,
+        'historyId': history_id,
+        'latest_timestamp': 100,
+        'messages': [{'id': f'{thread_id}-m1', 'threadId': thread_id, 'internalDate': '100',
+                      'sender_photo': None, 'body': body, 'body_type': 'plain', 'attachments': []}]
+    }
+
+def test_entries_are_keyed_by_history_id_and_copied():
+    cache = ThreadCache()
+    cache.put('user', make_thread('t1', '10'))
+
+    assert cache.get('user', 't1', '11') is None
+    assert cache.get('other-user', 't1', '10') is None
+    thread = cache.get('user', 't1', '10')
+    thread['messages'][0]['body'] = None
+    thread['is_job_related'] = True
+
+    assert cache.get('user', 't1', '10') == make_thread('t1', '10')
+    stats = cache.get_stats()
+    assert (stats['hits'], stats['misses'], stats['hit_rate']) == (2, 2, 0.5)
+
+def test_least_recently_used_threads_are_evicted_by_size():
+    thread_size = len(json.dumps(make_thread('t1', '10')))
+    cache = ThreadCache(max_bytes=thread_size * 2)
+    cache.put('user', make_thread('t1', '10'))
+    cache.put('user', make_thread('t2', '10'))
+    cache.get('user', 't1', '10')
+    cache.put('user', make_thread('t3', '10'))
+
+    assert cache.get('user', 't2', '10') is None
+    assert cache.get('user', 't1', '10') and cache.get('user', 't3', '10')
+    assert cache.get_stats()['evictions'] == 1
+    assert cache.size_bytes <= cache.max_bytes
+
+    # A thread larger than the whole cache is not kept
+    cache.put('user', make_thread('big', '10', body='x' * thread_size * 2))
+    assert cache.get('user', 'big', '10') is None and len(cache) == 2
+
+def test_stored_threads_are_served_from_memory(tmp_path, monkeypatch):
+    store = MessageStore(str(tmp_path / 'messages.db'))
+    monkeypatch.setattr(message_store, '_message_store', store)
+    gmail_fetcher.save_threads('user', [make_thread('t1', '10')])
+
+    def fail(*args):
+        raise AssertionError('the store should not be read')
+
+    monkeypatch.setattr(store, 'get_threads', fail)
+    monkeypatch.setattr(store, 'get_thread_history_ids', fail)
+    threads_by_id, stale_ids = gmail_fetcher.get_stored_threads(
+        [{'id': 't1', 'historyId': '10'}], 'user', metadata_only=True)
+
+    assert stale_ids == []
+    assert threads_by_id['t1']['messages'][0]['body'] is None
+    # Stripping bodies for the metadata view leaves the cached copy whole
+    assert get_thread_cache().get('user', 't1', '10')['messages'][0]['body'] == 'Hello'
@@ -0,0 +1,309 @@
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Gmail allows 250 quota units per user per second (15,000 per minute)
+GMAIL_QUOTA_UNITS_PER_SECOND = float(os.getenv('GMAIL_QUOTA_UNITS_PER_SECOND', '250'))
+GMAIL_QUOTA_BURST = float(os.getenv('GMAIL_QUOTA_BURST', '250'))
+# The People API counts requests rather than units: 90 reads per user per minute
+PEOPLE_REQUESTS_PER_SECOND = float(os.getenv('PEOPLE_REQUESTS_PER_SECOND', '1.5'))
+PEOPLE_REQUEST_BURST = float(os.getenv('PEOPLE_REQUEST_BURST', '90'))
+
+# Retries of a rate-limited or failed call, and the backoff between them in seconds
+API_MAX_RETRIES = int(os.getenv('API_MAX_RETRIES', '5'))
+API_BACKOFF_BASE = float(os.getenv('API_BACKOFF_BASE', '0.5'))
+# Longest wait before a retry; a Retry-After beyond it fails the call instead
+API_BACKOFF_MAX = float(os.getenv('API_BACKOFF_MAX', '32'))
+
+# Gmail quota units per method, from https://developers.google.com/gmail/api/reference/quota
+GMAIL_QUOTA_UNITS = {
+    'gmail.users.getProfile': 1,
+    'gmail.users.watch': 100,
+    'gmail.users.stop': 50,
+    'gmail.users.history.list': 2,
+    'gmail.users.labels.get': 1,
+    'gmail.users.labels.list': 1,
+    'gmail.users.messages.get': 5,
+    'gmail.users.messages.list': 5,
+    'gmail.users.messages.attachments.get': 5,
+    'gmail.users.threads.get': 10,
+    'gmail.users.threads.list': 10,
+}
+DEFAULT_GMAIL_QUOTA_UNITS = 5
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+
+def get_quota_units(method_id: Optional[str]) -> float:
+    """Get the quota cost of an API method: Gmail units, or one People request."""
+    if method_id and method_id.startswith('gmail.'):
+        return GMAIL_QUOTA_UNITS.get(method_id, DEFAULT_GMAIL_QUOTA_UNITS)
+    return 1
+
+def get_api_name(method_id: Optional[str]) -> str:
+    return method_id.split('.', 1)[0] if method_id else 'gmail'
+
+def get_quota_key(creds) -> str:
+    """Identify the user behind credentials without keeping their tokens around."""
+    secret = getattr(creds, 'refresh_token', None) or getattr(creds, 'token', None) or ''
+    return hashlib.sha1(secret.encode()).hexdigest()[:16]
+
+def get_error_reason(content) -> Optional[str]:
+    """Read the first error reason (e.g. rateLimitExceeded) from a Google API error body."""
+    try:
+        if isinstance(content, bytes):
+            content = content.decode('utf-8')
+        error = json.loads(content)['error']
+        if error.get('errors'):
+            return error['errors'][0].get('reason')
+        for detail in error.get('details', []):
+            if detail.get('reason'):
+                return detail['reason']
+    except Exception:
+        pass
+    return None
+
+def parse_retry_after(value) -> Optional[float]:
+    """Parse a Retry-After header given in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+def is_retryable(status: int, reason: Optional[str] = None) -> bool:
+    """Check whether a failed call should be retried after a backoff."""
+    return status in RETRYABLE_STATUSES or (status == 403 and reason in RATE_LIMIT_REASONS)
+
+def is_rate_limited(status: int, reason: Optional[str] = None) -> bool:
+    return status == 429 or (status == 403 and reason in RATE_LIMIT_REASONS)
+
+def get_backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff, or the server's Retry-After plus a little jitter."""
+    if retry_after is not None:
+        return retry_after + random.uniform(0, API_BACKOFF_BASE)
+    return random.uniform(0, min(API_BACKOFF_MAX, API_BACKOFF_BASE * 2 ** attempt))
+
+class TokenBucket:
+    """
+    Quota bucket refilled continuously at `rate` units per second up to `capacity`.
+
+    Reservations always succeed and may run the bucket into debt; the caller
+    waits the returned delay, so concurrent callers queue up behind each
+    other instead of all retrying at once.
+    """
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.blocked_until = 0.0
+
+    def reserve(self, units: float, now: float) -> float:
+        """Take units from the bucket. Returns the seconds to wait before using them."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= units
+        delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(delay, self.blocked_until - now)
+
+    def block(self, seconds: float, now: float):
+        """Hold back every caller of this bucket, after the API answered with a rate limit."""
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+class ApiScheduler:
+    """
+    Paces Google API calls per user and retries the ones that fail transiently.
+
+    Each (API, user) pair gets a token bucket sized to the API's quota, and
+    every call reserves its cost before it is sent. Rate-limited and 5xx
+    responses are retried with jittered exponential backoff, honouring
+    Retry-After, and a rate limit also holds back the user's other calls.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[float, float]]] = None,
+                 max_retries: int = None, sleep: Callable[[float], None] = time.sleep,
+                 clock: Callable[[], float] = time.monotonic):
+        self.limits = limits or {
+            'gmail': (GMAIL_QUOTA_UNITS_PER_SECOND, GMAIL_QUOTA_BURST),
+            'people': (PEOPLE_REQUESTS_PER_SECOND, PEOPLE_REQUEST_BURST),
+        }
+        self.max_retries = API_MAX_RETRIES if max_retries is None else max_retries
+        self.sleep = sleep
+        self.clock = clock
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            'calls': 0,
+            'quota_units': 0,
+            'throttled': 0,
+            'throttled_seconds': 0.0,
+            'rate_limited': 0,
+            'retried': 0,
+            'failed': 0,
+        }
+
+    def _get_bucket(self, api: str, quota_key: str) -> TokenBucket:
+        bucket = self._buckets.get((api, quota_key))
+        if bucket is None:
+            rate, capacity = self.limits.get(api, self.limits['gmail'])
+            bucket = self._buckets[(api, quota_key)] = TokenBucket(rate, capacity, self.clock())
+        return bucket
+
+    def reserve(self, api: str, quota_key: str, units: float) -> float:
+        """Reserve quota for a call. Returns the seconds to wait before sending it."""
+        with self._lock:
+            delay = self._get_bucket(api, quota_key).reserve(units, self.clock())
+            self.stats['calls'] += 1
+            self.stats['quota_units'] += units
+            if delay > 0:
+                self.stats['throttled'] += 1
+                self.stats['throttled_seconds'] += delay
+        return delay
+
+    def record_failure(self, api: str, quota_key: str, attempt: int, status: int,
+                       reason: Optional[str] = None, retry_after: Optional[float] = None) -> Optional[float]:
+        """
+        Account for a failed call.
+
+        Returns:
+            Seconds to wait before retrying, or None if the call should fail
+        """
+        rate_limited = is_rate_limited(status, reason)
+        with self._lock:
+            if rate_limited:
+                self.stats['rate_limited'] += 1
+            if (not is_retryable(status, reason) or attempt >= self.max_retries
+                    or (retry_after is not None and retry_after > API_BACKOFF_MAX)):
+                self.stats['failed'] += 1
+                return None
+            delay = get_backoff_delay(attempt, retry_after)
+            if rate_limited:
+                self._get_bucket(api, quota_key).block(delay, self.clock())
+            self.stats['retried'] += 1
+        logger.warning(f"{api} call failed with {status} {reason or ''}, retrying in {delay:.2f}s")
+        return delay
+
+    def execute(self, quota_key: str, method_id: Optional[str], send: Callable[[], Any],
+                units: Optional[float] = None) -> Any:
+        """Send a call through the user's quota bucket, retrying transient failures."""
+        api = get_api_name(method_id)
+        if units is None:
+            units = get_quota_units(method_id)
+        attempt = 0
+        while True:
+            delay = self.reserve(api, quota_key, units)
+            if delay > 0:
+                self.sleep(delay)
+            try:
+                return send()
+            except HttpError as e:
+                delay = self.record_failure(
+                    api, quota_key, attempt, e.resp.status, get_error_reason(e.content),
+                    parse_retry_after(e.resp.get('retry-after')))
+                if delay is None:
+                    raise
+            self.sleep(delay)
+            attempt += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, buckets=len(self._buckets))
+
+class ScheduledHttpRequest(HttpRequest):
+    """
+    An API request whose execute() goes through the process-wide scheduler.
+
+    With an http_factory, each execute() without an explicit http is sent over
+    the transport it returns instead of the one the service was built with.
+    """
+
+    quota_key = None
+    http_factory = None
+
+    def execute(self, http=None, num_retries=0):
+        if http is None and self.http_factory is not None:
+            http = self.http_factory()
+        return get_api_scheduler().execute(
+            self.quota_key, self.methodId,
+            lambda: HttpRequest.execute(self, http=http, num_retries=num_retries))
+
+def scheduled_request_builder(quota_key: str,
+                              http_factory: Optional[Callable[[], Any]] = None) -> Callable[..., ScheduledHttpRequest]:
+    """Build a requestBuilder for googleapiclient services that schedules calls for one user."""
+    def build_request(*args, **kwargs):
+        request = ScheduledHttpRequest(*args, **kwargs)
+        request.quota_key = quota_key
+        request.http_factory = http_factory
+        return request
+    return build_request
+
+def execute_batch(batch, requests) -> Any:
+    """Send a batch request through the scheduler, costed as the sum of its calls."""
+    scheduled = [request for request in requests if isinstance(request, ScheduledHttpRequest)]
+    if not scheduled:
+        return batch.execute()
+    http = scheduled[0].http_factory() if scheduled[0].http_factory is not None else None
+    return get_api_scheduler().execute(
+        scheduled[0].quota_key, scheduled[0].methodId, lambda: batch.execute(http=http),
+        units=sum(get_quota_units(request.methodId) for request in scheduled))
+
+def retry_failed_calls(requests_by_id, results, errors):
+    """
+    Retry the calls of a batch that failed transiently, one by one.
+
+    The batch endpoint answers rate limits per call, so they arrive as errors
+    of individual calls rather than of the batch. Retried calls are moved
+    from errors to results when they succeed.
+    """
+    scheduler = get_api_scheduler()
+    retry_ids = []
+    delay = 0.0
+    for request_id, error in errors.items():
+        request = requests_by_id[request_id]
+        if not isinstance(error, HttpError) or not isinstance(request, ScheduledHttpRequest):
+            continue
+        call_delay = scheduler.record_failure(
+            get_api_name(request.methodId), request.quota_key, 0, error.resp.status,
+            get_error_reason(error.content), parse_retry_after(error.resp.get('retry-after')))
+        if call_delay is not None:
+            retry_ids.append(request_id)
+            delay = max(delay, call_delay)
+
+    if retry_ids:
+        scheduler.sleep(delay)
+    for request_id in retry_ids:
+        try:
+            results[request_id] = requests_by_id[request_id].execute()
+            del errors[request_id]
+        except Exception as e:
+            errors[request_id] = e
+
+_api_scheduler = None
+_api_scheduler_lock = threading.Lock()
+
+def get_api_scheduler() -> ApiScheduler:
+    """Get the process-wide API scheduler, creating it on first use."""
+    global _api_scheduler
+    with _api_scheduler_lock:
+        if _api_scheduler is None:
+            _api_scheduler = ApiScheduler()
+        return _api_scheduler
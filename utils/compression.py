@@ -0,0 +1,46 @@
+import os
+import gzip
+from typing import Iterable, List, Optional
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Responses smaller than this many bytes are sent uncompressed
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+# gzip level and brotli quality; mid-range settings keep compression cheap per request
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', '5'))
+
+def available_encodings() -> List[str]:
+    """Content codings this server can produce, most preferred first."""
+    return (['br'] if brotli is not None else []) + ['gzip']
+
+def choose_encoding(accept_encodings, encodings: Optional[Iterable[str]] = None) -> Optional[str]:
+    """
+    Pick the content coding for a request.
+
+    Args:
+        accept_encodings: The request's parsed Accept-Encoding (werkzeug Accept)
+        encodings: Codings to choose from (defaults to available_encodings())
+
+    Returns:
+        The client's highest-quality coding, ties going to brotli, or None
+    """
+    encodings = list(available_encodings() if encodings is None else encodings)
+    best = None
+    best_quality = 0
+    for encoding in encodings:
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        # mtime=0 keeps the output identical for identical input
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Unsupported content coding: {encoding}")
@@ -0,0 +1,150 @@
+import os
+import time
+import logging
+import threading
+from typing import Dict, Optional, Tuple, Any
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Seconds before an index is considered stale and incrementally re-synced
+CONTACTS_INDEX_TTL = int(os.getenv('CONTACTS_INDEX_TTL', '600'))
+
+# Maximum page size accepted by people.connections.list
+CONTACTS_PAGE_SIZE = 1000
+
+def pick_photo_url(person: Dict[str, Any]) -> Optional[str]:
+    """Pick the best photo URL for a person, preferring the primary non-default photo."""
+    photos = person.get('photos') or []
+    for photo in photos:
+        if photo.get('metadata', {}).get('primary') and not photo.get('default', False):
+            return photo.get('url')
+    # Fallback to the first photo if no primary found
+    return photos[0].get('url') if photos else None
+
+class ContactsIndex:
+    """In-memory email -> photo URL index over a user's Google contacts."""
+
+    def __init__(self, ttl: int = CONTACTS_INDEX_TTL):
+        self.ttl = ttl
+        self.sync_token = None
+        self.synced_at = None
+        # email -> (resourceName, photo URL)
+        self._entries: Dict[str, Tuple[str, Optional[str]]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_photo(self, email_address: str) -> Optional[str]:
+        """Look up the photo URL for an email address."""
+        if not email_address:
+            return None
+        entry = self._entries.get(email_address.lower())
+        return entry[1] if entry else None
+
+    def is_stale(self) -> bool:
+        """Check if the index was never loaded or is older than its TTL."""
+        return self.synced_at is None or time.monotonic() - self.synced_at > self.ttl
+
+    def ensure_fresh(self, people_service) -> 'ContactsIndex':
+        """
+        Load the index on first use and re-sync it once the TTL expires.
+
+        Errors are logged and the previous contents are kept, so lookups keep
+        working while the People API is unavailable.
+        """
+        if not self.is_stale():
+            return self
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            if not self.is_stale():
+                return self
+            try:
+                if self.sync_token:
+                    self._sync(people_service)
+                else:
+                    self._load(people_service)
+            except Exception as e:
+                logger.error(f"Error refreshing contacts index: {e}")
+                # Back off for a full TTL instead of retrying on every lookup
+                self.synced_at = time.monotonic()
+        return self
+
+    def _list_connections(self, people_service, sync_token: Optional[str] = None):
+        """Yield every connection page by page, returning the next sync token."""
+        page_token = None
+        while True:
+            params = {
+                'resourceName': 'people/me',
+                'pageSize': CONTACTS_PAGE_SIZE,
+                'personFields': 'photos,emailAddresses,metadata',
+                'requestSyncToken': True
+            }
+            if sync_token:
+                params['syncToken'] = sync_token
+            if page_token:
+                params['pageToken'] = page_token
+            results = people_service.people().connections().list(**params).execute()
+            for person in results.get('connections', []):
+                yield person
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                self.sync_token = results.get('nextSyncToken')
+                return
+
+    def _load(self, people_service):
+        """Build the index from a full, paginated listing of connections."""
+        entries = {}
+        for person in self._list_connections(people_service):
+            self._index_person(entries, person)
+        self._entries = entries
+        self.synced_at = time.monotonic()
+        logger.info(f"Loaded contacts index with {len(entries)} email addresses")
+
+    def _sync(self, people_service):
+        """Apply changes since the last sync token, falling back to a full load if it expired."""
+        entries = dict(self._entries)
+        try:
+            changed = list(self._list_connections(people_service, self.sync_token))
+        except Exception as e:
+            logger.warning(f"Contacts sync token rejected, reloading index: {e}")
+            self.sync_token = None
+            self._load(people_service)
+            return
+
+        for person in changed:
+            resource_name = person.get('resourceName')
+            # Drop the previous addresses of a changed or deleted contact
+            for email, (owner, _) in list(entries.items()):
+                if owner == resource_name:
+                    del entries[email]
+            if not person.get('metadata', {}).get('deleted'):
+                self._index_person(entries, person)
+
+        self._entries = entries
+        self.synced_at = time.monotonic()
+        logger.info(f"Applied {len(changed)} contact changes to contacts index")
+
+    @staticmethod
+    def _index_person(entries: Dict[str, Tuple[str, Optional[str]]], person: Dict[str, Any]):
+        """Add a person's email addresses to the index if they have a photo."""
+        photo_url = pick_photo_url(person)
+        if not photo_url:
+            return
+        for email_info in person.get('emailAddresses', []):
+            email = email_info.get('value', '').lower()
+            if email:
+                entries[email] = (person.get('resourceName'), photo_url)
+
+# Per-user contact indexes
+_indexes: Dict[str, ContactsIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_contacts_index(user_key: str) -> ContactsIndex:
+    """Get the contacts index for a user, creating an empty one if needed."""
+    with _indexes_lock:
+        index = _indexes.get(user_key)
+        if index is None:
+            index = _indexes[user_key] = ContactsIndex()
+        return index
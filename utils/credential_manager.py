@@ -0,0 +1,190 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional
+
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Seconds before expiry at which the background refresher renews an access token
+CREDENTIAL_REFRESH_MARGIN = int(os.getenv('CREDENTIAL_REFRESH_MARGIN', '300'))
+# Seconds between background refresh passes
+CREDENTIAL_REFRESH_INTERVAL = int(os.getenv('CREDENTIAL_REFRESH_INTERVAL', '60'))
+# Seconds without a request after which a user's token is no longer kept fresh
+CREDENTIAL_IDLE_TIMEOUT = int(os.getenv('CREDENTIAL_IDLE_TIMEOUT', '3600'))
+
+def utcnow() -> datetime:
+    """Naive UTC now, as google-auth stores credential expiry."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def credentials_from_token_data(token_data: Dict[str, Any]) -> Credentials:
+    """Build credentials from the token dict kept in session['google_token']."""
+    expiry = token_data.get('expiry')
+    return Credentials(
+        token=token_data['token'],
+        refresh_token=token_data.get('refresh_token'),
+        token_uri=token_data['token_uri'],
+        client_id=token_data['client_id'],
+        client_secret=token_data['client_secret'],
+        scopes=token_data['scopes'],
+        expiry=datetime.fromisoformat(expiry) if expiry else None
+    )
+
+def token_data_from_credentials(creds: Credentials) -> Dict[str, Any]:
+    """Serialise credentials for session['google_token'], including the access token's expiry."""
+    return {
+        'token': creds.token,
+        'refresh_token': creds.refresh_token,
+        'token_uri': creds.token_uri,
+        'client_id': creds.client_id,
+        'client_secret': creds.client_secret,
+        'scopes': creds.scopes,
+        'expiry': creds.expiry.isoformat() if creds.expiry else None
+    }
+
+class _Record:
+    def __init__(self, creds: Credentials):
+        self.creds = creds
+        self.last_used = time.monotonic()
+
+class CredentialManager:
+    """
+    Keeps each user's OAuth credentials fresh and shared across requests.
+
+    Every request of a user gets the same credentials object, so a token
+    refreshed by one request, a sync loop or the 401 retry of the API client
+    is used by all of them. Refreshes are serialised per user, and a
+    background thread renews tokens that are about to expire for users seen
+    in the last `idle_timeout` seconds, so requests rarely pay for a refresh.
+    """
+
+    def __init__(self, refresh_margin: int = CREDENTIAL_REFRESH_MARGIN,
+                 refresh_interval: int = CREDENTIAL_REFRESH_INTERVAL,
+                 idle_timeout: int = CREDENTIAL_IDLE_TIMEOUT,
+                 request_factory: Callable[[], Any] = Request):
+        self.refresh_margin = refresh_margin
+        self.refresh_interval = refresh_interval
+        self.idle_timeout = idle_timeout
+        self.request_factory = request_factory
+        self._records: Dict[str, _Record] = {}
+        self._refresh_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {'refreshes': 0, 'background_refreshes': 0, 'refresh_failures': 0}
+
+    def get_credentials(self, user_key: str, token_data: Dict[str, Any]) -> Credentials:
+        """Get the user's shared credentials, refreshing them first if they have expired."""
+        session_creds = credentials_from_token_data(token_data)
+        with self._lock:
+            record = self._records.get(user_key)
+            # A new login, or a token refreshed by another process, replaces the shared copy
+            if (record is None or record.creds.refresh_token != session_creds.refresh_token
+                    or (session_creds.expiry and (record.creds.expiry is None
+                                                  or session_creds.expiry > record.creds.expiry))):
+                record = self._records[user_key] = _Record(session_creds)
+            record.last_used = time.monotonic()
+        self.start()
+        return self.ensure_fresh(user_key, record.creds)
+
+    def get_stored_credentials(self, user_key: str) -> Optional[Credentials]:
+        """Get the credentials kept for user_key, for work done outside their requests, or None."""
+        with self._lock:
+            record = self._records.get(user_key)
+            return record.creds if record else None
+
+    def _is_due(self, creds: Credentials, margin: Optional[int],
+                rejected_token: Optional[str] = None) -> bool:
+        if not creds.refresh_token:
+            return False
+        if rejected_token is not None:
+            # Unless another caller already replaced the token the API turned down
+            return creds.token == rejected_token
+        if margin is None:
+            return creds.expired
+        # Without a known expiry the token is left to the API client's 401 retry
+        return creds.expiry is not None and creds.expiry - timedelta(seconds=margin) <= utcnow()
+
+    def _get_refresh_lock(self, user_key: str) -> threading.Lock:
+        with self._lock:
+            return self._refresh_locks.setdefault(user_key, threading.Lock())
+
+    def ensure_fresh(self, user_key: str, creds: Credentials, margin: Optional[int] = None,
+                     background: bool = False, rejected_token: Optional[str] = None) -> Credentials:
+        """
+        Refresh creds if they expire within margin seconds (or have expired, by default).
+
+        Pass rejected_token, the access token an API call was answered 401
+        for, to refresh creds whatever their expiry says.
+        """
+        if not self._is_due(creds, margin, rejected_token):
+            return creds
+        with self._get_refresh_lock(user_key):
+            # Another thread may have refreshed them while this one waited
+            if self._is_due(creds, margin, rejected_token):
+                try:
+                    creds.refresh(self.request_factory())
+                except Exception:
+                    with self._lock:
+                        self.stats['refresh_failures'] += 1
+                    raise
+                with self._lock:
+                    self.stats['background_refreshes' if background else 'refreshes'] += 1
+        return creds
+
+    def refresh_expiring(self):
+        """Renew tokens of recently active users that expire within the refresh margin."""
+        now = time.monotonic()
+        with self._lock:
+            for user_key in [user_key for user_key, record in self._records.items()
+                             if now - record.last_used > self.idle_timeout]:
+                del self._records[user_key]
+                self._refresh_locks.pop(user_key, None)
+            records = list(self._records.items())
+
+        for user_key, record in records:
+            try:
+                self.ensure_fresh(user_key, record.creds, self.refresh_margin, background=True)
+            except Exception as e:
+                logger.error(f"Error refreshing credentials for {user_key}: {e}")
+
+    def forget(self, user_key: str):
+        """Stop keeping the user's credentials, e.g. on logout."""
+        with self._lock:
+            self._records.pop(user_key, None)
+            self._refresh_locks.pop(user_key, None)
+
+    def start(self):
+        """Start the background refresher, if it is not running yet."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_interval):
+            self.refresh_expiring()
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats, users=len(self._records))
+
+_credential_manager = None
+_credential_manager_lock = threading.Lock()
+
+def get_credential_manager() -> CredentialManager:
+    """Get the process-wide credential manager, creating it on first use."""
+    global _credential_manager
+    with _credential_manager_lock:
+        if _credential_manager is None:
+            _credential_manager = CredentialManager()
+        return _credential_manager
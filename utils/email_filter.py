@@ -1,7 +1,11 @@
 import re
+import json
+import hashlib
 import logging
-from typing import List, Dict, Any, Tuple
-from dataclasses import dataclass
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+from dataclasses import dataclass, asdict
 from .filter_config import JOB_KEYWORDS, JOB_DOMAINS, REGEX_PATTERNS, CONFIDENCE_SCORES, FILTER_SETTINGS
 
 # Configure logging
@@ -15,6 +19,127 @@ class FilterRule:
     confidence: float  # 0.0 to 1.0
     description: str
 
+class CompiledRuleSet:
+    """
+    Filter rules compiled for matching many emails.
+
+    Keywords are folded into one regex, domains into a set, and regex rules
+    are compiled once. match() returns the indices of the matching rules in
+    rule order, so callers produce the same matched_rules as a rule-by-rule loop.
+    Domain rules match the exact domain unless match_subdomains is set.
+    """
+
+    def __init__(self, rules: List[FilterRule], match_subdomains: bool = False):
+        self.match_subdomains = match_subdomains
+        self.keyword_rules: Dict[str, List[int]] = {}
+        self.domain_rules: Dict[str, List[int]] = {}
+        self.regex_rules: List[Tuple[int, re.Pattern]] = []
+
+        for index, rule in enumerate(rules):
+            if rule.rule_type == 'keyword':
+                self.keyword_rules.setdefault(rule.pattern, []).append(index)
+            elif rule.rule_type == 'domain':
+                self.domain_rules.setdefault(rule.pattern, []).append(index)
+            elif rule.rule_type == 'regex':
+                try:
+                    self.regex_rules.append((index, re.compile(rule.pattern, re.IGNORECASE)))
+                except re.error:
+                    logger.warning(f"Invalid regex pattern: {rule.pattern}")
+
+        # Longest keywords first, so the keyword found at a position is the
+        # longest one starting there and any shorter keyword starting at the
+        # same position is a substring of it
+        keywords = sorted(self.keyword_rules, key=len, reverse=True)
+        self.keyword_regex: Optional[re.Pattern] = None
+        if keywords:
+            self.keyword_regex = re.compile(
+                '(?=(' + '|'.join(re.escape(keyword) for keyword in keywords) + '))')
+        self.contained_keywords = {
+            keyword: [other for other in keywords if other != keyword and other in keyword]
+            for keyword in keywords
+        }
+
+    def match_keywords(self, subject: str) -> List[int]:
+        """Get the indices of keyword rules found in a lowercased subject."""
+        if self.keyword_regex is None:
+            return []
+        found = set()
+        for match in self.keyword_regex.finditer(subject):
+            keyword = match.group(1)
+            if keyword not in found:
+                found.add(keyword)
+                found.update(self.contained_keywords[keyword])
+        return [index for keyword in found for index in self.keyword_rules[keyword]]
+
+    def match_domain(self, address: str) -> List[int]:
+        """Get the indices of domain rules matching a lowercased address's domain, or any parent domain."""
+        domain = address.split('@')[-1]
+        if not self.match_subdomains:
+            return list(self.domain_rules.get(domain, ()))
+        matched = []
+        while domain:
+            matched.extend(self.domain_rules.get(domain, ()))
+            domain = domain.partition('.')[2]
+        return matched
+
+    def match(self, subject: str, sender_email: str, from_header: str) -> List[int]:
+        """Get the indices of every rule matching the lowercased email fields, in rule order."""
+        matched = set(self.match_keywords(subject))
+        if self.domain_rules:
+            matched.update(self.match_domain(sender_email))
+            matched.update(self.match_domain(from_header))
+        if self.regex_rules:
+            all_text = f"{subject} {sender_email} {from_header}"
+            matched.update(index for index, regex in self.regex_rules if regex.search(all_text))
+        return sorted(matched)
+
+class ClassificationCache:
+    """Thread-safe LRU cache of filter_email() results with hit/miss/eviction counters."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Tuple[str, str]) -> Optional[Tuple[bool, List[Dict[str, Any]]]]:
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def set(self, key: Tuple[str, str], result: Tuple[bool, List[Dict[str, Any]]]):
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
 class JobEmailFilter:
     """High-confidence filter for job application emails."""
     
@@ -26,8 +151,31 @@ class JobEmailFilter:
         self.confidence_scores = CONFIDENCE_SCORES
         self.settings = FILTER_SETTINGS
         
+        # Results are cached per message id and rule configuration
+        self.cache = ClassificationCache(self.settings['max_cache_size'])
+        
         # Build filter rules
+        self.reload_rules()
+    
+    def reload_rules(self):
+        """
+        Rebuild the rules from the current configuration.
+        
+        Cached results are keyed by the configuration hash, so results
+        computed under the previous rules are no longer returned.
+        """
         self.rules = self._build_rules()
+        self.compiled_rules = CompiledRuleSet(self.rules, self.settings['match_subdomains'])
+        self.config_hash = self._config_hash()
+    
+    def _config_hash(self) -> str:
+        """Hash the active rules, the confidence threshold and the domain matching mode."""
+        config = {
+            'rules': [asdict(rule) for rule in self.rules],
+            'min_confidence': self.settings['min_confidence'],
+            'match_subdomains': self.settings['match_subdomains']
+        }
+        return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()
         
     def _build_rules(self) -> List[FilterRule]:
         """Build the list of filtering rules."""
@@ -73,9 +221,12 @@ class JobEmailFilter:
         return keyword.lower() in text.lower()
     
     def matches_domain(self, email: str, domain: str) -> bool:
-        """Check if email domain matches the target domain."""
+        """Check if email domain matches the target domain, or a subdomain of it when enabled."""
         email_domain = self.extract_domain(email)
-        return email_domain == domain.lower()
+        domain = domain.lower()
+        if email_domain == domain:
+            return True
+        return self.settings['match_subdomains'] and email_domain.endswith('.' + domain)
     
     def matches_regex(self, text: str, pattern: str) -> bool:
         """Check if text matches regex pattern."""
@@ -95,37 +246,32 @@ class JobEmailFilter:
         Returns:
             Tuple of (is_job_related, matched_rules)
         """
-        matched_rules = []
-        subject = email.get('subject', '').lower()
-        sender_email = email.get('sender_email', '').lower()
-        from_header = email.get('from', '').lower()
+        cache_key = None
+        if self.settings['cache_results'] and email.get('id'):
+            cache_key = (email['id'], self.config_hash)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                is_job_related, matched_rules = cached
+                return is_job_related, list(matched_rules)
         
-        # Combine all text fields for regex matching
-        all_text = f"{subject} {sender_email} {from_header}"
+        matched_rules = []
+        subject = (email.get('subject') or '').lower()
+        sender_email = (email.get('sender_email') or '').lower()
+        from_header = (email.get('from') or '').lower()
         
-        for rule in self.rules:
-            is_match = False
+        for index in self.compiled_rules.match(subject, sender_email, from_header):
+            rule = self.rules[index]
+            matched_rules.append({
+                'rule_type': rule.rule_type,
+                'pattern': rule.pattern,
+                'confidence': rule.confidence,
+                'description': rule.description
+            })
             
-            if rule.rule_type == 'keyword':
-                is_match = self.matches_keyword(subject, rule.pattern)
-            elif rule.rule_type == 'domain':
-                is_match = (self.matches_domain(sender_email, rule.pattern) or 
-                           self.matches_domain(from_header, rule.pattern))
-            elif rule.rule_type == 'regex':
-                is_match = self.matches_regex(all_text, rule.pattern)
-            
-            if is_match:
-                matched_rules.append({
-                    'rule_type': rule.rule_type,
-                    'pattern': rule.pattern,
-                    'confidence': rule.confidence,
-                    'description': rule.description
-                })
-                
-                # Log the match for analysis
-                logger.info(f"Email matched rule: {rule.description}")
-                logger.info(f"  Subject: {email.get('subject', 'No subject')}")
-                logger.info(f"  From: {email.get('from', 'Unknown')}")
+            # Log the match for analysis
+            logger.info(f"Email matched rule: {rule.description}")
+            logger.info(f"  Subject: {email.get('subject', 'No subject')}")
+            logger.info(f"  From: {email.get('from', 'Unknown')}")
         
         # Consider it a job email if we have at least one high-confidence match
         # and the confidence meets the minimum threshold
@@ -137,6 +283,9 @@ class JobEmailFilter:
         elif self.settings['log_unmatched']:
             logger.debug(f"Email not classified as job-related: {email.get('subject', 'No subject')}")
         
+        if cache_key is not None:
+            self.cache.set(cache_key, (is_job_related, list(matched_rules)))
+        
         return is_job_related, matched_rules
     
     def filter_emails(self, emails: List[Dict[str, Any]]) -> Dict[str, Any]:
@@ -187,7 +336,9 @@ class JobEmailFilter:
             'regex_pattern_count': len(self.regex_patterns),
             'total_rules': len(self.rules),
             'keywords': self.job_keywords,
-            'domains': self.job_domains
+            'domains': self.job_domains,
+            'config_hash': self.config_hash,
+            'cache': dict(self.cache.get_stats(), enabled=self.settings['cache_results'])
         }
 
 # Global filter instance
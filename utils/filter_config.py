@@ -36,6 +36,7 @@ CONFIDENCE_SCORES = {
 # Filter settings
 FILTER_SETTINGS = {
     'min_confidence': 0.8,           # Minimum confidence to consider an email job-related
+    'match_subdomains': False,       # Also match subdomains of job domains (e.g. mail.linkedin.com)
     'enable_logging': True,          # Enable detailed logging of matches
     'log_unmatched': False,          # Log emails that don't match (for debugging)
     'cache_results': True,           # Cache filtered results to avoid recomputation
@@ -1,21 +1,88 @@
 # Filters emails where subject contains high-confidence keywords or from address/domain matches known job boards        
 
+import os
+from .filter_config import JOB_KEYWORDS, JOB_DOMAINS
+
+# Longest search query sent to Gmail; longer queries are split into several
+GMAIL_MAX_QUERY_LENGTH = int(os.getenv('GMAIL_MAX_QUERY_LENGTH', '1024'))
+
 class GmailPreFilter:
-    def __init__(self):
-        self.JOB_KEYWORDS = ['applied', 'application', 'interview', 'recruiter', 'job', 'career']
-        self.JOB_DOMAINS = ['linkedin.com', 'indeed.com', 'jobvite.com', 'workday.com']
+    """
+    Builds Gmail search queries that select candidate job emails server-side.
+
+    Gmail matches whole words while JobEmailFilter matches keywords anywhere
+    in the subject, so each keyword is searched together with its plural
+    ("application" also finds "applications"). Keywords inside other words,
+    such as "job" in "jobseekers", are still not candidates; that is the
+    known recall limit of the first stage, and JobEmailFilter remains the
+    precise second stage.
+    """
 
-        self.JOB_KEYWORDS_QUERY = ' OR '.join(self.JOB_KEYWORDS)
-        self.JOB_DOMAINS_QUERY = ' OR '.join(self.JOB_DOMAINS)
+    def __init__(self, keywords=None, domains=None, max_query_length=None):
+        self.JOB_KEYWORDS = list(JOB_KEYWORDS if keywords is None else keywords)
+        self.JOB_DOMAINS = list(JOB_DOMAINS if domains is None else domains)
+        self.max_query_length = max_query_length or GMAIL_MAX_QUERY_LENGTH
+        self.SUBJECT_TERMS = list(dict.fromkeys(
+            form for keyword in self.JOB_KEYWORDS for form in self.word_forms(keyword)))
+
+        self.JOB_KEYWORDS_QUERY = ' OR '.join(self.quote(term) for term in self.SUBJECT_TERMS)
+        self.JOB_DOMAINS_QUERY = ' OR '.join(self.quote(domain) for domain in self.JOB_DOMAINS)
 
         self.JOB_KEYWORDS_QUERY = f'subject:({self.JOB_KEYWORDS_QUERY})' if self.JOB_KEYWORDS_QUERY else ''
         self.JOB_DOMAINS_QUERY = f'from:({self.JOB_DOMAINS_QUERY})' if self.JOB_DOMAINS_QUERY else ''
 
-        self.JOB_QUERY = f'{self.JOB_KEYWORDS_QUERY} {self.JOB_DOMAINS_QUERY}'
+        # Either condition selects a candidate
+        self.JOB_QUERY = ' OR '.join(query for query in [self.JOB_KEYWORDS_QUERY, self.JOB_DOMAINS_QUERY] if query)
+
+    @staticmethod
+    def word_forms(keyword):
+        """The keyword and, for single words, its plural."""
+        keyword = keyword.lower()
+        if ' ' in keyword or keyword.endswith(('s', 'ed')):
+            return [keyword]
+        if keyword.endswith('y') and keyword[-2:-1] not in 'aeiou':
+            return [keyword, keyword[:-1] + 'ies']
+        return [keyword, keyword + 's']
+
+    @staticmethod
+    def quote(term):
+        """Quote a search term that contains spaces or quotes."""
+        if any(char in term for char in ' "()'):
+            return '"' + term.replace('"', '') + '"'
+        return term
 
     def get_job_query(self):
+        """Get the whole candidate query, regardless of length."""
         return self.JOB_QUERY
     
+    def get_job_queries(self):
+        """
+        Split the candidate query into queries no longer than max_query_length.
+
+        Each query ORs together a group of subject keywords or sender domains,
+        and together they cover every keyword and domain exactly once.
+        """
+        queries = []
+        for operator, terms in [('subject', self.SUBJECT_TERMS), ('from', self.JOB_DOMAINS)]:
+            group = []
+            for term in (self.quote(term) for term in terms):
+                candidate = f'{operator}:({" OR ".join(group + [term])})'
+                if group and len(candidate) > self.max_query_length:
+                    queries.append(f'{operator}:({" OR ".join(group)})')
+                    group = []
+                group.append(term)
+            if group:
+                queries.append(f'{operator}:({" OR ".join(group)})')
+
+        # Pack the groups into as few queries as fit
+        packed = []
+        for query in queries:
+            if packed and len(packed[-1]) + len(' OR ') + len(query) <= self.max_query_length:
+                packed[-1] = f'{packed[-1]} OR {query}'
+            else:
+                packed.append(query)
+        return packed
+
     def apply_filter(self, emails):
         """
         Filters emails for job-related content.
@@ -49,4 +116,6 @@ class GmailPreFilter:
     
 if __name__ == "__main__":
     pre_filter = GmailPreFilter()
-    print(pre_filter.get_job_query())
\ No newline at end of file
+    print(pre_filter.get_job_query())
+    for query in pre_filter.get_job_queries():
+        print(query)
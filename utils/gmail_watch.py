@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from base64 import b64decode, b64encode
+from typing import Any, Dict, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# SQLite file holding each user's Gmail watch lease
+WATCH_LEASE_PATH = os.getenv('WATCH_LEASE_PATH', 'watch_leases.db')
+# Seconds before a watch expires at which it is renewed (leases last about 7 days)
+WATCH_RENEWAL_MARGIN = int(os.getenv('WATCH_RENEWAL_MARGIN', str(24 * 3600)))
+# Seconds to wait before retrying a watch that failed to start
+WATCH_RETRY_INTERVAL = int(os.getenv('WATCH_RETRY_INTERVAL', '300'))
+
+def encode_push_envelope(email_address: str, history_id: str, message_id: str = '1') -> Dict[str, Any]:
+    """Build the Pub/Sub push envelope Gmail sends for a mailbox change."""
+    data = json.dumps({'emailAddress': email_address, 'historyId': int(history_id)})
+    return {
+        'message': {
+            'data': b64encode(data.encode()).decode(),
+            'messageId': message_id,
+            'publishTime': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        },
+        'subscription': 'projects/local/subscriptions/gmail-push'
+    }
+
+def decode_push_envelope(envelope: Any) -> Dict[str, str]:
+    """
+    Read the Gmail notification out of a Pub/Sub push envelope.
+
+    Returns:
+        Dictionary with 'email_address' and 'history_id'
+
+    Raises:
+        ValueError: If the envelope or its notification is malformed
+    """
+    try:
+        data = envelope['message']['data']
+        notification = json.loads(b64decode(data, validate=False).decode())
+        email_address = notification['emailAddress']
+        history_id = notification['historyId']
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f'Malformed push envelope: {e}')
+    if not isinstance(email_address, str) or not email_address:
+        raise ValueError('Malformed push envelope: missing emailAddress')
+    return {'email_address': email_address.lower(), 'history_id': str(history_id)}
+
+class WatchLeaseManager:
+    """
+    Keeps one Gmail watch per user alive without re-registering it on every fetch.
+
+    Leases are stored with their expiration and the Gmail address they
+    notify for, so a push notification can be routed back to the user.
+    ensure_watch() only calls users().watch() when there is no lease or it
+    expires within renewal_margin seconds.
+
+    Each lease also keeps two historyIds: history_id, the cursor the user's
+    message store was synced to, and mailbox_history_id, the newest historyId
+    Gmail reported for the mailbox through the watch, pushes or syncs. While
+    the watch is live every change is pushed, so mailbox_history_id versions
+    the inbox without asking Gmail.
+    """
+
+    def __init__(self, path: str = WATCH_LEASE_PATH,
+                 renewal_margin: int = WATCH_RENEWAL_MARGIN,
+                 retry_interval: int = WATCH_RETRY_INTERVAL):
+        self.path = path
+        self.renewal_margin = renewal_margin
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        # One renewal at a time per user, so concurrent fetches share it
+        self._user_locks: Dict[str, threading.Lock] = {}
+        # Users whose last renewal failed, with the time it failed
+        self._failures: Dict[str, float] = {}
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS watch_leases ('
+            ' user_key TEXT PRIMARY KEY,'
+            ' email_address TEXT,'
+            ' topic_name TEXT,'
+            ' history_id TEXT,'
+            ' expiration REAL NOT NULL,'
+            ' renewed_at REAL NOT NULL,'
+            ' mailbox_history_id TEXT)'
+        )
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(watch_leases)')}
+        if 'mailbox_history_id' not in columns:
+            # Lease files written before the column existed
+            self._conn.execute('ALTER TABLE watch_leases ADD COLUMN mailbox_history_id TEXT')
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_watch_leases_email ON watch_leases (email_address)')
+        self._conn.commit()
+
+    def get_lease(self, user_key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT email_address, topic_name, history_id, expiration, renewed_at, mailbox_history_id '
+                'FROM watch_leases WHERE user_key = ?', (user_key,)).fetchone()
+        if row is None:
+            return None
+        return {'user_key': user_key, 'email_address': row[0], 'topic_name': row[1],
+                'history_id': row[2], 'expiration': row[3], 'renewed_at': row[4],
+                'mailbox_history_id': row[5]}
+
+    def set_lease(self, user_key: str, email_address: Optional[str], topic_name: str,
+                  history_id: Optional[str], expiration: float):
+        """Record a watch; expiration is in seconds since the epoch."""
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO watch_leases '
+                '(user_key, email_address, topic_name, history_id, expiration, renewed_at, mailbox_history_id) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (user_key, (email_address or '').lower() or None, topic_name, history_id,
+                 expiration, time.time(), history_id))
+            self._conn.commit()
+
+    def delete_lease(self, user_key: str):
+        with self._lock:
+            self._conn.execute('DELETE FROM watch_leases WHERE user_key = ?', (user_key,))
+            self._conn.commit()
+
+    def find_user(self, email_address: str) -> Optional[str]:
+        """Find the user whose watch notifies for a Gmail address."""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT user_key FROM watch_leases WHERE email_address = ? '
+                'ORDER BY renewed_at DESC LIMIT 1', (email_address.lower(),)).fetchone()
+        return row[0] if row else None
+
+    def needs_renewal(self, user_key: str, topic_name: str, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        lease = self.get_lease(user_key)
+        return (lease is None or lease['topic_name'] != topic_name
+                or lease['expiration'] - now <= self.renewal_margin)
+
+    def ensure_watch(self, service, user_key: str) -> Optional[Dict[str, Any]]:
+        """
+        Make sure user_key has a live watch, renewing it only when close to expiry.
+
+        Args:
+            service: Gmail API service instance of the user
+            user_key: User the watch belongs to
+
+        Returns:
+            The current lease, or None when watching is not configured or failed
+        """
+        topic_name = os.getenv('GMAIL_NOTIFICATION_TOPIC')
+        if not topic_name:
+            return None
+        if not self.needs_renewal(user_key, topic_name):
+            return self.get_lease(user_key)
+
+        with self._lock:
+            user_lock = self._user_locks.setdefault(user_key, threading.Lock())
+        with user_lock:
+            # Another request may have renewed it while we waited
+            if not self.needs_renewal(user_key, topic_name):
+                return self.get_lease(user_key)
+            failed_at = self._failures.get(user_key)
+            if failed_at is not None and time.time() - failed_at < self.retry_interval:
+                return None
+            try:
+                response = service.users().watch(
+                    userId='me', body={'labelIds': ['INBOX'], 'topicName': topic_name}).execute()
+                profile = service.users().getProfile(userId='me').execute()
+            except Exception as e:
+                logger.error(f"Error starting watch for {user_key}: {e}")
+                self._failures[user_key] = time.time()
+                return None
+
+            self._failures.pop(user_key, None)
+            # Gmail reports the expiration in milliseconds
+            expiration = int(response.get('expiration', 0)) / 1000
+            self.set_lease(user_key, profile.get('emailAddress'), topic_name,
+                           response.get('historyId'), expiration)
+            logger.info(f"Renewed watch for {user_key} until {time.ctime(expiration)}")
+            return self.get_lease(user_key)
+
+    def record_history_id(self, user_key: str, history_id: str):
+        """Store the historyId the user's message store was last synced to with their lease."""
+        with self._lock:
+            self._conn.execute(
+                'UPDATE watch_leases SET history_id = ? WHERE user_key = ?', (history_id, user_key))
+            self._conn.commit()
+        self.record_mailbox_history_id(user_key, history_id)
+
+    def record_mailbox_history_id(self, user_key: str, history_id: str):
+        """Remember a historyId Gmail reported for the mailbox, unless a newer one is known."""
+        if not history_id:
+            return
+        with self._lock:
+            self._conn.execute(
+                'UPDATE watch_leases SET mailbox_history_id = ? WHERE user_key = ? '
+                'AND (mailbox_history_id IS NULL OR CAST(mailbox_history_id AS INTEGER) < ?)',
+                (str(history_id), user_key, int(history_id)))
+            self._conn.commit()
+
+    def get_mailbox_history_id(self, user_key: str, now: Optional[float] = None) -> Optional[str]:
+        """
+        The user's current mailbox historyId as far as pushes tell, without a Gmail call.
+
+        Returns None unless the user has a live watch on the configured topic,
+        since only then is every change pushed.
+        """
+        topic_name = os.getenv('GMAIL_NOTIFICATION_TOPIC')
+        lease = self.get_lease(user_key) if topic_name else None
+        now = time.time() if now is None else now
+        if lease is None or lease['topic_name'] != topic_name or lease['expiration'] <= now:
+            return None
+        return lease['mailbox_history_id']
+
+_watch_manager = None
+_watch_manager_lock = threading.Lock()
+
+def get_watch_manager() -> WatchLeaseManager:
+    """Get the process-wide watch lease manager, opening it on first use."""
+    global _watch_manager
+    with _watch_manager_lock:
+        if _watch_manager is None:
+            _watch_manager = WatchLeaseManager()
+        return _watch_manager
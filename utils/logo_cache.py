@@ -0,0 +1,138 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# SQLite file shared by every worker thread and process
+LOGO_CACHE_PATH = os.getenv('LOGO_CACHE_PATH', 'logo_cache.db')
+# Seconds to remember a domain that has a logo
+LOGO_CACHE_POSITIVE_TTL = int(os.getenv('LOGO_CACHE_POSITIVE_TTL', str(7 * 24 * 3600)))
+# Seconds to remember a domain without a logo (or whose lookup failed)
+LOGO_CACHE_NEGATIVE_TTL = int(os.getenv('LOGO_CACHE_NEGATIVE_TTL', str(24 * 3600)))
+# Maximum number of domains kept before least recently used ones are evicted
+LOGO_CACHE_MAX_ENTRIES = int(os.getenv('LOGO_CACHE_MAX_ENTRIES', '10000'))
+
+class LogoCache:
+    """Persistent, domain-keyed cache of company logo URLs with negative caching."""
+
+    def __init__(self, path: str = LOGO_CACHE_PATH,
+                 positive_ttl: int = LOGO_CACHE_POSITIVE_TTL,
+                 negative_ttl: int = LOGO_CACHE_NEGATIVE_TTL,
+                 max_entries: int = LOGO_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # Domains currently being fetched, so concurrent misses wait for one lookup
+        self._inflight: Dict[str, threading.Event] = {}
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        if path != ':memory:':
+            # WAL lets several processes read while one writes
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS logos ('
+            ' domain TEXT PRIMARY KEY,'
+            ' url TEXT,'
+            ' fetched_at REAL NOT NULL,'
+            ' last_used REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_logos_last_used ON logos (last_used)')
+        self._conn.commit()
+
+    def get(self, domain: str) -> Tuple[bool, Optional[str]]:
+        """
+        Look up a domain in the cache.
+
+        Returns:
+            Tuple of (hit, url); url is None for a cached negative entry
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT url, fetched_at FROM logos WHERE domain = ?', (domain,)).fetchone()
+            if row is None:
+                return False, None
+            url, fetched_at = row
+            ttl = self.positive_ttl if url else self.negative_ttl
+            if now - fetched_at > ttl:
+                return False, None
+            self._conn.execute('UPDATE logos SET last_used = ? WHERE domain = ?', (now, domain))
+            self._conn.commit()
+        return True, url
+
+    def set(self, domain: str, url: Optional[str]):
+        """Store a logo URL for a domain, or None to remember that it has none."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO logos (domain, url, fetched_at, last_used) VALUES (?, ?, ?, ?)',
+                (domain, url, now, now))
+            self._evict()
+            self._conn.commit()
+
+    def get_or_fetch(self, domain: str, fetch: Callable[[str], Optional[str]]) -> Optional[str]:
+        """Return the cached logo for a domain, calling fetch(domain) once on a miss."""
+        hit, url = self.get(domain)
+        if hit:
+            return url
+
+        with self._lock:
+            event = self._inflight.get(domain)
+            is_owner = event is None
+            if is_owner:
+                event = self._inflight[domain] = threading.Event()
+
+        if not is_owner:
+            event.wait()
+            return self.get(domain)[1]
+
+        try:
+            url = None
+            try:
+                url = fetch(domain)
+            except Exception as e:
+                logger.error(f"Error fetching logo for {domain}: {e}")
+            self.set(domain, url)
+            return url
+        finally:
+            with self._lock:
+                del self._inflight[domain]
+            event.set()
+
+    def clear(self):
+        """Remove every cached entry."""
+        with self._lock:
+            self._conn.execute('DELETE FROM logos')
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM logos').fetchone()[0]
+
+    def _evict(self):
+        """Drop least recently used entries beyond max_entries. Caller holds the lock."""
+        count = self._conn.execute('SELECT COUNT(*) FROM logos').fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                'DELETE FROM logos WHERE domain IN ('
+                ' SELECT domain FROM logos ORDER BY last_used LIMIT ?)', (excess,))
+
+_logo_cache = None
+_logo_cache_lock = threading.Lock()
+
+def get_logo_cache() -> LogoCache:
+    """Get the process-wide logo cache, opening it on first use."""
+    global _logo_cache
+    with _logo_cache_lock:
+        if _logo_cache is None:
+            _logo_cache = LogoCache()
+        return _logo_cache
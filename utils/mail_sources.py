@@ -0,0 +1,129 @@
+import os
+import re
+import json
+import mmap
+import logging
+from email.header import decode_header, make_header
+from email.parser import BytesHeaderParser
+from email.utils import parseaddr
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Body lines starting with "From " are written as ">From " in mbox files
+_ESCAPED_FROM_LINE = re.compile(rb'^>(>*From )', re.MULTILINE)
+
+def detect_format(path: str) -> str:
+    """Guess the source format from the file extension ('jsonl' or 'mbox')."""
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson', '.json')) else 'mbox'
+
+def decode_header_value(value) -> str:
+    """Decode an RFC 2047 encoded header into text."""
+    if value is None:
+        return ''
+    try:
+        return str(make_header(decode_header(str(value))))
+    except Exception:
+        return str(value)
+
+def normalize_message_id(value) -> str:
+    """Decode a Message-ID header into the bare id, without whitespace or angle brackets."""
+    return decode_header_value(value).strip().strip('<>').strip()
+
+def iter_regions(path: str, source_format: str, region_size: int, start: int = 0) -> Iterator[Tuple[int, int]]:
+    """
+    Split a JSONL or mbox file into (start, end) byte ranges of about region_size bytes.
+
+    Every range ends on a record boundary (a line for JSONL, a "From "
+    separator line for mbox), so the ranges can be read independently by
+    iter_emails(). Only the boundaries are searched for, nothing is parsed.
+    """
+    size = os.path.getsize(path)
+    if start >= size:
+        return
+    separator = b'\nFrom ' if source_format == 'mbox' else b'\n'
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        while start < size:
+            boundary = mapped.find(separator, start + max(region_size, 1) - 1)
+            end = size if boundary == -1 else boundary + 1
+            yield start, end
+            start = end
+
+def iter_jsonl(path: str, start: int = 0, end: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Stream emails from a JSONL file, one get_email_content()-shaped object per line.
+
+    Only the lines starting in the byte range [start, end) are read. Blank
+    lines are ignored and malformed lines are logged and skipped.
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        offset = start
+        for line in f:
+            if end is not None and offset >= end:
+                return
+            line_offset, offset = offset, offset + len(line)
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                email = json.loads(line)
+            except ValueError as e:
+                logger.warning(f"Skipping malformed line at byte {line_offset} in {path}: {e}")
+                continue
+            if isinstance(email, dict):
+                yield email
+
+def iter_mbox_messages(path: str, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, bytes]]:
+    """
+    Stream the raw messages of an mbox file as (offset, bytes) pairs.
+
+    The file is memory-mapped and split on "From " separator lines, so only
+    the message being yielded is copied into memory, whatever the file size.
+    ">From " escaping of body lines is undone (mboxrd). With a byte range
+    from iter_regions(), only the messages inside it are read.
+    """
+    if os.path.getsize(path) == 0:
+        return
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        size = len(mapped) if end is None else end
+        if mapped[start:start + 5] != b'From ':
+            start = mapped.find(b'\nFrom ', start, size) + 1
+            if start == 0:
+                return
+        while start < size:
+            # The message starts after the "From " separator line
+            body_start = mapped.find(b'\n', start, size)
+            if body_start == -1:
+                return
+            body_start += 1
+            next_start = mapped.find(b'\nFrom ', body_start - 1, size)
+            message_end = size if next_start == -1 else next_start
+            yield start, _ESCAPED_FROM_LINE.sub(rb'\1', mapped[body_start:message_end])
+            start = size if next_start == -1 else next_start + 1
+
+def iter_mbox(path: str, start: int = 0, end: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Stream the header fields the job filter reads from every message in an mbox file, or a byte range of one."""
+    parser = BytesHeaderParser()
+    for _, raw in iter_mbox_messages(path, start, end):
+        message = parser.parsebytes(raw)
+        from_header = decode_header_value(message['From'])
+        yield {
+            'id': normalize_message_id(message['Message-ID']) or None,
+            'subject': decode_header_value(message['Subject']) or 'No Subject',
+            'from': from_header,
+            'sender_email': parseaddr(from_header)[1],
+            'to': decode_header_value(message['To']),
+            'date': decode_header_value(message['Date'])
+        }
+
+def iter_emails(path: str, source_format: str = None, start: int = 0,
+                end: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Stream emails from a JSONL or mbox file, or from a byte range of one."""
+    source_format = source_format or detect_format(path)
+    if source_format == 'jsonl':
+        return iter_jsonl(path, start, end)
+    if source_format == 'mbox':
+        return iter_mbox(path, start, end)
+    raise ValueError(f"Unsupported source format: {source_format}")
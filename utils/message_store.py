@@ -0,0 +1,225 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# SQLite file holding parsed messages and threads for every user
+MESSAGE_STORE_PATH = os.getenv('MESSAGE_STORE_PATH', 'message_store.db')
+
+# SQLite limits the number of bound parameters per statement
+_MAX_QUERY_IDS = 500
+
+def _chunks(ids: List[str]) -> Iterable[List[str]]:
+    for start in range(0, len(ids), _MAX_QUERY_IDS):
+        yield ids[start:start + _MAX_QUERY_IDS]
+
+class MessageStore:
+    """
+    Local store of parsed Gmail messages and threads.
+
+    Rows hold the get_email_content() / get_thread_content() output as JSON
+    together with the Gmail historyId it was parsed at, so callers can tell
+    whether a cached entry is still current.
+    """
+
+    def __init__(self, path: str = MESSAGE_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS messages (
+                user_key TEXT NOT NULL,
+                id TEXT NOT NULL,
+                thread_id TEXT,
+                internal_date INTEGER,
+                history_id TEXT,
+                content TEXT NOT NULL,
+                PRIMARY KEY (user_key, id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_internal_date
+                ON messages (user_key, internal_date);
+            CREATE INDEX IF NOT EXISTS idx_messages_thread_id
+                ON messages (user_key, thread_id);
+
+            CREATE TABLE IF NOT EXISTS threads (
+                user_key TEXT NOT NULL,
+                thread_id TEXT NOT NULL,
+                history_id TEXT,
+                latest_timestamp INTEGER,
+                content TEXT NOT NULL,
+                PRIMARY KEY (user_key, thread_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_threads_latest_timestamp
+                ON threads (user_key, latest_timestamp);
+        ''')
+        self._conn.commit()
+
+    def put_messages(self, user_key: str, messages: List[Dict[str, Any]]):
+        """Insert or replace parsed messages (get_email_content() output)."""
+        rows = [
+            (user_key, message['id'], message.get('threadId'),
+             int(message.get('internalDate') or 0), message.get('historyId'),
+             json.dumps(message))
+            for message in messages
+        ]
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO messages '
+                '(user_key, id, thread_id, internal_date, history_id, content) '
+                'VALUES (?, ?, ?, ?, ?, ?)', rows)
+            self._conn.commit()
+
+    def get_messages(self, user_key: str, message_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get stored messages by id. Missing ids are left out of the result."""
+        found = {}
+        with self._lock:
+            for chunk in _chunks(list(message_ids)):
+                placeholders = ','.join('?' * len(chunk))
+                for message_id, content in self._conn.execute(
+                        f'SELECT id, content FROM messages WHERE user_key = ? AND id IN ({placeholders})',
+                        [user_key, *chunk]):
+                    found[message_id] = json.loads(content)
+        return found
+
+    def put_threads(self, user_key: str, threads: List[Dict[str, Any]]):
+        """
+        Insert or replace parsed threads (get_thread_content() output).
+
+        The thread's messages are stored alongside it so they can also be
+        served individually.
+        """
+        rows = [
+            (user_key, thread['threadId'], thread.get('historyId'),
+             int(thread.get('latest_timestamp') or 0), json.dumps(thread))
+            for thread in threads
+        ]
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO threads '
+                '(user_key, thread_id, history_id, latest_timestamp, content) '
+                'VALUES (?, ?, ?, ?, ?)', rows)
+            self._conn.commit()
+        self.put_messages(user_key, [message for thread in threads for message in thread['messages']])
+
+    def get_threads(self, user_key: str, thread_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get stored threads by id. Missing ids are left out of the result."""
+        found = {}
+        with self._lock:
+            for chunk in _chunks(list(thread_ids)):
+                placeholders = ','.join('?' * len(chunk))
+                for thread_id, content in self._conn.execute(
+                        f'SELECT thread_id, content FROM threads '
+                        f'WHERE user_key = ? AND thread_id IN ({placeholders})',
+                        [user_key, *chunk]):
+                    found[thread_id] = json.loads(content)
+        return found
+
+    def get_thread_history_ids(self, user_key: str, thread_ids: List[str]) -> Dict[str, Optional[str]]:
+        """Get the historyId each stored thread was parsed at, without loading its content."""
+        found = {}
+        with self._lock:
+            for chunk in _chunks(list(thread_ids)):
+                placeholders = ','.join('?' * len(chunk))
+                found.update(self._conn.execute(
+                    f'SELECT thread_id, history_id FROM threads '
+                    f'WHERE user_key = ? AND thread_id IN ({placeholders})',
+                    [user_key, *chunk]))
+        return found
+
+    def recent_threads(self, user_key: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get the most recently active stored threads, newest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT content FROM threads WHERE user_key = ? '
+                'ORDER BY latest_timestamp DESC LIMIT ?', (user_key, limit)).fetchall()
+        return [json.loads(content) for (content,) in rows]
+
+    def update_labels(self, user_key: str, message_id: str,
+                      added: Iterable[str] = (), removed: Iterable[str] = ()) -> Optional[str]:
+        """
+        Apply label changes to a stored message and to its copy inside the stored thread.
+
+        Returns:
+            The message's thread id, or None if the message is not stored
+        """
+        added, removed = list(added), set(removed)
+
+        def relabel(message):
+            labels = [label for label in message.get('labelIds', []) if label not in removed]
+            message['labelIds'] = labels + [label for label in added if label not in labels]
+
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT thread_id, content FROM messages WHERE user_key = ? AND id = ?',
+                (user_key, message_id)).fetchone()
+            if row is None:
+                return None
+            thread_id, content = row
+            message = json.loads(content)
+            relabel(message)
+            self._conn.execute(
+                'UPDATE messages SET content = ? WHERE user_key = ? AND id = ?',
+                (json.dumps(message), user_key, message_id))
+
+            row = self._conn.execute(
+                'SELECT content FROM threads WHERE user_key = ? AND thread_id = ?',
+                (user_key, thread_id)).fetchone()
+            if row is not None:
+                thread = json.loads(row[0])
+                for thread_message in thread.get('messages', []):
+                    if thread_message.get('id') == message_id:
+                        relabel(thread_message)
+                self._conn.execute(
+                    'UPDATE threads SET content = ? WHERE user_key = ? AND thread_id = ?',
+                    (json.dumps(thread), user_key, thread_id))
+            self._conn.commit()
+        return thread_id
+
+    def delete_messages(self, user_key: str, message_ids: List[str]):
+        """Remove messages from the store."""
+        with self._lock:
+            for chunk in _chunks(list(message_ids)):
+                placeholders = ','.join('?' * len(chunk))
+                self._conn.execute(
+                    f'DELETE FROM messages WHERE user_key = ? AND id IN ({placeholders})',
+                    [user_key, *chunk])
+            self._conn.commit()
+
+    def delete_threads(self, user_key: str, thread_ids: List[str]):
+        """Remove threads and their messages from the store."""
+        with self._lock:
+            for chunk in _chunks(list(thread_ids)):
+                placeholders = ','.join('?' * len(chunk))
+                self._conn.execute(
+                    f'DELETE FROM threads WHERE user_key = ? AND thread_id IN ({placeholders})',
+                    [user_key, *chunk])
+                self._conn.execute(
+                    f'DELETE FROM messages WHERE user_key = ? AND thread_id IN ({placeholders})',
+                    [user_key, *chunk])
+            self._conn.commit()
+
+    def clear(self, user_key: str):
+        """Remove everything stored for a user."""
+        with self._lock:
+            self._conn.execute('DELETE FROM threads WHERE user_key = ?', (user_key,))
+            self._conn.execute('DELETE FROM messages WHERE user_key = ?', (user_key,))
+            self._conn.commit()
+
+_message_store = None
+_message_store_lock = threading.Lock()
+
+def get_message_store() -> MessageStore:
+    """Get the process-wide message store, opening it on first use."""
+    global _message_store
+    with _message_store_lock:
+        if _message_store is None:
+            _message_store = MessageStore()
+        return _message_store
@@ -0,0 +1,104 @@
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import build_http
+
+from utils.api_scheduler import get_quota_key, scheduled_request_builder
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Credentials whose built services are kept before the least recently used are dropped
+MAX_CACHED_SERVICES = 256
+
+class ServiceFactory:
+    """
+    Builds Gmail and People API services from bundled discovery documents.
+
+    Discovery documents are parsed once per process, and the services built
+    for a credentials object are cached and shared by every thread, so a
+    user's requests only pay for service construction the first time. The
+    httplib2 transport underneath is not thread-safe, so calls never go over
+    the transport a service was built with: each one is sent through an
+    AuthorizedHttp for the credentials over the calling thread's own
+    transport. The credentials object is refreshed in place, so a token
+    refresh does not need a new service.
+    """
+
+    def __init__(self, max_services: int = MAX_CACHED_SERVICES):
+        self.max_services = max_services
+        self._documents: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._documents_lock = threading.Lock()
+        self._services: OrderedDict = OrderedDict()
+        self._services_lock = threading.Lock()
+        self._local = threading.local()
+
+    def get_document(self, api: str, version: str) -> Dict[str, Any]:
+        """Get the parsed discovery document bundled with googleapiclient."""
+        key = (api, version)
+        document = self._documents.get(key)
+        if document is None:
+            with self._documents_lock:
+                document = self._documents.get(key)
+                if document is None:
+                    raw = discovery_cache.get_static_doc(api, version)
+                    if raw is None:
+                        raise ValueError(f"No bundled discovery document for {api} {version}")
+                    document = self._documents[key] = json.loads(raw)
+        return document
+
+    def get_thread_http(self):
+        """Get the calling thread's httplib2 transport, creating it on first use."""
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = self._local.http = build_http()
+        return http
+
+    def authorized_http(self, creds) -> AuthorizedHttp:
+        """Wrap the calling thread's transport with creds, for a single call."""
+        return AuthorizedHttp(creds, http=self.get_thread_http())
+
+    def build(self, api: str, version: str, creds):
+        """
+        Build a service from the cached discovery document without any caching of the result.
+
+        The service's requests go through the API scheduler, paced by the
+        quota of the user the credentials belong to, and are sent over the
+        calling thread's transport.
+        """
+        return build_from_document(
+            self.get_document(api, version), credentials=creds,
+            requestBuilder=scheduled_request_builder(get_quota_key(creds),
+                                                     lambda: self.authorized_http(creds)))
+
+    def get_services(self, creds):
+        """Get Gmail and People services for the given credentials, reusing the pair built for them."""
+        key = (creds.client_id, creds.refresh_token or creds.token)
+        with self._services_lock:
+            entry = self._services.get(key)
+            # A new credentials object (a new login) gets services of its own
+            if entry is not None and entry[0] is creds:
+                self._services.move_to_end(key)
+                return entry[1]
+
+        services = (self.build('gmail', 'v1', creds), self.build('people', 'v1', creds))
+        with self._services_lock:
+            self._services[key] = (creds, services)
+            self._services.move_to_end(key)
+            while len(self._services) > self.max_services:
+                self._services.popitem(last=False)
+        return services
+
+    def clear(self):
+        """Drop every cached service."""
+        with self._services_lock:
+            self._services.clear()
+
+# Process-wide service factory
+service_factory = ServiceFactory()
@@ -0,0 +1,130 @@
+import os
+import time
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+# Seconds a finished fetch keeps answering identical requests, so requests
+# arriving just after it completes (a second tab, a poll racing a refresh)
+# collapse into it as well
+SINGLE_FLIGHT_GRACE = float(os.getenv('SINGLE_FLIGHT_GRACE', '2'))
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.finished_at = None
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time, sharing its result with every concurrent caller.
+
+    A caller that finds the key in flight waits for that call instead of
+    starting its own, and a successful result keeps being returned for
+    `grace` seconds after it finishes. Errors are raised to the callers that
+    waited on the call but are never reused, so fn must raise on failure
+    rather than return a fallback value. Results are shared objects, so
+    callers must not modify them.
+    """
+
+    def __init__(self, grace: float = SINGLE_FLIGHT_GRACE, clock: Callable[[], float] = time.monotonic):
+        self.grace = grace
+        self.clock = clock
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.stats = {'calls': 0, 'coalesced': 0, 'grace_hits': 0}
+
+    def _prune(self, now: float):
+        expired = [key for key, call in self._calls.items()
+                   if call.finished_at is not None and now - call.finished_at >= self.grace]
+        for key in expired:
+            del self._calls[key]
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Call fn(), or share the result of the identical call already made for key."""
+        with self._lock:
+            self._prune(self.clock())
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+                self.stats['calls'] += 1
+            else:
+                leader = False
+                self.stats['grace_hits' if call.done.is_set() else 'coalesced'] += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            with self._lock:
+                if call.error is None:
+                    call.finished_at = self.clock()
+                else:
+                    del self._calls[key]
+            call.done.set()
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats, in_flight=sum(
+                1 for call in self._calls.values() if not call.done.is_set()))
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines on one event loop."""
+
+    def __init__(self, grace: float = SINGLE_FLIGHT_GRACE, clock: Callable[[], float] = time.monotonic):
+        self.grace = grace
+        self.clock = clock
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        self._finished_at: Dict[Hashable, float] = {}
+        self.stats = {'calls': 0, 'coalesced': 0, 'grace_hits': 0}
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+            self._finished_at.pop(key, None)
+
+    def _on_done(self, key: Hashable, task: asyncio.Task):
+        if task.cancelled() or task.exception() is not None:
+            self._forget(key, task)
+        else:
+            self._finished_at[key] = self.clock()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Await fn(), or share the result of the identical call already made for key."""
+        now = self.clock()
+        for expired_key in [expired_key for expired_key, finished_at in self._finished_at.items()
+                            if now - finished_at >= self.grace]:
+            self._forget(expired_key, self._tasks[expired_key])
+        task = self._tasks.get(key)
+        if task is not None and task.get_loop() is not asyncio.get_running_loop():
+            self._forget(key, task)
+            task = None
+
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda done: self._on_done(key, done))
+            self.stats['calls'] += 1
+        else:
+            self.stats['grace_hits' if task.done() else 'coalesced'] += 1
+        # A caller that goes away must not cancel the call for the others
+        return await asyncio.shield(task)
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+def get_single_flight() -> SingleFlight:
+    """Get the process-wide single-flight group, creating it on first use."""
+    global _single_flight
+    with _single_flight_lock:
+        if _single_flight is None:
+            _single_flight = SingleFlight()
+        return _single_flight
@@ -0,0 +1,99 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+# Approximate bytes of parsed threads kept in memory, across all users
+THREAD_CACHE_MAX_BYTES = int(os.getenv('THREAD_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+def copy_thread(thread_content: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy a parsed thread deeply enough that callers can set thread and message fields."""
+    return dict(thread_content, messages=[dict(message) for message in thread_content['messages']])
+
+class ThreadCache:
+    """
+    In-memory LRU of parsed threads keyed by (user, threadId, historyId).
+
+    Gmail changes a thread's historyId whenever the thread changes, so an
+    entry never needs invalidating: a changed thread is looked up under its
+    new historyId and the old entry ages out. Memory is bounded by the JSON
+    size of the cached threads rather than their count, since a thread can
+    hold one message or hundreds.
+    """
+
+    def __init__(self, max_bytes: int = THREAD_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_key: str, thread_id: str, history_id: str) -> Optional[Dict[str, Any]]:
+        """Get a copy of the thread parsed at history_id, or None."""
+        key = (user_key, thread_id, history_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return copy_thread(entry[0])
+
+    def put(self, user_key: str, thread_content: Dict[str, Any]):
+        """Cache a parsed thread under its own threadId and historyId."""
+        if not thread_content.get('historyId'):
+            return
+        key = (user_key, thread_content['threadId'], thread_content['historyId'])
+        size = len(json.dumps(thread_content))
+        if size > self.max_bytes:
+            return
+        entry = (copy_thread(thread_content), size)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous:
+                self.size_bytes -= previous[1]
+            self._entries[key] = entry
+            self.size_bytes += size
+            while self.size_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size_bytes -= evicted_size
+                self.evictions += 1
+
+    def put_many(self, user_key: str, thread_contents: Iterable[Dict[str, Any]]):
+        for thread_content in thread_contents:
+            self.put(user_key, thread_content)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'size_bytes': self.size_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+_thread_cache = None
+_thread_cache_lock = threading.Lock()
+
+def get_thread_cache() -> ThreadCache:
+    """Get the process-wide thread cache, creating it on first use."""
+    global _thread_cache
+    with _thread_cache_lock:
+        if _thread_cache is None:
+            _thread_cache = ThreadCache()
+        return _thread_cache